@@ -0,0 +1,341 @@
+""" Cache backends shared by the caches of the app: in-process, on-disk SQLite and memcached.
+
+The backend is chosen with CACHE_URL:
+    memory://                  LRU of this worker process (the default)
+    sqlite:////path/cache.db   SQLite file shared by the workers of the host
+    memcached://host:port      memcached server (or the stand-in of scripts.cache_server)
+
+The values are JSON compatible (the SQLite and memcached backends store them as JSON).
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+import hashlib
+import json
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Backend of the caches
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+
+# Maximum entries of the memory and SQLite backends (the least recently used ones are evicted)
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "4096"))
+
+# Seconds to wait for the memcached server
+CACHE_TIMEOUT = float(os.getenv("CACHE_TIMEOUT", "1"))
+
+
+class CacheBackend:
+    """
+    Interface of the cache backends. Missing and expired keys read as None, and a ttl of None
+    never expires.
+    """
+
+    def get(self, key: str) -> Any:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """ Get the values of the keys that are cached. """
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """ Set the key only if it is not cached. Returns whether it was set. """
+        raise NotImplementedError
+
+    def incr(self, key: str) -> Optional[int]:
+        """ Increment an integer value. Returns the new value, or None if it is not cached. """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """ LRU of this process. The values are stored as they are, so they must not be modified. """
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        # Key -> (value, expiration), in LRU order
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _set(self, key: str, value: Any, ttl: Optional[float]):
+        self._entries[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        with self._lock:
+            entries = {key: self._get(key) for key in keys}
+        return {key: entry[0] for key, entry in entries.items() if entry is not None}
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def incr(self, key: str) -> Optional[int]:
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                return None
+            self._entries[key] = (entry[0] + 1, entry[1])
+            return entry[0] + 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "size": len(self._entries), "max_size": self.max_size,
+                    "evictions": self._evictions}
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite file shared by the worker processes of a host. The last use of an entry is updated
+    on reads, and the least recently used ones are evicted when the table grows over its size.
+    """
+
+    def __init__(self, path: str, max_size: int = CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        # Every thread has its own connection
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_used ON cache (used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=CACHE_TIMEOUT * 10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _evict(self, connection: sqlite3.Connection):
+        # Checked every few writes, as counting the rows is not free
+        self._writes += 1
+        if self._writes % 64:
+            return
+        connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        excess = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_size
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used LIMIT ?)", (excess,)
+            )
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        connection = self._connect()
+        placeholders = ", ".join("?" * len(keys))
+        rows = connection.execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND (expires IS NULL OR expires > ?)",
+            (*keys, now)
+        ).fetchall()
+        if rows:
+            # At most one write a second per entry
+            connection.execute(f"UPDATE cache SET used = ? WHERE key IN ({placeholders}) AND used < ?",
+                               (now, *keys, now - 1))
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl if ttl is not None else None, now)
+        )
+        self._evict(connection)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now))
+            added = connection.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl if ttl is not None else None, now)
+            ).rowcount == 1
+        return added
+
+    def incr(self, key: str) -> Optional[int]:
+        row = self._connect().execute(
+            "UPDATE cache SET value = CAST(value AS INTEGER) + 1, used = ? "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?) RETURNING value",
+            (time.time(), key, time.time())
+        ).fetchone()
+        return int(row[0]) if row is not None else None
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        size = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "size": size, "max_size": self.max_size}
+
+
+class MemcachedBackend(CacheBackend):
+    """
+    Client of the memcached text protocol (get, set, add, incr, delete and flush_all), which Redis
+    compatible proxies and the stand-in of scripts.cache_server also speak. Every thread has its own
+    connection, which is opened again after an error.
+    """
+
+    def __init__(self, host: str, port: int = 11211):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    @staticmethod
+    def _key(key: str) -> bytes:
+        # Keys are limited to 250 bytes without spaces or control characters
+        encoded = key.encode()
+        if len(encoded) > 200 or any(byte <= 32 or byte == 127 for byte in encoded):
+            encoded = b"sha1:" + hashlib.sha1(encoded).hexdigest().encode()
+        return encoded
+
+    @staticmethod
+    def _exptime(ttl: Optional[float]) -> int:
+        return 0 if ttl is None else max(1, math.ceil(ttl))
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            sock = socket.create_connection((self.host, self.port), timeout=CACHE_TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = (sock, sock.makefile("rb"))
+            self._local.connection = connection
+        return connection
+
+    def _command(self, command: bytes, read):
+        sock, reader = self._connection()
+        try:
+            sock.sendall(command)
+            return read(reader)
+        except (OSError, ValueError):
+            sock.close()
+            self._local.connection = None
+            raise
+
+    @staticmethod
+    def _read_line(reader) -> bytes:
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection to the cache closed.")
+        if line.startswith((b"ERROR", b"CLIENT_ERROR", b"SERVER_ERROR")):
+            raise ValueError(f"Cache error: {line.strip().decode()}")
+        return line[:-2]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = {self._key(key): key for key in keys}
+        if not keys:
+            return {}
+
+        def read(reader):
+            values = {}
+            while True:
+                line = self._read_line(reader)
+                if line == b"END":
+                    return values
+                _, key, _, length = line.split()[:4]
+                data = reader.read(int(length) + 2)[:-2]
+                values[keys[key]] = json.loads(data)
+
+        return self._command(b"get " + b" ".join(keys) + b"\r\n", read)
+
+    def _store(self, command: bytes, key: str, value: Any, ttl: Optional[float]) -> bool:
+        data = json.dumps(value).encode()
+        header = b"%s %s 0 %d %d\r\n" % (command, self._key(key), self._exptime(ttl), len(data))
+        return self._command(header + data + b"\r\n", self._read_line) == b"STORED"
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._store(b"set", key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return self._store(b"add", key, value, ttl)
+
+    def incr(self, key: str) -> Optional[int]:
+        line = self._command(b"incr %s 1\r\n" % self._key(key), self._read_line)
+        return None if line == b"NOT_FOUND" else int(line)
+
+    def delete(self, key: str):
+        self._command(b"delete %s\r\n" % self._key(key), self._read_line)
+
+    def clear(self):
+        self._command(b"flush_all\r\n", self._read_line)
+
+    def stats(self) -> dict:
+        return {"backend": "memcached", "address": f"{self.host}:{self.port}"}
+
+
+def create_cache_backend(url: str, max_size: int = CACHE_SIZE) -> CacheBackend:
+    """
+    Create the backend of a cache URL (see the module docstring), with up to max_size entries
+    (for the memory and SQLite backends).
+
+    Raises:
+        ValueError: If the scheme of the URL is not a known backend.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryBackend(max_size)
+    if parts.scheme == "sqlite" and parts.path.removeprefix("/"):
+        return SQLiteBackend(parts.path.removeprefix("/"), max_size)
+    if parts.scheme == "memcached":
+        return MemcachedBackend(parts.hostname or "localhost", parts.port or 11211)
+    raise ValueError(f"Unknown cache backend: {url}.")
+
+
+# Backend of this process
+cache = create_cache_backend(CACHE_URL)
@@ -0,0 +1,48 @@
+""" ETags and conditional GETs (If-None-Match -> 304 Not Modified) with Cache-Control headers """
+from typing import Optional
+from fastapi import Request, Response, status
+import hashlib
+import json
+import os
+
+# Seconds the public resources can be cached (by the clients and the shared caches in front)
+PUBLIC_MAX_AGE = int(os.getenv("PUBLIC_MAX_AGE", "30"))
+
+PUBLIC = f"public, max-age={PUBLIC_MAX_AGE}"
+PRIVATE = "private, no-cache"
+
+
+def make_etag(*versions) -> str:
+    """
+    Strong ETag of a representation, derived from the versions of everything in it.
+    """
+    digest = hashlib.sha1(json.dumps(versions, separators=(",", ":"), default=str).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check the If-None-Match header of a request (weak comparison, as the header requires).
+    """
+    header = request.headers.get("If-None-Match")
+    if header is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def set_etag(response: Response, etag: str, cache_control: str = PUBLIC):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(request: Request, etag: Optional[str], cache_control: str = PUBLIC) -> Optional[Response]:
+    """
+    Get the 304 response of a request whose If-None-Match matches the ETag, if it does. The ETag
+    is None when it could not be computed (e.g. a missing entity): the request goes on as usual.
+    """
+    if etag is None or not etag_matches(request, etag):
+        return None
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag(response, etag, cache_control)
+    return response
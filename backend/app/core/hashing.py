@@ -0,0 +1,151 @@
+""" Password hashing (bcrypt) in a bounded process pool, out of the request threads and event loop """
+from concurrent.futures import Future, ProcessPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+# Cost of the new hashes (log2 of the bcrypt rounds). Load tests can use a cheap one (minimum 4).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Processes hashing passwords (0 hashes them in the calling thread)
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "2"))
+
+# Maximum password operations queued or running per worker; beyond it requests are rejected (503)
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+
+# Contexts of the process running the operations, by cost (created on first use in every process)
+_contexts = {}
+
+def _get_context(rounds: int) -> CryptContext:
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return _contexts[rounds]
+
+def _hash(password: str, rounds: int) -> str:
+    return _get_context(rounds).hash(password)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    # The cost is read from the hash
+    return _get_context(BCRYPT_ROUNDS).verify(plain_password, hashed_password)
+
+
+# Pool shared by all the requests of the process, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+_lock = threading.Lock()
+_stats = {
+    "in_flight": 0,     # Operations queued or running
+    "rejected": 0,      # Operations rejected because the queue was full
+    "hash": {"count": 0, "time_total": 0.0, "time_max": 0.0},
+    "verify": {"count": 0, "time_total": 0.0, "time_max": 0.0}
+}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned processes: forking a multi-threaded server is not safe
+            _executor = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _record(operation: str, start: float):
+    elapsed = time.perf_counter() - start
+    with _lock:
+        _stats["in_flight"] -= 1
+        _stats[operation]["count"] += 1
+        _stats[operation]["time_total"] += elapsed
+        _stats[operation]["time_max"] = max(_stats[operation]["time_max"], elapsed)
+
+
+def _submit(operation: str, function, *args) -> Future:
+    """
+    Run a password operation in the pool (or inline without pool), rejecting it if the queue is full.
+    """
+    with _lock:
+        if _stats["in_flight"] >= HASH_QUEUE_LIMIT:
+            _stats["rejected"] += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many password operations, try again later.",
+                                headers={"Retry-After": "1"})
+        _stats["in_flight"] += 1
+
+    start = time.perf_counter()
+    if HASH_POOL_WORKERS == 0:
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+    else:
+        try:
+            future = _get_executor().submit(function, *args)
+        except Exception:
+            _record(operation, start)
+            raise
+
+    future.add_done_callback(lambda _: _record(operation, start))
+    return future
+
+
+def hash_password(password: str) -> str:
+    return _submit("hash", _hash, password, BCRYPT_ROUNDS).result()
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return _submit("verify", _verify, plain_password, hashed_password).result()
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(_submit("hash", _hash, password, BCRYPT_ROUNDS))
+
+async def check_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(_submit("verify", _verify, plain_password, hashed_password))
+
+
+def hash_passwords_bulk(passwords: list) -> list:
+    """
+    Hash many passwords at once in the pool (for batch jobs, like seeding: the queue limit of the
+    requests does not apply).
+    """
+    if HASH_POOL_WORKERS == 0 or len(passwords) < 2:
+        return [_hash(password, BCRYPT_ROUNDS) for password in passwords]
+    chunksize = max(1, len(passwords) // (4 * HASH_POOL_WORKERS))
+    return list(_get_executor().map(_hash, passwords, [BCRYPT_ROUNDS] * len(passwords), chunksize=chunksize))
+
+
+def hashing_stats() -> dict:
+    """
+    Get the metrics of the password operations of this process: operations queued or running,
+    rejected, and the count and latency (mean and max, in milliseconds, queue included) of the
+    hash and verify operations.
+    """
+    with _lock:
+        data = {
+            "workers": HASH_POOL_WORKERS,
+            "queue_limit": HASH_QUEUE_LIMIT,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "in_flight": _stats["in_flight"],
+            "rejected": _stats["rejected"]
+        }
+        for operation in ("hash", "verify"):
+            count = _stats[operation]["count"]
+            data[operation] = {
+                "count": count,
+                "ms_mean": round(1000 * _stats[operation]["time_total"] / count, 3) if count else 0.0,
+                "ms_max": round(1000 * _stats[operation]["time_max"], 3)
+            }
+    return data
+
+
+def shutdown_hashing_pool():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,59 @@
+""" Keyset (cursor) pagination: opaque cursors and the criteria of the page after them """
+from typing import Optional, Sequence
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import tuple_
+import base64
+import json
+import os
+
+# Default and maximum number of items of a page
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+
+def encode_cursor(scope: str, values: Sequence) -> str:
+    """
+    Encode the sort key values of the last item of a page as an opaque cursor. The scope (the
+    listing and its order) is encoded too, so a cursor is only valid for the listing it came from.
+    """
+    data = json.dumps([scope, *values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(scope: str, cursor: str) -> list:
+    """
+    Decode a cursor of the given scope.
+
+    Returns:
+        list: The sort key values of the last item of the previous page.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed or belongs to another listing.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        data = None
+    if not isinstance(data, list) or not data or data[0] != scope:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return data[1:]
+
+
+def after_cursor(columns: Sequence, values: Sequence, ascending: bool = True):
+    """
+    Criterion of the rows after the given sort key values: a row value comparison, which the
+    database answers with a range scan of an index on the same columns.
+    """
+    if len(values) != len(columns):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    key = tuple_(*columns)
+    return key > tuple_(*values) if ascending else key < tuple_(*values)
+
+
+def set_next_cursor(request: Request, response: Response, next_cursor: Optional[str]):
+    """
+    Send the cursor of the next page (if there is one) in the X-Next-Cursor and Link headers.
+    """
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
@@ -0,0 +1,95 @@
+""" Connection pools with checkout metrics """
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+import threading
+import time
+
+
+class _MeteredPoolMixin:
+    """
+    Count the checkouts of a pool, their latency (waiting for a free connection or opening a new
+    one), the checkouts that opened an overflow connection and the checkout timeouts.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "checkouts": 0,
+            "checkout_time_total": 0.0,
+            "checkout_time_max": 0.0,
+            "overflow_events": 0,
+            "timeouts": 0
+        }
+
+    def _current_overflow(self) -> int:
+        # Pools without a size (NullPool) never overflow
+        return self.overflow() if isinstance(self, QueuePool) else 0
+
+    def _do_get(self):
+        overflow = self._current_overflow()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.stats["timeouts"] += 1
+            raise
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats["checkouts"] += 1
+            self.stats["checkout_time_total"] += elapsed
+            self.stats["checkout_time_max"] = max(self.stats["checkout_time_max"], elapsed)
+            # A connection was opened beyond pool_size
+            if self._current_overflow() > max(overflow, 0):
+                self.stats["overflow_events"] += 1
+        return connection
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# A new connection for every checkout, closed on checkin. The async connections are bound to the
+# event loop that opened them, so it is used where every request may run on its own event loop
+# (the tests, which start a TestClient per module).
+class MeteredAsyncNullPool(_MeteredPoolMixin, NullPool):
+    pass
+
+
+def pool_stats(engine: Engine) -> dict:
+    """
+    Get the state and the checkout metrics of the connection pool of an engine.
+
+    Returns:
+        dict: Pool size, checked out and idle connections and current overflow (of a queue pool),
+        and the counters of the metered pools (with the mean and max checkout latency in
+        milliseconds), if it is one.
+    """
+    pool = engine.pool
+    data = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        data.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0)
+        })
+
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        with pool._stats_lock:
+            checkouts = stats["checkouts"]
+            data.update({
+                "checkouts": checkouts,
+                "checkout_ms_mean": round(1000 * stats["checkout_time_total"] / checkouts, 3) if checkouts else 0.0,
+                "checkout_ms_max": round(1000 * stats["checkout_time_max"], 3),
+                "overflow_events": stats["overflow_events"],
+                "timeouts": stats["timeouts"]
+            })
+    return data
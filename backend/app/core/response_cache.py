@@ -0,0 +1,283 @@
+""" Cache of the responses of hot read endpoints, invalidated by tags when their data changes """
+from typing import Callable, Iterable, Optional, Sequence
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+from core.cache import CacheBackend, cache
+from core.etag import etag_matches
+from models.artist import Artist, ArtistStats
+from models.song import Song, SongSource
+from models.user import User
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+
+# Cache the responses of the decorated routes (in the backend of CACHE_URL)
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "true").lower() == "true"
+
+# Headers set by the endpoints which are replayed with a cached response
+_REPLAYED_HEADERS = ("etag", "cache-control")
+
+
+# The responses are cached with the versions of their tags, and invalidating a tag increments its
+# version, so the invalidations reach every worker sharing the backend. A missing version starts
+# from the current time, so it never takes a value a cached response was stored with. The versions
+# are read before computing a response, so an invalidation made while it is computed (by any
+# worker) is never stored as valid: the tags which depend on the result are remembered by key for
+# that, and a response with tags unknown before computing it is not stored.
+_backend: CacheBackend = cache
+# Incremented by every invalidation of this worker, so a response computed while one happened is not cached
+_generation = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _tag_key(tag: str) -> str:
+    return f"tag:{tag}"
+
+
+def _tag_versions(tags: Iterable[str]) -> dict:
+    keys = {_tag_key(tag): tag for tag in tags}
+    versions = _backend.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        _backend.add(key, time.time_ns())
+        versions[key] = _backend.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def _count(stat: str):
+    with _lock:
+        _stats[stat] += 1
+
+
+def _lookup(key: str) -> Optional[dict]:
+    entry = _backend.get(key)
+    if entry is not None and _tag_versions(entry["tags"]) != entry["tags"]:
+        _backend.delete(key)
+        entry = None
+    _count("misses" if entry is None else "hits")
+    return entry
+
+
+def _result_tags_key(key: str) -> str:
+    return f"result_tags:{key}"
+
+
+def _snapshot(key: str, key_tags: Iterable[str], result_tags: bool) -> dict:
+    # Versions of the tags known before computing a response: the ones of its key, and the result
+    # ones of its last computation
+    tags = set(key_tags)
+    if result_tags:
+        tags.update(_backend.get(_result_tags_key(key)) or ())
+    return _tag_versions(tags)
+
+
+def _store(key: str, data, headers: dict, key_tags: Iterable[str], result_tags: Iterable[str], ttl: float,
+           generation: int, snapshot: dict):
+    result_tags = set(result_tags)
+    if not result_tags <= snapshot.keys():
+        # Remembered for the next computation, whose versions are read before it
+        _backend.set(_result_tags_key(key), sorted(result_tags))
+        return
+
+    versions = {tag: snapshot[tag] for tag in {*key_tags, *result_tags}}
+    if generation != _generation or _tag_versions(versions) != versions:
+        return
+    _backend.set(key, {"data": data, "headers": headers, "tags": versions}, ttl)
+
+
+def _replay(entry: dict, kwargs: dict):
+    data, headers = entry["data"], entry["headers"]
+    request = next((value for value in kwargs.values() if isinstance(value, Request)), None)
+    if request is not None and "etag" in headers and etag_matches(request, headers["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response = next((value for value in kwargs.values() if isinstance(value, Response)), None)
+    if response is not None:
+        response.headers.update(headers)
+    return data
+
+
+def _encode(result, kwargs: dict) -> tuple:
+    response = next((value for value in kwargs.values() if isinstance(value, Response)), None)
+    headers = {}
+    if response is not None:
+        headers = {name: value for name, value in response.headers.items() if name in _REPLAYED_HEADERS}
+    return jsonable_encoder(result), headers
+
+
+def cached_response(ttl: float, key: Sequence[str] = (), key_tags: Optional[Callable[..., Iterable[str]]] = None,
+                    tags: Optional[Callable[..., Iterable[str]]] = None):
+    """
+    Cache the results of a route for some seconds, by the values of the given parameters.
+
+    The result is stored JSON encoded, and validated against the response model again when it is
+    served, along with the ETag and Cache-Control headers the route set (a matching If-None-Match
+    gets a 304). Responses returned by the route (like a 304) and errors are not cached.
+
+    Args:
+        ttl (float): Seconds a cached response is served.
+        key (Sequence[str]): Names of the parameters which identify the response.
+        key_tags (Callable): Called with the key parameters, returns the tags of the response which
+            invalidate it (see invalidate_tags).
+        tags (Callable): Called with the encoded result and the key parameters, returns the tags
+            which depend on the result. A response is only cached once they are known before
+            computing it (from its previous computation).
+
+    Returns:
+        Callable: The decorator of the route function (applied before the router one).
+    """
+    def decorator(endpoint):
+        name = f"{endpoint.__module__}.{endpoint.__qualname__}"
+
+        def prepare(kwargs: dict):
+            values = {param: kwargs[param] for param in key}
+            return f"response:{name}:{json.dumps(list(values.values()), default=str)}", values
+
+        def start(cache_key: str, values: dict) -> tuple:
+            known_tags = list(key_tags(**values)) if key_tags else []
+            return known_tags, _generation, _snapshot(cache_key, known_tags, tags is not None)
+
+        def finish(cache_key: str, values: dict, result, kwargs: dict, known_tags: list, generation: int,
+                   snapshot: dict):
+            if isinstance(result, Response):
+                return result
+            data, headers = _encode(result, kwargs)
+            _store(cache_key, data, headers, known_tags, tags(data, **values) if tags else (), ttl,
+                   generation, snapshot)
+            return data
+
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                if not RESPONSE_CACHE:
+                    return await endpoint(*args, **kwargs)
+                cache_key, values = prepare(kwargs)
+                entry = _lookup(cache_key)
+                if entry is not None:
+                    return _replay(entry, kwargs)
+                started = start(cache_key, values)
+                result = await endpoint(*args, **kwargs)
+                return finish(cache_key, values, result, kwargs, *started)
+        else:
+            # Synchronous routes keep a synchronous wrapper, so they still run in the threadpool
+            @functools.wraps(endpoint)
+            def wrapper(*args, **kwargs):
+                if not RESPONSE_CACHE:
+                    return endpoint(*args, **kwargs)
+                cache_key, values = prepare(kwargs)
+                entry = _lookup(cache_key)
+                if entry is not None:
+                    return _replay(entry, kwargs)
+                started = start(cache_key, values)
+                result = endpoint(*args, **kwargs)
+                return finish(cache_key, values, result, kwargs, *started)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_tags(*tags: str):
+    global _generation
+    with _lock:
+        _generation += 1
+        _stats["invalidations"] += 1
+    for tag in tags:
+        _backend.incr(_tag_key(tag))
+
+
+def clear_response_cache():
+    global _generation
+    with _lock:
+        _generation += 1
+    _backend.clear()
+
+
+def response_cache_stats() -> dict:
+    with _lock:
+        return {
+            "enabled": RESPONSE_CACHE,
+            "backend": _backend.stats(),
+            **_stats
+        }
+
+
+# The tags of the changes are collected while flushing and invalidated once they are committed.
+# With the memory backend every worker only invalidates its own cache (the changes made by other
+# workers are seen after the TTL); the SQLite and memcached backends share the invalidations.
+def _tag_change(target, *tags: str):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("response_cache_tags", set()).update(tags)
+
+
+# Creating, updating or deleting a song (or its sources)
+def _track_song_change(mapper, connection, target):
+    _tag_change(target, f"song:{target.song_id}")
+
+
+# Profile changes of a user (and their songs, which show the username), under the old and new username.
+# Logins and logouts (the token) do not change the responses.
+def _track_user_change(mapper, connection, target):
+    state = inspect(target)
+    changed = [attr for attr in state.attrs if attr.key not in ("token", "hashed_password")
+               and attr.history.has_changes()]
+    if changed:
+        usernames = {target.username, *state.attrs.username.history.deleted}
+        _tag_change(target, *(f"user:{username}" for username in usernames))
+
+
+def _track_user_delete(mapper, connection, target):
+    _tag_change(target, f"user:{target.username}", f"followers:{target.username}")
+
+
+# Tag the followers of an artist in a session, looking its username up with the given connection (or session)
+def _tag_followers(session: Session, executor, artist_id: int):
+    username = executor.scalar(
+        select(User.username).join(Artist, Artist.user_id == User.id).where(Artist.artist_id == artist_id)
+    )
+    if username is not None:
+        session.info.setdefault("response_cache_tags", set()).add(f"followers:{username}")
+
+
+# Followers of an artist: the counter of its stats changes with every follow and unfollow
+def _track_followers_change(mapper, connection, target):
+    if not inspect(target).attrs.followers.history.has_changes() or not RESPONSE_CACHE:
+        return
+    session = object_session(target)
+    if session is not None:
+        _tag_followers(session, connection, target.artist_id)
+
+
+def mark_followers_changed(db: Session, artist_id: int):
+    """
+    Invalidate the followers of an artist once the session commits, for the counters incremented with
+    SQL statements (crud.artist_stats), which the ORM events do not see.
+    """
+    if RESPONSE_CACHE:
+        _tag_followers(db, db, artist_id)
+
+
+for event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Song, event_name, _track_song_change)
+    event.listen(SongSource, event_name, _track_song_change)
+    event.listen(ArtistStats, event_name, _track_followers_change)
+event.listen(User, "after_update", _track_user_change)
+event.listen(User, "after_delete", _track_user_delete)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    tags = session.info.pop("response_cache_tags", None)
+    if tags:
+        invalidate_tags(*tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("response_cache_tags", None)
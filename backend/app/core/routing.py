@@ -0,0 +1,87 @@
+""" Routing of the database sessions between the primary and the read replica """
+from typing import Optional
+from fastapi import Request
+from jose import jwt, JWTError
+from sqlalchemy import Delete, Insert, Update, event
+from sqlalchemy.orm import Session
+from core.cache import CacheBackend, cache
+import time
+
+
+# Methods of the requests that can be served from the replica
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(Session):
+    """
+    Session bound to a primary engine and a read replica engine.
+
+    Everything goes to the primary, unless the session is marked as read only (info["read_only"]):
+    then the queries are sent to the replica, until the session writes something. Writes (flushes,
+    INSERT/UPDATE/DELETE statements and SELECT ... FOR UPDATE) always go to the primary, and so do
+    the reads after them, so a session reads its own writes.
+    """
+    def __init__(self, primary=None, replica=None, bind=None, **kwargs):
+        super().__init__(bind=bind or primary, **kwargs)
+        self.primary = bind or primary
+        self.replica = replica or self.primary
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)) \
+                or getattr(clause, "_for_update_arg", None) is not None:
+            self.info["wrote"] = True
+            return self.primary
+
+        if self.info.get("read_only") and not self.info.get("wrote"):
+            return self.replica
+        return self.primary
+
+
+# Last write of every user (epoch time), to send its reads to the primary while the replica catches
+# up (read-your-writes). It is kept in the shared cache, so it holds across the worker processes.
+_backend: CacheBackend = cache
+
+
+def request_user(request: Request) -> Optional[str]:
+    """
+    Get the user (subject of the bearer token) of a request, if any. The token is not verified:
+    it only chooses the database the request reads from.
+    """
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    try:
+        return str(jwt.get_unverified_claims(authorization[len("Bearer "):]).get("sub"))
+    except JWTError:
+        return None
+
+
+def record_write(user: str, seconds: float):
+    # Kept as long as the reads of the user stick to the primary
+    if seconds > 0:
+        _backend.set(f"last_write:{user}", time.time(), ttl=seconds)
+
+
+def wrote_recently(user: str, seconds: float) -> bool:
+    last_write = _backend.get(f"last_write:{user}")
+    return last_write is not None and time.time() - last_write < seconds
+
+
+def route_session(db: Session, request: Optional[Request], sticky_seconds: float):
+    """
+    Mark the session of a request as read only if the request only reads (GET) and its user has not
+    written anything in the last sticky_seconds. The writes of the user are recorded on commit.
+    """
+    if request is None:
+        return
+
+    user = request_user(request)
+    db.info["user"] = user
+    db.info["sticky_seconds"] = sticky_seconds
+    db.info["read_only"] = request.method in READ_METHODS and not (user and wrote_recently(user, sticky_seconds))
+
+
+@event.listens_for(Session, "after_commit")
+def _record_write_after_commit(session):
+    if session.info.get("wrote") and session.info.get("user"):
+        record_write(session.info["user"], session.info.get("sticky_seconds", 0))
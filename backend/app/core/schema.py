@@ -0,0 +1,26 @@
+""" Creation of the database schema, including what was added to existing tables """
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+
+
+def create_schema(engine: Engine, metadata):
+    """
+    Create the missing tables, and the columns and indexes added to the existing ones (create_all
+    only creates whole tables). The added columns need a server default (or to be nullable).
+    """
+    metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    name = engine.dialect.identifier_preparer.format_table(table)
+                    connection.exec_driver_sql(f"ALTER TABLE {name} ADD COLUMN {ddl}")
+
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
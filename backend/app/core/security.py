@@ -10,15 +10,22 @@ from models.user import User, TokenPayload
 from dotenv import load_dotenv
 import os
 from jose import jwt, JWTError, ExpiredSignatureError
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from core.hashing import check_password, check_password_async, hash_password, hash_password_async
+from core.user_cache import cache_generation, cache_user, get_cached_user, user_version
+from core.sessions import STATELESS_SESSIONS, is_session_revoked
 
+# Password operations run in the hashing process pool (see core.hashing)
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return check_password(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await check_password_async(plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await hash_password_async(password)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -29,10 +36,12 @@ ALGORITHM = os.getenv("ALGORITHM")
 EXPIRE_DELTA = timedelta(days=int(os.getenv("ACCESS_TOKEN_EXPIRE_DAYS")))
 
 # Function to create JWT token
-def create_access_token(subject: str, expires_delta: timedelta = None) -> str:
+def create_access_token(subject: str, expires_delta: timedelta = None, session_id: str = None) -> str:
     expire = datetime.utcnow() + (expires_delta if expires_delta else EXPIRE_DELTA)
     to_encode = {"exp": expire, "sub": str(subject)}
-    
+    if session_id is not None:
+        to_encode.update({"sid": session_id, "iat": datetime.utcnow()})
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -40,6 +49,16 @@ def create_access_token(subject: str, expires_delta: timedelta = None) -> str:
 security = HTTPBearer()
 optional_security = HTTPBearer(auto_error=False)
 
+# Verify a JWT token and get its contents
+def decode_access_token(token: str) -> TokenPayload:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return TokenPayload(**payload)
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token expired") 
+    except (JWTError, ValidationError):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Could not validate credentials")
+
 # Dependency to get user and verify token
 def get_current_user(
     db: Session = Depends(get_db),
@@ -47,22 +66,29 @@ def get_current_user(
 ) -> User:
     
     token = credentials.credentials
+    token_data = decode_access_token(token)
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        token_data = TokenPayload(**payload)
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token expired") 
-    except (JWTError, ValidationError):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Could not validate credentials")
+    # Stateless session: valid unless revoked, the user row is not checked
+    stateless = STATELESS_SESSIONS and token_data.sid is not None
+    if stateless and is_session_revoked(db, token_data):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    # Token already checked against the database (invalidated when the user changes)
+    user = get_cached_user(db, token)
+    if user is not None:
+        return user
+
+    generation = cache_generation()
+    version = user_version(token_data.sub)
     user = db.get(User, token_data.sub)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     
     # JWT valid for the user, check if it is the one in the database
-    if user.token != token:
+    if not stateless and user.token != token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
+
+    cache_user(token, user, generation, version)
     return user
 
 def get_current_user_optional(
@@ -0,0 +1,157 @@
+""" Stateless sessions: revocation list of the session ids carried by the access tokens """
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.user import RevokedSession, TokenPayload
+import os
+import threading
+import time
+import uuid
+
+# In the stateless session mode, logins do not store the token in the user: every token carries
+# its own session id, and logout/account deletion revoke it. A user can have several sessions.
+STATELESS_SESSIONS = os.getenv("STATELESS_SESSIONS", "false").lower() == "true"
+
+# Seconds between the reloads of the revocations made by other workers
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "5"))
+
+# Revocations older than the last reload that are read again, for the transactions that
+# committed late (their rows may have been invisible to the previous reload)
+_REFRESH_OVERLAP_SECONDS = 60
+
+
+# Session id -> expiration (timestamp) of its token
+_revoked_sessions = {}
+# User id -> (time until which all its sessions are revoked, expiration), as timestamps
+_revoked_users = {}
+# Wall time of the last reload (None before the first one) and monotonic time of the next one
+_loaded_at = None
+_next_refresh = 0.0
+_lock = threading.Lock()
+
+
+def _timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _apply(revocations):
+    with _lock:
+        for session_id, user_id, revoked_at, expires_at in revocations:
+            if session_id is not None:
+                _revoked_sessions[session_id] = expires_at
+            elif revoked_at > _revoked_users.get(user_id, (0.0, 0.0))[0]:
+                _revoked_users[user_id] = (revoked_at, expires_at)
+
+
+def refresh_revocations(db: Session, force: bool = False):
+    """
+    Load the revocations committed by other workers since the last reload (every
+    REVOCATION_REFRESH_SECONDS at most), and forget the expired ones.
+    """
+    global _loaded_at, _next_refresh
+    with _lock:
+        if not force and time.monotonic() < _next_refresh:
+            return
+        _next_refresh = time.monotonic() + REVOCATION_REFRESH_SECONDS
+        since = _loaded_at
+
+    now = time.time()
+    query = db.query(RevokedSession.session_id, RevokedSession.user_id,
+                     RevokedSession.revoked_at, RevokedSession.expires_at) \
+              .filter(RevokedSession.expires_at > datetime.utcfromtimestamp(now))
+    if since is not None:
+        query = query.filter(RevokedSession.revoked_at >= datetime.utcfromtimestamp(since - _REFRESH_OVERLAP_SECONDS))
+
+    _apply([(session_id, user_id, _timestamp(revoked_at), _timestamp(expires_at))
+            for session_id, user_id, revoked_at, expires_at in query])
+
+    with _lock:
+        _loaded_at = now if _loaded_at is None else max(_loaded_at, now)
+        for session_id in [s for s, expires_at in _revoked_sessions.items() if expires_at <= now]:
+            del _revoked_sessions[session_id]
+        for user_id in [u for u, (_, expires_at) in _revoked_users.items() if expires_at <= now]:
+            del _revoked_users[user_id]
+
+
+def is_session_revoked(db: Session, payload: TokenPayload) -> bool:
+    """
+    Check if the session of a token was revoked, without reading the user.
+    """
+    refresh_revocations(db)
+    with _lock:
+        if payload.sid in _revoked_sessions:
+            return True
+        revoked_user = _revoked_users.get(payload.sub)
+    return revoked_user is not None and (payload.iat or 0) <= revoked_user[0]
+
+
+def _add_revocation(db: Session, revocation: RevokedSession):
+    db.add(revocation)
+    # Applied to this worker once committed
+    db.info.setdefault("revoked_sessions", []).append(
+        (revocation.session_id, revocation.user_id,
+         _timestamp(revocation.revoked_at), _timestamp(revocation.expires_at)))
+
+
+def revoke_session(db: Session, payload: TokenPayload):
+    """
+    Revoke the session of a token (it is persisted on commit).
+    """
+    expires_at = datetime.utcfromtimestamp(payload.exp) if payload.exp else datetime.utcnow()
+    _add_revocation(db, RevokedSession(session_id=payload.sid, user_id=payload.sub,
+                                       revoked_at=datetime.utcnow(), expires_at=expires_at))
+
+
+def revoke_user_sessions(db: Session, user_id: int, expires_at: datetime):
+    """
+    Revoke every session of a user issued until now (it is persisted on commit). It is kept
+    until expires_at, when all those tokens have expired.
+    """
+    _add_revocation(db, RevokedSession(session_id=None, user_id=user_id,
+                                       revoked_at=datetime.utcnow(), expires_at=expires_at))
+
+
+def prune_revoked_sessions(db: Session) -> int:
+    """
+    Delete the revocations whose tokens have already expired.
+
+    Returns:
+        int: The number of deleted revocations.
+    """
+    deleted = db.query(RevokedSession).filter(RevokedSession.expires_at <= datetime.utcnow()) \
+                .delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def clear_revocations():
+    global _loaded_at, _next_refresh
+    with _lock:
+        _revoked_sessions.clear()
+        _revoked_users.clear()
+        _loaded_at = None
+        _next_refresh = 0.0
+
+
+def session_stats() -> Optional[dict]:
+    if not STATELESS_SESSIONS:
+        return None
+    with _lock:
+        return {"revoked_sessions": len(_revoked_sessions), "revoked_users": len(_revoked_users)}
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    revocations = session.info.pop("revoked_sessions", None)
+    if revocations:
+        _apply(revocations)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("revoked_sessions", None)
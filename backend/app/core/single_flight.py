@@ -0,0 +1,119 @@
+""" Single-flight: concurrent identical computations share the result of the one in flight """
+from typing import Callable, TypeVar
+from core.cache import CacheBackend, cache
+import os
+import threading
+import time
+import uuid
+
+# Also coalesce the computations of the workers sharing the cache backend (see core.cache)
+SINGLE_FLIGHT_SHARED = os.getenv("SINGLE_FLIGHT_SHARED", "false").lower() == "true"
+
+# Seconds a computation of another worker is waited for (and its lock held at most)
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "30"))
+
+# Seconds between the checks of a computation of another worker
+_POLL_INTERVAL = 0.05
+
+T = TypeVar("T")
+
+# Backend of the locks and results shared between the workers
+_backend: CacheBackend = cache
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Key -> call in flight in this worker
+_calls = {}
+_lock = threading.Lock()
+_stats = {"computed": 0, "coalesced": 0, "shared_waits": 0, "shared_results": 0}
+
+
+def _count(stat: str):
+    with _lock:
+        _stats[stat] += 1
+
+
+def single_flight(key: str, compute: Callable[[], T]) -> T:
+    """
+    Compute a value, unless the same key is already being computed by another thread of this
+    worker: then wait for it and share its result (or its exception). Only concurrent calls are
+    coalesced, the next call computes the value again.
+    """
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+            _stats["computed"] += 1
+        else:
+            _stats["coalesced"] += 1
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = compute()
+        return call.result
+    except BaseException as error:
+        call.error = error
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
+
+
+def shared_flight(key: str, compute: Callable[[], T]) -> T:
+    """
+    Compute a JSON compatible value once across the workers sharing the cache backend (with
+    SINGLE_FLIGHT_SHARED, otherwise it is just computed). The worker which takes the lock of the
+    key computes it and publishes the result; the others wait for a result whose computation started
+    after they asked (so it sees the changes they made before), or compute it themselves if the lock
+    is released without one or after SINGLE_FLIGHT_TIMEOUT.
+    """
+    if not SINGLE_FLIGHT_SHARED:
+        return compute()
+
+    lock_key, result_key = f"flight:{key}:lock", f"flight:{key}:result"
+    token = f"{os.getpid()}:{uuid.uuid4().hex}"
+    since = time.time()
+    deadline = time.monotonic() + SINGLE_FLIGHT_TIMEOUT
+
+    if not _backend.add(lock_key, token, SINGLE_FLIGHT_TIMEOUT):
+        _count("shared_waits")
+        while True:
+            time.sleep(_POLL_INTERVAL)
+            published = _backend.get(result_key)
+            if published is not None and published["started"] >= since:
+                _count("shared_results")
+                return published["value"]
+            if _backend.add(lock_key, token, SINGLE_FLIGHT_TIMEOUT):
+                break
+            if time.monotonic() >= deadline:
+                return compute()
+
+    try:
+        started = time.time()
+        value = compute()
+        _backend.set(result_key, {"started": started, "value": value}, SINGLE_FLIGHT_TIMEOUT)
+        return value
+    finally:
+        # Unless it expired and was taken by another worker
+        if _backend.get(lock_key) == token:
+            _backend.delete(lock_key)
+
+
+def single_flight_stats() -> dict:
+    with _lock:
+        return {"shared": SINGLE_FLIGHT_SHARED, "in_flight": len(_calls), **_stats}
@@ -0,0 +1,172 @@
+""" SQL statements and database time of every request (engine events), with per-route budgets """
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("echolink.sql")
+
+# Maximum SQL statements of a request (0 disables the check). Requests over it are logged.
+SQL_STATEMENT_BUDGET = int(os.getenv("SQL_STATEMENT_BUDGET", "50"))
+
+# Budgets of specific routes, as JSON: {"GET /songs/": 5, "GET /artists/engagement": 10}
+SQL_ROUTE_BUDGETS = json.loads(os.getenv("SQL_ROUTE_BUDGETS", "{}"))
+
+
+class SQLStats:
+    """
+    Statements executed and time spent in the database (seconds) by a request or a block, and
+    the SQL of the statements, if they are recorded.
+    """
+    __slots__ = ("statements", "db_time", "log")
+
+    def __init__(self, record: bool = False):
+        self.statements = 0
+        self.db_time = 0.0
+        self.log = [] if record else None
+
+    def add(self, statement: str, elapsed: float):
+        self.statements += 1
+        self.db_time += elapsed
+        if self.log is not None:
+            self.log.append(statement)
+
+
+# Stats of the request (or block) being tracked. Threads started by it (background refreshes)
+# do not inherit it, the thread pool running the sync routes does.
+_current: ContextVar[Optional[SQLStats]] = ContextVar("sql_stats", default=None)
+
+
+@contextmanager
+def track_sql(record: bool = False):
+    """
+    Count the SQL statements (and the database time) executed in the block, in any instrumented
+    engine, recording their SQL if asked to. Nested blocks are counted (and recorded) by the
+    outer ones too.
+    """
+    outer = _current.get()
+    stats = SQLStats(record or (outer is not None and outer.log is not None))
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        if outer is not None:
+            outer.statements += stats.statements
+            outer.db_time += stats.db_time
+            if outer.log is not None:
+                outer.log.extend(stats.log)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("sql_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    starts = conn.info.get("sql_start")
+    if stats is not None and starts:
+        stats.add(statement, time.perf_counter() - starts.pop())
+
+
+def _handle_error(exception_context):
+    # A failed statement counts too
+    stats = _current.get()
+    starts = exception_context.connection.info.get("sql_start") if exception_context.connection is not None else None
+    if stats is not None and starts:
+        stats.add(exception_context.statement, time.perf_counter() - starts.pop())
+
+
+def instrument_engine(engine: Engine):
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+# Aggregated metrics of every route of this worker
+_routes = {}
+_routes_lock = threading.Lock()
+
+
+def route_budget(route: str) -> int:
+    return SQL_ROUTE_BUDGETS.get(route, SQL_STATEMENT_BUDGET)
+
+
+def record_request(route: str, stats: SQLStats, elapsed: float):
+    """
+    Add a request to the metrics of its route, logging it if it exceeds the route budget.
+    """
+    budget = route_budget(route)
+    over_budget = 0 < budget < stats.statements
+    with _routes_lock:
+        data = _routes.setdefault(route, {"requests": 0, "statements": 0, "statements_max": 0,
+                                          "db_time": 0.0, "over_budget": 0})
+        data["requests"] += 1
+        data["statements"] += stats.statements
+        data["statements_max"] = max(data["statements_max"], stats.statements)
+        data["db_time"] += stats.db_time
+        data["over_budget"] += over_budget
+
+    if over_budget:
+        logger.warning("%s ran %d SQL statements (budget %d) in %.1f ms of database time (%.1f ms total)",
+                       route, stats.statements, budget, 1000 * stats.db_time, 1000 * elapsed)
+
+
+def sql_stats() -> dict:
+    """
+    Get the SQL metrics of every route of this worker: requests, mean and max statements, mean
+    database time (milliseconds) and requests over the budget.
+    """
+    with _routes_lock:
+        return {
+            route: {
+                "requests": data["requests"],
+                "statements_mean": round(data["statements"] / data["requests"], 2),
+                "statements_max": data["statements_max"],
+                "db_ms_mean": round(1000 * data["db_time"] / data["requests"], 3),
+                "budget": route_budget(route),
+                "over_budget": data["over_budget"]
+            }
+            for route, data in sorted(_routes.items())
+        }
+
+
+def server_timing(stats: SQLStats, elapsed: float) -> str:
+    return f'db;dur={1000 * stats.db_time:.3f};desc="{stats.statements} statements", total;dur={1000 * elapsed:.3f}'
+
+
+class SQLMetricsMiddleware:
+    """
+    ASGI middleware tracking the SQL statements of every HTTP request. They are sent in the
+    Server-Timing header (db and total durations) and aggregated per route ("METHOD /path").
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        with track_sql() as stats:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    header = server_timing(stats, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+        # The route template (not the path, which includes the ids) is known after routing
+        route = scope.get("route")
+        if route is not None:
+            record_request(f"{scope['method']} {route.path}", stats, time.perf_counter() - start)
@@ -0,0 +1,157 @@
+""" Cache of the authenticated users (verified token -> user), to skip the user lookup of every request """
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from core.cache import CacheBackend, cache
+from models.user import User
+import os
+import threading
+import time
+
+# Maximum cached tokens per worker (0 disables the cache)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+# Seconds a cached user is kept (the changes made by other workers are seen through the user versions)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+# Columns of the user stored in the snapshots
+_COLUMNS = [column.key for column in User.__table__.columns]
+
+
+# Version of every user in the shared cache, increased by every change of the user in any worker.
+# A cached token is only used while the version of its user is the one it was cached with.
+_backend: CacheBackend = cache
+
+# Token -> (user id, snapshot of the columns, expiration, user version), in LRU order
+_entries = OrderedDict()
+# User id -> its cached tokens
+_tokens_by_user = {}
+# Incremented by every invalidation, so a lookup that raced with one is not cached
+_generation = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _remove(token: str):
+    user_id = _entries.pop(token)[0]
+    tokens = _tokens_by_user.get(user_id)
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del _tokens_by_user[user_id]
+
+
+def cache_generation() -> int:
+    with _lock:
+        return _generation
+
+
+def user_version(user_id: int):
+    """
+    Get the current version of a user in the shared cache (read before looking the user up, to cache it).
+    """
+    key = f"user_version:{user_id}"
+    version = _backend.get(key)
+    if version is None:
+        _backend.add(key, time.time_ns())
+        version = _backend.get(key)
+    return version
+
+
+def get_cached_user(db: Session, token: str) -> Optional[User]:
+    """
+    Get the user of a verified token from the cache, attached to the session without querying
+    the database. Returns None if it is not cached, expired or its user changed since (in any worker).
+    """
+    with _lock:
+        entry = _entries.get(token)
+    if entry is not None and entry[2] > time.monotonic() and entry[3] == user_version(entry[0]):
+        with _lock:
+            if token in _entries:
+                _entries.move_to_end(token)
+            _stats["hits"] += 1
+        snapshot = entry[1]
+    else:
+        with _lock:
+            if entry is not None and _entries.get(token) is entry:
+                _remove(token)
+            _stats["misses"] += 1
+        return None
+
+    # Rebuild the user as if it was loaded from the database, so the route can use and modify it
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def cache_user(token: str, user: User, generation: int, version):
+    """
+    Cache the user of a verified token, with the version of the user read before looking it up.
+    It is skipped if some user was invalidated since the given generation was read (the user may
+    be stale).
+    """
+    if USER_CACHE_SIZE <= 0:
+        return
+
+    snapshot = {column: getattr(user, column) for column in _COLUMNS}
+    with _lock:
+        if generation != _generation:
+            return
+        if token in _entries:
+            _remove(token)
+        _entries[token] = (user.id, snapshot, time.monotonic() + USER_CACHE_TTL, version)
+        _tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(_entries) > USER_CACHE_SIZE:
+            _remove(next(iter(_entries)))
+
+
+def invalidate_user(user_id: int):
+    global _generation
+    with _lock:
+        _generation += 1
+        _stats["invalidations"] += 1
+        for token in list(_tokens_by_user.get(user_id, ())):
+            _remove(token)
+    _backend.incr(f"user_version:{user_id}")
+
+
+def clear_user_cache():
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
+        _tokens_by_user.clear()
+
+
+def user_cache_stats() -> dict:
+    with _lock:
+        return {
+            "size": len(_entries),
+            "max_size": USER_CACHE_SIZE,
+            "ttl": USER_CACHE_TTL,
+            **_stats
+        }
+
+
+# Any change of a user (login, logout, profile update, deletion) invalidates its cached tokens
+# once it is committed, so a cached user never outlives the row it was read from.
+def _track_user_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("users_changed", set()).add(target.id)
+
+
+for event_name in ("after_update", "after_delete"):
+    event.listen(User, event_name, _track_user_change)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop("users_changed", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("users_changed", None)
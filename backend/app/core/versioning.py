@@ -0,0 +1,29 @@
+""" Versions of the entities: a counter bumped on every change of their representation (ETags) """
+from sqlalchemy import event, inspect, update
+
+
+def track_versions(model, ignore: tuple = ()):
+    """
+    Bump the version of the instances of a model (its version column) when they are updated through
+    the ORM: column or collection changes, except the ones only changing the ignored attributes.
+    The version is incremented by the UPDATE statement itself (version = version + 1), so concurrent
+    updates of an instance never get the same version. It is loaded again when it is next read.
+    """
+    ignored = {"version", *ignore}
+
+    @event.listens_for(model, "before_update")
+    def _bump_version(mapper, connection, target):
+        state = inspect(target)
+        # The version was already set by hand
+        if state.attrs.version.history.has_changes():
+            return
+        if any(attr.key not in ignored and attr.history.has_changes() for attr in state.attrs):
+            target.version = model.version + 1
+
+
+def bump_version(model, *criteria):
+    """
+    Statement bumping the version of the rows of a model matching the criteria, for the changes
+    made with Core statements (e.g. in association tables), which the ORM events do not see.
+    """
+    return update(model).where(*criteria).values(version=model.version + 1)
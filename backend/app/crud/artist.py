@@ -1,7 +1,8 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
-from models.artist import Artist
-from models.user import User, RoleEnum, ListenerArtistLink
+from models.artist import Artist, ArtistStats
+from models.user import User, RoleEnum
+from crud.artist_stats import get_artist_stats
 
 
 # Get artist by user_id
@@ -21,6 +22,9 @@ def create_artist(db: Session, user: User) -> Artist:
         genre=user.genre,
     )
 
+    # Start the artist's counters at zero
+    artist.stats = ArtistStats()
+
     # Save to the database
     db.add(artist)
     db.commit()
@@ -54,11 +58,8 @@ def get_followers(db: Session, artist_name: str) -> int:
     Get the number of followers for a given artist.
     """
     artist = get_artist_by_username(db, artist_name)
-    # Count the number of listener-artist links for the given artist
-    followers_count = db.query(ListenerArtistLink).filter(
-        ListenerArtistLink.artist_id == artist.artist_id
-    ).count()
-    return followers_count
+    # Read the follower counter of the artist
+    return get_artist_stats(db, artist).followers
 
 # Get a list of the ids of all artists which are not in the listener's following list and are not in a playlist
 def get_other_artists(db: Session, follwed_artists: list, playlist_artists: list) -> list:
@@ -0,0 +1,199 @@
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+from core.response_cache import mark_followers_changed
+from models.artist import Artist, ArtistStats
+from models.question import Question, ResponseEnum
+from models.user import ListenerArtistLink
+
+
+# Reply rate of an artist, as a percentage (0-100)
+def reply_rate(answered: int, rejected: int, waiting: int) -> float:
+    # Avoid division by zero
+    if answered + rejected == 0:
+        return 0.0  # No answered or rejected questions, rate is 0%
+
+    # Calculate the answer rate
+    answer_rate = (answered / (answered + rejected + waiting//2)) * 100
+
+    # Return the rate rounded to 2 decimal places
+    return round(answer_rate, 2)
+
+# Engagement score of an artist
+def engagement_score(answered: int, rejected: int, waiting: int, followers: int, total_questions: int) -> int:
+    # Calculate the weighted engagement score
+    engage_score = 1000 + (reply_rate(answered, rejected, waiting) * 50) + (followers * 1.5) + (total_questions * 5)
+
+    # Return the score as an integer
+    return int(round(engage_score))
+
+
+def _count_activity(db: Session, artist_ids: list = None) -> dict:
+    """
+    Count the followers and questions (by status) of the artists from the base tables,
+    in one grouped query per table.
+    """
+    def count_status(response_status: ResponseEnum):
+        return func.sum(case((Question.response_status == response_status, 1), else_=0))
+
+    questions = db.query(
+        Question.artist_id,
+        count_status(ResponseEnum.answered),
+        count_status(ResponseEnum.rejected),
+        count_status(ResponseEnum.waiting),
+        func.count(Question.question_id)
+    ).group_by(Question.artist_id)
+    followers = db.query(
+        ListenerArtistLink.artist_id,
+        func.count(ListenerArtistLink.listener_id)
+    ).group_by(ListenerArtistLink.artist_id)
+
+    if artist_ids is not None:
+        questions = questions.filter(Question.artist_id.in_(artist_ids))
+        followers = followers.filter(ListenerArtistLink.artist_id.in_(artist_ids))
+
+    counts = {}
+    for artist_id, answered, rejected, waiting, total_questions in questions.all():
+        counts[artist_id] = {
+            "answered": int(answered),
+            "rejected": int(rejected),
+            "waiting": int(waiting),
+            "total_questions": total_questions
+        }
+    for artist_id, followers_count in followers.all():
+        counts.setdefault(artist_id, {})["followers"] = followers_count
+
+    return counts
+
+
+def _set_stats(stats: ArtistStats, followers: int = 0, answered: int = 0, rejected: int = 0,
+               waiting: int = 0, total_questions: int = 0):
+    stats.followers = followers
+    stats.answered = answered
+    stats.rejected = rejected
+    stats.waiting = waiting
+    stats.total_questions = total_questions
+    stats.engagement_score = engagement_score(answered, rejected, waiting, followers, total_questions)
+
+
+def rebuild_artist_stats(db: Session, artist_ids: list = None, commit: bool = True) -> int:
+    """
+    Resynchronize the artist_stats rows with the follows and questions tables.
+
+    Args:
+        db (Session): The database session.
+        artist_ids (list): The artists to rebuild. All the artists if None.
+        commit (bool): Commit the rebuild. Otherwise it is only flushed, in the caller's transaction.
+
+    Returns:
+        int: The number of artists rebuilt.
+    """
+    artists = db.query(Artist.artist_id)
+    if artist_ids is not None:
+        artists = artists.filter(Artist.artist_id.in_(artist_ids))
+    artist_ids = [artist_id for artist_id, in artists.all()]
+
+    counts = _count_activity(db, artist_ids)
+    existing = {
+        stats.artist_id: stats
+        for stats in db.query(ArtistStats).filter(ArtistStats.artist_id.in_(artist_ids)).all()
+    }
+
+    for artist_id in artist_ids:
+        stats = existing.get(artist_id)
+        if stats is None:
+            stats = ArtistStats(artist_id=artist_id)
+            db.add(stats)
+        _set_stats(stats, **counts.get(artist_id, {}))
+
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return len(artist_ids)
+
+
+def ensure_artist_stats(db: Session):
+    """
+    Build the artist_stats rows of the artists that do not have one yet (on startup and in the
+    rebuild script: the artists get their row when they are created, the reads never write it).
+    """
+    missing = db.query(Artist.artist_id) \
+        .outerjoin(ArtistStats, ArtistStats.artist_id == Artist.artist_id) \
+        .filter(ArtistStats.artist_id.is_(None)).all()
+
+    if missing:
+        rebuild_artist_stats(db, [artist_id for artist_id, in missing])
+
+
+def empty_artist_stats(artist_id: int) -> ArtistStats:
+    """
+    Counters of an artist without an artist_stats row yet. The row is not added to the session.
+    """
+    stats = ArtistStats(artist_id=artist_id)
+    _set_stats(stats)
+    return stats
+
+
+def get_artist_stats(db: Session, artist: Artist) -> ArtistStats:
+    """
+    Get the artist_stats row of an artist (empty counters if it does not exist yet). It does not
+    write, so it can run on a read replica.
+    """
+    stats = db.get(ArtistStats, artist.artist_id)
+    return stats if stats is not None else empty_artist_stats(artist.artist_id)
+
+
+def update_artist_stats(db: Session, artist_id: int, followers: int = 0, answered: int = 0,
+                        rejected: int = 0, waiting: int = 0, total_questions: int = 0) -> ArtistStats:
+    """
+    Apply a change of the follow and question counters of an artist.
+
+    It must be called before the change is flushed. The counters are incremented in the database,
+    which locks the row until the caller commits, so the update belongs to the caller's transaction.
+    """
+    deltas = {
+        "followers": followers,
+        "answered": answered,
+        "rejected": rejected,
+        "waiting": waiting,
+        "total_questions": total_questions
+    }
+
+    if followers:
+        mark_followers_changed(db, artist_id)
+
+    stats = _increment_stats(db, artist_id, deltas)
+    if stats is None:
+        # Missing row: insert it counting from the base tables (without the pending change), unless
+        # another transaction inserts it first, and apply the change to it
+        from crud.seed import insert_ignore
+        with db.no_autoflush:
+            counts = _count_activity(db, [artist_id]).get(artist_id, {})
+        counters = {key: counts.get(key, 0) for key in deltas}
+        insert_ignore(db, ArtistStats.__table__, [{
+            "artist_id": artist_id, **counters, "engagement_score": engagement_score(**counters)
+        }])
+        stats = _increment_stats(db, artist_id, deltas)
+
+    counters = {key: getattr(stats, key) for key in deltas}
+    if min(counters.values()) < 0:
+        # Out of sync row: count again from the base tables (without the pending change)
+        with db.no_autoflush:
+            counts = _count_activity(db, [artist_id]).get(artist_id, {})
+        counters = {key: counts.get(key, 0) + delta for key, delta in deltas.items()}
+
+    _set_stats(stats, **counters)
+    return stats
+
+
+def _increment_stats(db: Session, artist_id: int, deltas: dict):
+    """
+    Add the deltas to the counters of an artist in the database (UPDATE ... SET x = x + delta, which
+    locks the row), and get the row with the new counters. None if the row is missing.
+    """
+    return db.execute(
+        update(ArtistStats).where(ArtistStats.artist_id == artist_id)
+        .values({key: getattr(ArtistStats, key) + delta for key, delta in deltas.items()})
+        .returning(ArtistStats),
+        execution_options={"populate_existing": True}
+    ).scalar_one_or_none()
@@ -4,6 +4,7 @@ from models.listener import Listener
 from models.user import ListenerArtistLink, User
 from crud.artist import get_artist_by_username, get_artists
 from crud.playlist import get_playlists_by_user_id, get_songs_in_playlist
+from crud.artist_stats import update_artist_stats
 
 # Get listener by user_id
 def get_listener_by_user_id(db: Session, user_id: int) -> Listener:
@@ -68,7 +69,8 @@ def follow_artist(db: Session, listener: Listener, artist_username: str) -> List
     if existing_follow:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The listener follows the artist.")
 
-    # Create the follow link
+    # Create the follow link and count the new follower
+    update_artist_stats(db, artist.artist_id, followers=1)
     follow_link = ListenerArtistLink(listener_id=listener.listener_id, artist_id=artist.artist_id)
     db.add(follow_link)
     db.commit()
@@ -88,7 +90,8 @@ def unfollow_artist(db: Session, listener: Listener, artist_username: str):
     if not follow:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The listener does not follow the artist.")
 
-    # Delete the follow link
+    # Delete the follow link and discount the follower
+    update_artist_stats(db, artist.artist_id, followers=-1)
     db.delete(follow)
     db.commit()
 
@@ -2,7 +2,28 @@ from sqlalchemy.orm import Session
 from models.playlist import Playlist, PlaylistInput, PlaylistUpdate, playlist_songs
 from typing import List, Optional
 from models.user import User
-from sqlalchemy import func, insert, update, delete
+from sqlalchemy import func, insert, select, update, delete
+from metrics.loyalty import mark_loyalty_changed
+from core.versioning import bump_version
+
+# Get a playlist or raise an error
+def _get_playlist_or_error(db: Session, playlist_id: int, error: str = "Playlist not found") -> Playlist:
+    playlist = db.query(Playlist).filter(Playlist.playlist_id == playlist_id).first()
+    if not playlist:
+        raise ValueError(error)
+    return playlist
+
+# Get a playlist of a user or raise an error
+def _get_own_playlist(db: Session, playlist_id: int, user_id: int, action: str) -> Playlist:
+    playlist = _get_playlist_or_error(db, playlist_id, "Playlist not found.")
+    if playlist.user_id != user_id:
+        raise ValueError(f"User does not have permission to {action} this playlist.")
+    return playlist
+
+# Statement bumping the version of the playlists with some of the songs matching the criteria (on
+# playlist_songs), run before deleting the songs: their playlist_songs rows are deleted in cascade
+def bump_playlists_with_songs(*criteria):
+    return bump_version(Playlist, Playlist.playlist_id.in_(select(playlist_songs.c.playlist_id).where(*criteria)))
 
 # Create a new playlist
 def create_playlist(db: Session, playlist_data: PlaylistInput, user_id: int) -> Playlist:
@@ -63,73 +84,76 @@ def get_playlists_by_username(db: Session, username: str, user_id: int) -> List[
 
     return playlists
 
-# Update an existing playlist
-def update_playlist(db: Session, playlist_id: int, update_data: PlaylistUpdate, user_id: int) -> Optional[Playlist]:
-    playlist = db.query(Playlist).filter(Playlist.playlist_id == playlist_id).first()
+# Update an existing playlist (the async routes run the writes too, see crud.playlist_async)
+def update_playlist(db: Session, playlist_id: int, update_data: PlaylistUpdate, user_id: int) -> Playlist:
+    playlist = _get_playlist_or_error(db, playlist_id)
 
     if playlist.user_id != user_id:
         raise ValueError("User does not have permission to update this playlist")
 
-    if playlist:
-        update_data = update_data.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(playlist, key, value)
+    update_data = update_data.model_dump(exclude_unset=True)
+    for key, value in update_data.items():
+        setattr(playlist, key, value)
 
-        db.commit()
-        db.refresh(playlist)
-    
+    db.commit()
+    db.refresh(playlist)
     return playlist
 
 # Delete a playlist
 def delete_playlist(db: Session, playlist_id: int, user_id: int) -> bool:
-    playlist = db.query(Playlist).filter(Playlist.playlist_id == playlist_id).first()
+    playlist = _get_playlist_or_error(db, playlist_id)
 
     if playlist.user_id != user_id:
         raise ValueError("User does not have permission to delete this playlist")
 
-    if playlist:
-        db.delete(playlist)
-        db.commit()
-        return True
-    return False
+    db.delete(playlist)
+    db.commit()
+    return True
 
 def add_song_to_playlist(db: Session, playlist_id: int, song_id: int, user_id: int) -> Playlist:
     # Retrieve the playlist and check ownership
-    playlist = db.query(Playlist).filter(Playlist.playlist_id == playlist_id).first()
-    if not playlist:
-        raise ValueError("Playlist not found.")
-    if playlist.user_id != user_id:
-        raise ValueError("User does not have permission to modify this playlist.")
+    playlist = _get_own_playlist(db, playlist_id, user_id, "modify")
 
     # Check if the song is already in the playlist
     if any(song.song_id == song_id for song in playlist.songs):
         raise ValueError("This song is already in the playlist.")
 
     # Calculate the next order value
-    max_order = db.query(func.coalesce(func.max(playlist_songs.c.order), 0)).filter(playlist_songs.c.playlist_id == playlist_id).scalar()
-    next_order = max_order + 1
+    max_order = db.execute(
+        select(func.coalesce(func.max(playlist_songs.c.order), 0)).where(playlist_songs.c.playlist_id == playlist_id)
+    ).scalar()
 
     # Add the association with the calculated order
-    stmt = insert(playlist_songs).values(playlist_id=playlist_id, song_id=song_id, order=next_order)
-    db.execute(stmt)
+    db.execute(insert(playlist_songs).values(playlist_id=playlist_id, song_id=song_id, order=max_order + 1))
+    db.execute(bump_version(Playlist, Playlist.playlist_id == playlist_id))
+    mark_loyalty_changed(db, playlist.user_id)
     db.commit()
     return playlist
 
+# Rewrite the order of the songs of a playlist (1, 2, ...), a new version of it
+def _set_songs_order(db: Session, playlist_id: int, song_ids: List[int]):
+    for index, song_id in enumerate(song_ids, start=1):
+        db.execute(
+            update(playlist_songs)
+            .where(playlist_songs.c.playlist_id == playlist_id, playlist_songs.c.song_id == song_id)
+            .values(order=index)
+        )
+    db.execute(bump_version(Playlist, Playlist.playlist_id == playlist_id))
+
+# Get the songs of a playlist, in order
+def _get_song_ids(db: Session, playlist_id: int) -> List[int]:
+    return list(db.execute(
+        select(playlist_songs.c.song_id).where(playlist_songs.c.playlist_id == playlist_id)
+        .order_by(playlist_songs.c.order)
+    ).scalars().all())
+
 def remove_song_from_playlist(db: Session, playlist_id: int, song_id: int, user_id: int) -> Playlist:
     # Retrieve the playlist and check ownership
-    playlist = db.query(Playlist).filter(Playlist.playlist_id == playlist_id).first()
-    if not playlist:
-        raise ValueError("Playlist not found.")
-    if playlist.user_id != user_id:
-        raise ValueError("User does not have permission to modify this playlist.")
+    playlist = _get_own_playlist(db, playlist_id, user_id, "modify")
 
     # Check if the song exists in the playlist
-    song_entry = (
-        db.query(playlist_songs)
-        .filter(playlist_songs.c.playlist_id == playlist_id, playlist_songs.c.song_id == song_id)
-        .first()
-    )
-    if not song_entry:
+    song_ids = _get_song_ids(db, playlist_id)
+    if song_id not in song_ids:
         raise ValueError("Song not found in playlist.")
 
     # Remove song from playlist
@@ -137,20 +161,10 @@ def remove_song_from_playlist(db: Session, playlist_id: int, song_id: int, user_
         delete(playlist_songs)
         .where(playlist_songs.c.playlist_id == playlist_id, playlist_songs.c.song_id == song_id)
     )
+    mark_loyalty_changed(db, playlist.user_id)
 
     # Adjust order for remaining songs
-    remaining_songs = (
-        db.query(playlist_songs)
-        .filter(playlist_songs.c.playlist_id == playlist_id)
-        .order_by(playlist_songs.c.order)
-        .all()
-    )
-    for index, song in enumerate(remaining_songs, start=1):
-        db.execute(
-            update(playlist_songs)
-            .where(playlist_songs.c.playlist_id == playlist_id, playlist_songs.c.song_id == song.song_id)
-            .values(order=index)
-        )
+    _set_songs_order(db, playlist_id, [remaining for remaining in song_ids if remaining != song_id])
 
     db.commit()
     db.refresh(playlist)
@@ -158,33 +172,16 @@ def remove_song_from_playlist(db: Session, playlist_id: int, song_id: int, user_
 
 def reorder_songs_in_playlist(db: Session, playlist_id: int, new_order: List[int], user_id: int) -> Playlist:
     # Retrieve the playlist and check ownership
-    playlist = db.query(Playlist).filter(Playlist.playlist_id == playlist_id).first()
-    if not playlist:
-        raise ValueError("Playlist not found.")
-    if playlist.user_id != user_id:
-        raise ValueError("User does not have permission to modify this playlist.")
+    playlist = _get_own_playlist(db, playlist_id, user_id, "modify")
 
     # Validate new order
-    # Extract current song IDs from the playlist
-    current_song_ids = (
-        db.query(playlist_songs.c.song_id)
-        .filter(playlist_songs.c.playlist_id == playlist_id)
-        .all()
-    )
-    current_song_ids = [song_id for (song_id,) in current_song_ids]
-
+    current_song_ids = _get_song_ids(db, playlist_id)
     if sorted(current_song_ids) != sorted(new_order):
         raise ValueError("New order is invalid. It must include all songs in the playlist exactly once.")
 
     # Reorder the songs
-    for index, song_id in enumerate(new_order, start=1):
-        db.execute(
-            update(playlist_songs)
-            .where(playlist_songs.c.playlist_id == playlist_id, playlist_songs.c.song_id == song_id)
-            .values(order=index)
-        )
-    
+    _set_songs_order(db, playlist_id, new_order)
+
     db.commit()
     db.refresh(playlist)
     return playlist
-
@@ -0,0 +1,88 @@
+""" Playlist related CRUD methods (async) """
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from models.playlist import Playlist, PlaylistInput, PlaylistUpdate
+from models.user import User
+from crud.playlist import create_playlist as create_playlist_sync, \
+    update_playlist as update_playlist_sync, delete_playlist as delete_playlist_sync, \
+    add_song_to_playlist as add_song_to_playlist_sync, remove_song_from_playlist as remove_song_from_playlist_sync, \
+    reorder_songs_in_playlist as reorder_songs_in_playlist_sync
+
+# Relationships of a playlist needed to build its output, loaded with the playlist (no lazy loads in async)
+PLAYLIST_OUTPUT_OPTIONS = (
+    selectinload(Playlist.user),
+    selectinload(Playlist.songs)
+)
+
+# Get a playlist (with its output relationships up to date) or raise an error
+async def _get_playlist_or_error(db: AsyncSession, playlist_id: int) -> Playlist:
+    playlist = (await db.execute(
+        select(Playlist).options(*PLAYLIST_OUTPUT_OPTIONS).where(Playlist.playlist_id == playlist_id)
+        .execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+    if not playlist:
+        raise ValueError("Playlist not found")
+    return playlist
+
+# Create a new playlist (the writes run the sync implementation on the connection of the session,
+# then the playlist is loaded again with its output relationships)
+async def create_playlist(db: AsyncSession, playlist_data: PlaylistInput, user_id: int) -> Playlist:
+    playlist = await db.run_sync(create_playlist_sync, playlist_data, user_id)
+    return await _get_playlist_or_error(db, playlist.playlist_id)
+
+# Retrieve a playlist by ID and check ownership and visibility
+async def get_playlist_by_id(db: AsyncSession, playlist_id: int, user_id: int) -> Optional[Playlist]:
+    playlist = await _get_playlist_or_error(db, playlist_id)
+
+    if playlist.user_id != user_id and playlist.visibility.value == "private":
+        raise ValueError("User does not have permission to view this playlist")
+
+    return playlist
+
+# Get the versions of a playlist and of its owner (its username is in the output), for its ETag,
+# with the owner and visibility to check the access first (None if it does not exist)
+async def get_playlist_versions(db: AsyncSession, playlist_id: int) -> Optional[tuple]:
+    return (await db.execute(
+        select(Playlist.version, User.version, Playlist.user_id, Playlist.visibility)
+        .join(User, User.id == Playlist.user_id)
+        .where(Playlist.playlist_id == playlist_id)
+    )).first()
+
+# Retrieve all playlists by username and check ownership or playlist visibility
+async def get_playlists_by_username(db: AsyncSession, username: str, user_id: int) -> List[Playlist]:
+    user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+
+    if not user:
+        raise ValueError("User not found")
+
+    playlists = (await db.execute(
+        select(Playlist).options(*PLAYLIST_OUTPUT_OPTIONS).where(Playlist.user_id == user.id)
+    )).scalars().all()
+
+    if user.id != user_id:
+        playlists = [playlist for playlist in playlists if playlist.visibility.value == "public"]
+
+    return playlists
+
+# Update an existing playlist
+async def update_playlist(db: AsyncSession, playlist_id: int, update_data: PlaylistUpdate, user_id: int) -> Playlist:
+    await db.run_sync(update_playlist_sync, playlist_id, update_data, user_id)
+    return await _get_playlist_or_error(db, playlist_id)
+
+# Delete a playlist
+async def delete_playlist(db: AsyncSession, playlist_id: int, user_id: int) -> bool:
+    return await db.run_sync(delete_playlist_sync, playlist_id, user_id)
+
+async def add_song_to_playlist(db: AsyncSession, playlist_id: int, song_id: int, user_id: int) -> Playlist:
+    await db.run_sync(add_song_to_playlist_sync, playlist_id, song_id, user_id)
+    return await _get_playlist_or_error(db, playlist_id)
+
+async def remove_song_from_playlist(db: AsyncSession, playlist_id: int, song_id: int, user_id: int) -> Playlist:
+    await db.run_sync(remove_song_from_playlist_sync, playlist_id, song_id, user_id)
+    return await _get_playlist_or_error(db, playlist_id)
+
+async def reorder_songs_in_playlist(db: AsyncSession, playlist_id: int, new_order: List[int], user_id: int) -> Playlist:
+    await db.run_sync(reorder_songs_in_playlist_sync, playlist_id, new_order, user_id)
+    return await _get_playlist_or_error(db, playlist_id)
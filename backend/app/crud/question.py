@@ -1,15 +1,21 @@
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import List, Optional, Tuple
 from models.question import Question, QuestionInput, QuestionResponse, ResponseEnum
 from fastapi import HTTPException, status
 from crud.artist import get_artist_by_username
-from crud.listener import check_follow, get_listener_by_username, get_listener_by_listener_id
+from crud.listener import check_follow, get_listener_by_username
 from models.listener import Listener
 from models.artist import Artist
-from metrics.listeners import get_listener_loyalty_data, loyalty_points
-
-# Get questions by listener username
-def get_questions_by_listener(db: Session, username: str):
+from metrics.loyalty import is_top_loyal_listener, loyalty_scores
+from core.config import QUESTION_LOYALTY_GATE
+from crud.artist_stats import update_artist_stats
+import base64
+import heapq
+import json
+
+# Get questions by listener username (the first `limit` ones if given)
+def get_questions_by_listener(db: Session, username: str, limit: Optional[int] = None):
     listener = get_listener_by_username(db, username)
     questions = db.query(Question).filter(Question.listener_id == listener.listener_id).all()
 
@@ -42,23 +48,81 @@ def get_questions_by_listener(db: Session, username: str):
     # Sort questions using the custom sort key
     sorted_questions = sorted(questions, key=sort_key)
 
-    return sorted_questions
+    return sorted_questions[:limit]
 
 # Get questions by artist username
 def get_questions_by_artist(db: Session, username: str):
     artist = get_artist_by_username(db, username)
     return db.query(Question).filter(Question.artist_id == artist.artist_id).all()
 
-# Get waiting questions by artist username
-def get_waiting_questions_by_artist(db: Session, username: str):
+# Encode the sort key of a waiting question as an opaque cursor
+def encode_question_cursor(key: tuple) -> str:
+    points, question_date, question_id = key
+    data = json.dumps([points, question_date.isoformat(), question_id])
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+# Decode a cursor given by encode_question_cursor
+def decode_question_cursor(cursor: str) -> tuple:
+    try:
+        points, question_date, question_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(points), datetime.fromisoformat(question_date), int(question_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+# Get a page of the waiting questions of an artist
+def get_waiting_questions_page(db: Session, username: str, limit: Optional[int] = None,
+                               after: Optional[tuple] = None) -> Tuple[List[Question], Optional[tuple]]:
+    """
+    Get the waiting questions of an artist sorted by the loyalty points of the listener (descending),
+    then by date (ascending) in case of a draw.
+
+    The loyalty points of all the listeners asking are computed in one batch, and only the questions
+    of the page are loaded.
+
+    Args:
+        db (Session): The database session.
+        username (str): The username of the artist.
+        limit (int): The maximum number of questions of the page. All of them if None.
+        after (tuple): The sort key of the last question of the previous page (see decode_question_cursor).
+
+    Returns:
+        tuple: The questions of the page and the sort key of its last question if there are more questions.
+    """
     artist = get_artist_by_username(db, username)
-    questions = db.query(Question).filter(Question.artist_id == artist.artist_id,
-                                          Question.response_status == ResponseEnum.waiting).all()
+    waiting = db.query(Question.question_id, Question.listener_id, Question.question_date) \
+        .filter(Question.artist_id == artist.artist_id,
+                Question.response_status == ResponseEnum.waiting).all()
+    if not waiting:
+        return [], None
+
+    # Loyalty points of every listener asking, in a single batch
+    scores = loyalty_scores(artist, db, list({listener_id for _, listener_id, _ in waiting}))
+    points = dict(zip(scores["listener_id"].tolist(), scores["points"].tolist()))
+
+    # Sort key: (-points, question date, question id)
+    keys = [(-points[listener_id], question_date, question_id) for question_id, listener_id, question_date in waiting]
+    if after is not None:
+        after = (-after[0], after[1], after[2])
+        keys = [key for key in keys if key > after]
+
+    if limit is None:
+        page, more = sorted(keys), False
+    else:
+        page = heapq.nsmallest(limit + 1, keys)
+        page, more = page[:limit], len(page) > limit
+
+    # Load only the questions of the page
+    questions = {
+        question.question_id: question
+        for question in db.query(Question).filter(Question.question_id.in_([key[2] for key in page])).all()
+    }
+    last = (-page[-1][0], page[-1][1], page[-1][2]) if more else None
+    return [questions[key[2]] for key in page], last
 
+# Get waiting questions by artist username
+def get_waiting_questions_by_artist(db: Session, username: str, limit: Optional[int] = None):
     # Sort by score first (descending), then by date (ascending) in case of a draw
-    return sorted(questions, key=lambda x: 
-                  (-loyalty_points(artist, get_listener_by_listener_id(db, x.listener_id), db),
-                   x.question_date))
+    return get_waiting_questions_page(db, username, limit)[0]
 
 # Decide if a listener can ask a question to an artist
 def can_question(db: Session, listener: Listener, artist: Artist):
@@ -71,9 +135,10 @@ def can_question(db: Session, listener: Listener, artist: Artist):
                                 Question.response_status == ResponseEnum.waiting).first():
         return False
     
-    # Check if listener is in the top 10 in terms of loyalty
-    return True
-    return get_listener_loyalty_data(artist, listener, db)["percentage"] < 10
+    # Check if listener is in the top 10% in terms of loyalty (precomputed cutoff of the artist)
+    if not QUESTION_LOYALTY_GATE:
+        return True
+    return is_top_loyal_listener(artist, listener, db)
 
 # Add a new question to the database
 def submit_question(db: Session, listener: Listener, question_input: QuestionInput) -> Question:
@@ -100,7 +165,8 @@ def submit_question(db: Session, listener: Listener, question_input: QuestionInp
         question_date=datetime.utcnow()
     )
 
-    # Add question to the session and commit it
+    # Add question to the session, count it and commit it
+    update_artist_stats(db, artist.artist_id, waiting=1, total_questions=1)
     db.add(question)
     db.commit()
     db.refresh(question)
@@ -123,7 +189,10 @@ def response_question(db: Session, artist: Artist, response: QuestionResponse, r
     if question.response_status != ResponseEnum.waiting:
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="This question has already been responded.")
     
-    # Update question
+    # Update question and move it from the waiting counter to the response counter
+    update_artist_stats(db, artist.artist_id, waiting=-1,
+                        answered=1 if response_status == ResponseEnum.answered else 0,
+                        rejected=1 if response_status == ResponseEnum.rejected else 0)
     question.response_text = response.response_text
     question.response_date = datetime.utcnow()
     question.response_status = response_status
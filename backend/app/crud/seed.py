@@ -0,0 +1,399 @@
+""" Bulk seeding of the database from JSON / NDJSON files """
+from datetime import datetime
+from itertools import islice
+from pydantic import ValidationError
+from sqlalchemy import Table, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models.user import User, UserInput, RoleEnum, ListenerArtistLink
+from models.artist import Artist, ArtistStats
+from models.listener import Listener
+from models.question import Question, ResponseEnum
+from models.song import Song, SongSource, SongInput
+from crud.artist_stats import rebuild_artist_stats
+from metrics.ranking import invalidate_ranking_snapshot
+from metrics.loyalty import invalidate_loyalty_indexes
+from core.response_cache import clear_response_cache
+from core.hashing import hash_passwords_bulk
+import json
+import os
+import time
+
+# Rows inserted per statement (and records committed per transaction)
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "1000"))
+
+# How the passwords of the records are hashed. A record with a "hashed_password" is always stored as is.
+#  - each: every password is hashed (in the hashing pool)
+#  - shared: every distinct password is hashed once and its hash is reused (staging data only)
+#  - precomputed: only the records with a "hashed_password" are loaded
+HASH_MODES = ("each", "shared", "precomputed")
+
+# Extensions of the files with one JSON record per line
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+# Password used to validate the records with a precomputed hash
+_VALID_PASSWORD = "precomputed"
+
+
+def _iter_json_container(f, chunk_size: int = 1 << 16):
+    """
+    Yield the items of a JSON array (or the values of a JSON object) read in chunks, without
+    loading the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    def skip(separators: str):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in separators):
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A value ending with the buffer may be truncated (a number)
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            pos = end
+            return value
+
+    skip("")
+    if pos >= len(buffer):
+        return
+    opening = buffer[pos]
+    if opening not in "[{":
+        raise ValueError("Expected a JSON array or object.")
+    pos += 1
+
+    while True:
+        skip(",")
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of the JSON document.")
+        if buffer[pos] in "]}":
+            return
+        if opening == "{":
+            decode()
+            skip(":")
+        yield decode()
+
+
+def iter_json_records(path: str):
+    """
+    Stream the records of a file: one per line for NDJSON files, or the items of the top-level
+    array (the values of the top-level object) of a JSON file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(NDJSON_EXTENSIONS):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_container(f)
+
+
+def _batches(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_ignore(db: Session, table: Table, rows: list) -> int:
+    """
+    Insert rows in one executemany, skipping the ones that conflict with existing rows
+    (INSERT ... ON CONFLICT DO NOTHING).
+
+    Returns:
+        int: The number of inserted rows (the number of rows, if the driver does not report it).
+    """
+    if not rows:
+        return 0
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    else:
+        raise ValueError(f"Bulk inserts are not supported for {dialect}.")
+
+    result = db.execute(statement, rows)
+    return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+
+
+def _user_row(record: dict, username: str, role: RoleEnum, genre: str = None,
+              description: str = None, image_url: str = None) -> dict:
+    """
+    Validate a user record as the API does (UserInput) and build its row, without the hash.
+    Raises ValidationError if the record is not valid.
+    """
+    user_input = UserInput(
+        username=username,
+        email=record["email"],
+        password=record.get("password") or _VALID_PASSWORD,
+        role=role,
+        genre=genre,
+        description=description,
+        image_url=image_url
+    )
+    return {
+        "username": user_input.username,
+        "email": user_input.email,
+        "hashed_password": record.get("hashed_password"),
+        "password": record.get("password"),
+        "description": user_input.description,
+        "genre": user_input.genre,
+        "visibility": user_input.visibility,
+        "role": user_input.role,
+        "image_url": str(user_input.image_url) if user_input.image_url else None,
+        "token": None
+    }
+
+
+def _hash_passwords(rows: list, hash_mode: str, shared_hashes: dict) -> list:
+    """
+    Fill the hashes of the user rows, dropping the ones that cannot be hashed in the mode.
+    """
+    if hash_mode == "precomputed":
+        rows = [row for row in rows if row["hashed_password"]]
+    rows = [row for row in rows if row["hashed_password"] or row["password"]]
+    pending = [row for row in rows if not row["hashed_password"]]
+
+    if hash_mode == "shared":
+        missing = list({row["password"] for row in pending} - shared_hashes.keys())
+        shared_hashes.update(zip(missing, hash_passwords_bulk(missing)))
+        for row in pending:
+            row["hashed_password"] = shared_hashes[row["password"]]
+    else:
+        for row, hashed in zip(pending, hash_passwords_bulk([row["password"] for row in pending])):
+            row["hashed_password"] = hashed
+
+    for row in rows:
+        del row["password"]
+    return rows
+
+
+def _insert_users(db: Session, rows: list, hash_mode: str, shared_hashes: dict, report: dict) -> dict:
+    """
+    Insert the new users (only their passwords are hashed) and get the ids of all of them
+    (new or existing), by username.
+    """
+    usernames = [row["username"] for row in rows]
+    existing = {username for username, in db.execute(select(User.username).where(User.username.in_(usernames)))}
+    new_rows = [row for row in rows if row["username"] not in existing]
+    hashed_rows = _hash_passwords(new_rows, hash_mode, shared_hashes)
+    report["skipped"] += len(new_rows) - len(hashed_rows)
+
+    report["users"] += insert_ignore(db, User.__table__, hashed_rows)
+    return dict(db.execute(select(User.username, User.id).where(User.username.in_(usernames))).all())
+
+
+def _artist_ids(db: Session, usernames) -> dict:
+    return dict(db.execute(
+        select(User.username, Artist.artist_id).join(Artist, Artist.user_id == User.id)
+        .where(User.username.in_(list(usernames)))
+    ).all())
+
+
+def _new_report() -> dict:
+    return {"records": 0, "skipped": 0, "users": 0, "artists": 0, "listeners": 0, "songs": 0,
+            "sources": 0, "follows": 0, "questions": 0}
+
+
+def _load_artists_batch(db: Session, records: list, hash_mode: str, shared_hashes: dict,
+                        max_songs: int, report: dict) -> set:
+    rows, songs = [], {}
+    for record in records:
+        try:
+            row = _user_row(record, record["name"].replace(" ", "_"), RoleEnum.artist,
+                            genre=record.get("genres"), description=record.get("description"),
+                            image_url=record.get("image_url"))
+            song_inputs = [
+                SongInput(title=song["name"], release_date=song["release_date"], album=song.get("album"),
+                          genre=song.get("genre"), artist_name=row["username"], sources=song.get("sources") or [])
+                for song in record.get("songs", [])[:max_songs]
+            ]
+        except (KeyError, ValidationError):
+            report["skipped"] += 1
+            continue
+        rows.append(row)
+        songs[row["username"]] = song_inputs
+
+    user_ids = _insert_users(db, rows, hash_mode, shared_hashes, report)
+    genres = {row["username"]: row["genre"] for row in rows}
+
+    # Artist profiles (with their counters) of the users that do not have one
+    report["artists"] += insert_ignore(db, Artist.__table__, [
+        {"user_id": user_id, "name": username, "genre": genres[username]}
+        for username, user_id in user_ids.items()
+    ])
+    artist_ids = _artist_ids(db, user_ids)
+    insert_ignore(db, ArtistStats.__table__, [{"artist_id": artist_id} for artist_id in artist_ids.values()])
+
+    # Songs not uploaded yet by their artist (by title), then their sources
+    existing = set(db.execute(
+        select(Song.artist_id, Song.title).where(Song.artist_id.in_(list(artist_ids.values())))
+    ).all())
+    new_songs = {}
+    for username, artist_id in artist_ids.items():
+        for song in songs.get(username, []):
+            if (artist_id, song.title) not in existing and (artist_id, song.title) not in new_songs:
+                new_songs[(artist_id, song.title)] = song
+    if new_songs:
+        db.execute(Song.__table__.insert(), [
+            {"title": song.title, "album": song.album, "genre": song.genre,
+             "release_date": song.release_date, "artist_id": artist_id}
+            for (artist_id, _), song in new_songs.items()
+        ])
+        report["songs"] += len(new_songs)
+        song_ids = db.execute(
+            select(Song.artist_id, Song.title, Song.song_id)
+            .where(tuple_(Song.artist_id, Song.title).in_(list(new_songs)))
+        ).all()
+        sources = [
+            {"song_id": song_id, "source_url": str(url)}
+            for artist_id, title, song_id in song_ids
+            for url in new_songs[(artist_id, title)].sources
+        ]
+        if sources:
+            db.execute(SongSource.__table__.insert(), sources)
+        report["sources"] += len(sources)
+
+    db.commit()
+    return set(artist_ids.values())
+
+
+def _load_listeners_batch(db: Session, records: list, hash_mode: str, shared_hashes: dict,
+                          report: dict) -> set:
+    rows, activity = [], {}
+    for record in records:
+        try:
+            row = _user_row(record, record["username"], RoleEnum.listener)
+        except (KeyError, ValidationError):
+            report["skipped"] += 1
+            continue
+        rows.append(row)
+        activity[row["username"]] = (record.get("followers", []), record.get("artist_questions", {}))
+
+    user_ids = _insert_users(db, rows, hash_mode, shared_hashes, report)
+
+    # Listener profiles of the users that do not have one
+    report["listeners"] += insert_ignore(db, Listener.__table__, [{"user_id": user_id} for user_id in user_ids.values()])
+    listener_ids = dict(db.execute(
+        select(User.username, Listener.listener_id).join(Listener, Listener.user_id == User.id)
+        .where(User.username.in_(list(user_ids)))
+    ).all())
+
+    # Artists followed and asked by the batch, resolved at once
+    artist_usernames = set()
+    for followed, questions in activity.values():
+        artist_usernames.update(followed)
+        artist_usernames.update(questions)
+    artist_ids = _artist_ids(db, artist_usernames)
+
+    now = datetime.utcnow()
+    report["follows"] += insert_ignore(db, ListenerArtistLink.__table__, [
+        {"listener_id": listener_ids[username], "artist_id": artist_ids[artist], "follow_date": now}
+        for username, (followed, _) in activity.items() if username in listener_ids
+        for artist in followed if artist in artist_ids
+    ])
+
+    # Questions, skipping the artists the listener is already waiting for (as submit_question)
+    waiting = set(db.execute(
+        select(Question.listener_id, Question.artist_id)
+        .where(Question.listener_id.in_(list(listener_ids.values())),
+               Question.response_status == ResponseEnum.waiting)
+    ).all())
+    questions = []
+    for username, (_, asked) in activity.items():
+        listener_id = listener_ids.get(username)
+        for artist, text in asked.items():
+            key = (listener_id, artist_ids.get(artist))
+            if listener_id is None or key[1] is None or key in waiting:
+                continue
+            waiting.add(key)
+            questions.append({
+                "listener_id": listener_id, "artist_id": key[1], "artist_username": artist,
+                "listener_username": username, "question_text": text,
+                "response_status": ResponseEnum.waiting, "question_date": now
+            })
+    if questions:
+        db.execute(Question.__table__.insert(), questions)
+    report["questions"] += len(questions)
+
+    db.commit()
+    return set(artist_ids.values())
+
+
+def seed_database(db: Session, artists_path: str = None, users_path: str = None,
+                  batch_size: int = None, hash_mode: str = "each", max_songs: int = None) -> dict:
+    """
+    Load artists (with their songs and sources) and listeners (with their follows and questions)
+    from JSON or NDJSON files, streaming the records and inserting them in batches. Existing users,
+    profiles, songs (by artist and title), follows and waiting questions are skipped, so it can be
+    run again on the same data.
+
+    The denormalized counters of the loaded artists are rebuilt once at the end, and the ranking,
+    loyalty and response caches are invalidated (the bulk inserts do not go through the ORM events).
+
+    Args:
+        db (Session): The database session.
+        artists_path (str): Artists file (data/top_artists.json format), if any.
+        users_path (str): Listeners file (data/user.json format), if any.
+        batch_size (int): Records per batch (SEED_BATCH_SIZE by default).
+        hash_mode (str): One of HASH_MODES.
+        max_songs (int): Songs loaded per artist. All of them if None.
+
+    Returns:
+        dict: The records read and skipped, the rows inserted per table, the elapsed seconds and
+        the inserted rows per second.
+    """
+    if hash_mode not in HASH_MODES:
+        raise ValueError(f"Unknown hash mode: {hash_mode}.")
+    batch_size = batch_size or SEED_BATCH_SIZE
+
+    start = time.perf_counter()
+    report = _new_report()
+    shared_hashes = {}
+    artist_ids = set()
+
+    if artists_path:
+        for records in _batches(iter_json_records(artists_path), batch_size):
+            report["records"] += len(records)
+            artist_ids |= _load_artists_batch(db, records, hash_mode, shared_hashes, max_songs, report)
+
+    if users_path:
+        for records in _batches(iter_json_records(users_path), batch_size):
+            report["records"] += len(records)
+            artist_ids |= _load_listeners_batch(db, records, hash_mode, shared_hashes, report)
+
+    if artist_ids:
+        rebuild_artist_stats(db, list(artist_ids))
+    invalidate_ranking_snapshot()
+    invalidate_loyalty_indexes()
+    clear_response_cache()
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    rows = sum(report[table] for table in ("users", "artists", "listeners", "songs", "sources", "follows", "questions"))
+    report["rows_per_second"] = round(rows / report["seconds"], 1) if report["seconds"] else 0.0
+    return report
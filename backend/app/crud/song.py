@@ -1,26 +1,34 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session, selectinload
 from fastapi import HTTPException, status
 from models.song import Song, SongInput, SongOutput, SongSource
 from models.artist import Artist
+from models.playlist import Playlist, playlist_songs
 from models.user import ListenerArtistLink, User, RoleEnum
 from crud.listener import get_followed_artists
+from crud.playlist import bump_playlists_with_songs
 from crud.artist import get_artist_by_username
-from crud.listener import get_listener_by_user_id, get_songs_id_in_playlist
-from crud.artist import get_other_artists
-from metrics.artists import get_all_artists_with_rank_data
+from crud.listener import get_listener_by_user_id
+from metrics.ranking import get_ranking_snapshot
 import random
 
-# Helper function to get a song or raise an error
-def _get_song_or_error(db: Session, song_id: int) -> Song:
-    song = db.query(Song).filter(Song.song_id == song_id).first()
-    if song is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
-    return song
+# Relationships of a song needed to build its output. They are loaded with the songs, one query
+# per relationship whatever the number of songs, instead of lazily song by song.
+SONG_OUTPUT_OPTIONS = (
+    selectinload(Song.artist).selectinload(Artist.user),
+    selectinload(Song.sources)
+)
 
-# Get song by ID
-def get_song_by_id(db: Session, song_id: int) -> SongOutput:
-    song = _get_song_or_error(db, song_id)
-    
+# Query of the songs matching the criteria with their output relationships (sync and async sessions)
+def select_songs(*criteria, order_by=()) -> Select:
+    return select(Song).options(*SONG_OUTPUT_OPTIONS).where(*criteria).order_by(*order_by)
+
+# Get the songs matching the criteria, ready to build their outputs
+def list_songs(db: Session, *criteria, order_by=()) -> list[Song]:
+    return list(db.execute(select_songs(*criteria, order_by=order_by)).scalars().all())
+
+# Build the output of a song
+def song_to_output(song: Song) -> SongOutput:
     return SongOutput(
         song_id=song.song_id,
         title=song.title,
@@ -31,6 +39,28 @@ def get_song_by_id(db: Session, song_id: int) -> SongOutput:
         sources=song.source_urls
     )
 
+# Load the output relationships of songs already loaded without them
+def _load_outputs(db: Session, songs: list[Song]) -> list[Song]:
+    if songs:
+        list_songs(db, Song.song_id.in_([song.song_id for song in songs]))
+    return songs
+
+# Helper function to get a song (with its output relationships up to date) or raise an error
+def _get_song_or_error(db: Session, song_id: int) -> Song:
+    song = db.execute(
+        select_songs(Song.song_id == song_id).execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+    if song is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
+    return song
+
+# Get song by ID
+def get_song_by_id(db: Session, song_id: int) -> SongOutput:
+    songs = list_songs(db, Song.song_id == song_id)
+    if not songs:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
+    return song_to_output(songs[0])
+
 # Get songs by artist_id
 def get_songs_by_artist_id(db: Session, artist_id: int):
     return db.query(Song).filter(Song.artist_id == artist_id).all()
@@ -42,36 +72,21 @@ def get_artist_by_song_id(db: Session, song_id: int) -> Artist:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
     return song.artist
 
-# Get artist id by song id
-def get_artist_id_by_song_id(db: Session, followed_artists: list, user_id: int) -> int:
-    playlist_songs = get_songs_id_in_playlist(db, user_id)
-    playlist_artists = []
-    for song in playlist_songs:
-        artist = get_artist_by_song_id(db, song)
-        if artist.artist_id in followed_artists:
-            continue
-        elif artist.artist_id not in playlist_artists:
-            playlist_artists.append(artist.artist_id)
-
-    return playlist_artists
+# Get the ids of the artists (not in followed_artists) with songs in the playlists of a user
+def get_artist_id_by_song_id(db: Session, followed_artists: list, user_id: int) -> list:
+    artist_ids = db.execute(
+        select(Song.artist_id).distinct()
+        .join(playlist_songs, playlist_songs.c.song_id == Song.song_id)
+        .join(Playlist, Playlist.playlist_id == playlist_songs.c.playlist_id)
+        .where(Playlist.user_id == user_id)
+    ).scalars().all()
+    return [artist_id for artist_id in artist_ids if artist_id not in followed_artists]
 
 # Get all songs
 def get_all_songs(db: Session) -> list[SongOutput]:
-    songs = db.query(Song).all()
-    return [
-        SongOutput(
-            song_id=song.song_id,
-            title=song.title,
-            album=song.album,
-            genre=song.genre,
-            release_date=song.release_date,
-            artist_name=song.artist.user.username,
-            sources=song.source_urls
-        )
-        for song in songs
-    ]
-
-# Create a song
+    return [song_to_output(song) for song in list_songs(db)]
+
+# Create a song (the async routes run it too, see crud.song_async)
 def create_song(db: Session, song_data: SongInput) -> SongOutput:
     artist = get_artist_by_username(db, song_data.artist_name)
     song = Song(
@@ -79,71 +94,39 @@ def create_song(db: Session, song_data: SongInput) -> SongOutput:
         album=song_data.album,
         genre=song_data.genre,
         release_date=song_data.release_date,
-        artist_id=artist.artist_id
+        artist_id=artist.artist_id,
+        sources=[SongSource(source_url=str(url)) for url in song_data.sources]
     )
 
     db.add(song)
     db.commit()
-    db.refresh(song)
-
-    # Add song sources (now song_id is assigned)
-    song.sources = [SongSource(song_id=song.song_id, source_url=str(url)) for url in song_data.sources]
 
-    return SongOutput(
-        song_id=song.song_id,
-        title=song.title,
-        album=song.album,
-        genre=song.genre,
-        release_date=song.release_date,
-        artist_name=artist.user.username,
-        sources=song.source_urls
-    )
+    return song_to_output(_get_song_or_error(db, song.song_id))
 
 # Update a song
 def update_song(db: Session, song_id: int, song_data: SongInput) -> SongOutput:
-    song = db.query(Song).filter(Song.song_id == song_id).first()
-    if song is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
-    
-    # Clear existing sources
-    db.query(SongSource).filter(SongSource.song_id == song.song_id).delete()
-    db.commit()
-    
+    song = _get_song_or_error(db, song_id)
     artist = get_artist_by_username(db, song_data.artist_name)
+
     song.title = song_data.title
     song.album = song_data.album
     song.genre = song_data.genre
     song.release_date = song_data.release_date
     song.artist_id = artist.artist_id
 
-    # Update with new sources
-    song.sources = [SongSource(song_id=song.song_id, source_url=str(url)) for url in song_data.sources]
+    # Replace the sources (a new version of the song, whatever changed: the old ones are orphans)
+    song.sources = [SongSource(source_url=str(url)) for url in song_data.sources]
 
     db.commit()
-    db.refresh(song)
 
-    return SongOutput(
-        song_id=song.song_id,
-        title=song.title,
-        album=song.album,
-        genre=song.genre,
-        release_date=song.release_date,
-        artist_name=artist.user.username,
-        sources=song.source_urls
-    )
+    return song_to_output(_get_song_or_error(db, song_id))
 
 # Delete a song
 def delete_song(db: Session, song_id: int):
     song = _get_song_or_error(db, song_id)
-    song_output = SongOutput(
-        song_id=song.song_id,
-        title=song.title,
-        album=song.album,
-        genre=song.genre,
-        release_date=song.release_date,
-        artist_name=song.artist.user.username,
-        sources = []
-    )
+    song_output = song_to_output(song)
+    song_output.sources = []
+    db.execute(bump_playlists_with_songs(playlist_songs.c.song_id == song_id))
     db.delete(song)
     db.commit()
 
@@ -170,7 +153,7 @@ def get_recommendations(db: Session, user: User) -> list[Song]:
     # Step 0: Check if database has at least 10 songs, otherwise return all songs
     song_count = db.query(Song).count()
     if song_count < 10:
-        return db.query(Song).all()
+        return list_songs(db)
 
     # Step 1: Get songs by followed artists
     followed_artists = (
@@ -187,7 +170,7 @@ def get_recommendations(db: Session, user: User) -> list[Song]:
 
     # If there are 30 or more songs, pick 10 at random
     if len(followed_songs) >= 30:
-        return random.sample(followed_songs, 10)
+        return _load_outputs(db, random.sample(followed_songs, 10))
 
     # Step 2: Add songs with the listener's preferred genre
     genres = db.query(Song.genre).filter(Song.artist_id.in_([artist.artist_id for artist in followed_artists])).distinct().all()
@@ -202,7 +185,7 @@ def get_recommendations(db: Session, user: User) -> list[Song]:
 
     # If the combined list has 30 or more songs, pick 10 at random
     if len(combined_list) >= 30:
-        return random.sample(combined_list, 10)
+        return _load_outputs(db, random.sample(combined_list, 10))
 
     # Step 3: Handle small lists
     selected_songs = random.sample(combined_list, min(5, len(combined_list)))
@@ -214,7 +197,7 @@ def get_recommendations(db: Session, user: User) -> list[Song]:
         .all()
     )
     additional_songs = random.sample(remaining_songs, 10 - len(selected_songs))
-    return selected_songs + additional_songs
+    return _load_outputs(db, selected_songs + additional_songs)
 
   # Sort songs alphabetically
 def sort_songs_alphabetically(db: Session, ascending: bool = True) -> list[SongOutput]:
@@ -229,20 +212,7 @@ def sort_songs_alphabetically(db: Session, ascending: bool = True) -> list[SongO
     - List of SongOutput objects
     """
     order = Song.title.asc() if ascending else Song.title.desc()
-    songs = db.query(Song).order_by(order).all()
-
-    return [
-        SongOutput(
-            song_id=song.song_id,
-            title=song.title,
-            album=song.album,
-            genre=song.genre,
-            release_date=song.release_date,
-            artist_name=song.artist.user.username,
-            sources=song.source_urls
-        )
-        for song in songs
-    ]
+    return [song_to_output(song) for song in list_songs(db, order_by=[order])]
 
 # Sort songs by release date
 def sort_songs_by_release_date(db: Session, ascending: bool = True) -> list[SongOutput]:
@@ -257,20 +227,7 @@ def sort_songs_by_release_date(db: Session, ascending: bool = True) -> list[Song
     - List of SongOutput objects
     """
     order = Song.release_date.asc() if ascending else Song.release_date.desc()
-    songs = db.query(Song).order_by(order).all()
-
-    return [
-        SongOutput(
-            song_id=song.song_id,
-            title=song.title,
-            album=song.album,
-            genre=song.genre,
-            release_date=song.release_date,
-            artist_name=song.artist.user.username,
-            sources=song.source_urls
-        )
-        for song in songs
-    ]
+    return [song_to_output(song) for song in list_songs(db, order_by=[order])]
 
 def get_songs_by_artist_engagement_score(db: Session, ascending: bool = True) -> list[SongOutput]:
     """
@@ -284,20 +241,17 @@ def get_songs_by_artist_engagement_score(db: Session, ascending: bool = True) ->
     - List of SongOutput objects
     """
 
-    # Get all artists with rank data
-    artists = get_all_artists_with_rank_data(db)
+    # Get all the songs and the rank data of their artists (from the ranking snapshot)
+    songs = list_songs(db)
+    ranking_table = get_ranking_snapshot(db, list({song.artist.user.username for song in songs}))
 
     # Create a dictionary to hold songs for each priority tier
     tiered_songs = {0: [], 1: [], 2: [], 3: [], 4: []}
 
-    # Iterate through artists and add their songs to the appropriate tier
-    for artist in artists:
-        tier = artist.rank_data["tier"]
-        artist = get_artist_by_username(db, artist.username)
-        songs = get_songs_by_artist_id(db, artist.artist_id)
-
-        # Add songs to the appropriate tier
-        tiered_songs[tier].extend(songs)
+    # Add every song to the tier of its artist
+    for song in songs:
+        tier = ranking_table[song.artist.user.username]["rank_data"]["tier"]
+        tiered_songs[tier].append(song)
 
     # Shuffle songs within each tier
     for tier_songs in tiered_songs.values():
@@ -311,18 +265,7 @@ def get_songs_by_artist_engagement_score(db: Session, ascending: bool = True) ->
     for tier in tier_order:
         sorted_songs.extend(tiered_songs[tier])
 
-    return [
-        SongOutput(
-            song_id=song.song_id,
-            title=song.title,
-            album=song.album,
-            genre=song.genre,
-            release_date=song.release_date,
-            artist_name=song.artist.user.username,
-            sources=song.source_urls
-        )
-        for song in sorted_songs
-    ]
+    return [song_to_output(song) for song in sorted_songs]
 
 def get_songs_by_artist_priority(db: Session, user_id: int) -> list[SongOutput]:
     """
@@ -342,44 +285,30 @@ def get_songs_by_artist_priority(db: Session, user_id: int) -> list[SongOutput]:
     # Get the listener by user ID
     listener = get_listener_by_user_id(db, user_id)
 
-    # Initialize the lists for each priority tier
+    # Get the ids of artists followed by the user and of the artists in their playlists
+    followed_artists = set(get_followed_artists(db, listener.listener_id))
+    playlist_artists = set(get_artist_id_by_song_id(db, followed_artists, listener.user_id))
+
+    # Split all the songs into the priority tiers (the songs of the other artists go last)
     followed_songs = []
-    playlist_songs = []
+    playlist_artist_songs = []
     other_songs = []
-
-    # Get the ids of artists followed by the user
-    followed_artists = get_followed_artists(db, listener.listener_id)
-    playlist_artists = get_artist_id_by_song_id(db, followed_artists, listener.user_id)
-    other_artists = get_other_artists(db, followed_artists, playlist_artists)
-
-    for artist in followed_artists:
-        followed_songs.extend(get_songs_by_artist_id(db, artist))
-
-    for artist in playlist_artists:
-        playlist_songs.extend(get_songs_by_artist_id(db, artist))
-
-    for artist in other_artists:
-        other_songs.extend(get_songs_by_artist_id(db, artist))
+    for song in list_songs(db):
+        if song.artist_id in followed_artists:
+            followed_songs.append(song)
+        elif song.artist_id in playlist_artists:
+            playlist_artist_songs.append(song)
+        else:
+            other_songs.append(song)
 
     # Shuffle the songs within each tier
     random.shuffle(followed_songs)
-    random.shuffle(playlist_songs)
+    random.shuffle(playlist_artist_songs)
     random.shuffle(other_songs)
 
-    songs = followed_songs + playlist_songs + other_songs
-
-    return [
-        SongOutput(
-            song_id=song.song_id,
-            title=song.title,
-            album=song.album,
-            genre=song.genre,
-            release_date=song.release_date,
-            artist_name=song.artist.user.username,
-            sources=song.source_urls
-        )
-        for song in songs
-    ]
+    songs = followed_songs + playlist_artist_songs + other_songs
+
+    return [song_to_output(song) for song in songs]
 
 
 
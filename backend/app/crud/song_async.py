@@ -0,0 +1,128 @@
+""" Song related CRUD methods (async) """
+from typing import AsyncIterator, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from core.pagination import PAGE_SIZE, encode_cursor, decode_cursor, after_cursor
+from models.song import Song, SongInput, SongOutput
+from models.artist import Artist
+from models.user import User, RoleEnum
+from crud.song import select_songs, song_to_output, create_song as create_song_sync, \
+    update_song as update_song_sync, delete_song as delete_song_sync
+
+# Sort columns of the paginated song listings (the song id breaks the ties)
+SONG_SORTS = {
+    "id": (),
+    "title": (Song.title,),
+    "release_date": (Song.release_date,)
+}
+
+# Helper function to get a song (with its output relationships) or raise an error
+async def _get_song_or_error(db: AsyncSession, song_id: int) -> Song:
+    song = (await db.execute(
+        select_songs(Song.song_id == song_id).execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+    if song is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
+    return song
+
+# Get songs sorted by the given order (and the song id, so the order is always the same)
+async def _get_songs(db: AsyncSession, *order_by) -> list[SongOutput]:
+    songs = (await db.execute(select_songs(order_by=[*order_by, Song.song_id]))).scalars().all()
+    return [song_to_output(song) for song in songs]
+
+# Columns, cursor scope, criteria and order of a page of songs
+def _page_query(sort: str, ascending: bool, cursor: Optional[str]) -> tuple:
+    columns = (*SONG_SORTS[sort], Song.song_id)
+    scope = f"songs:{sort}:{'asc' if ascending else 'desc'}"
+
+    criteria = []
+    if cursor is not None:
+        values = decode_cursor(scope, cursor)
+        if not values or not isinstance(values[-1], int) or not all(isinstance(value, str) for value in values[:-1]):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        criteria.append(after_cursor(columns, values, ascending))
+
+    order_by = [column.asc() if ascending else column.desc() for column in columns]
+    return columns, scope, criteria, order_by
+
+# Query of the versions of songs and of their artists (what their outputs depend on)
+def _select_song_versions(*criteria, order_by=()):
+    return (
+        select(Song.song_id, Song.version, User.version)
+        .join(Artist, Artist.artist_id == Song.artist_id)
+        .join(User, User.id == Artist.user_id)
+        .where(*criteria)
+        .order_by(*order_by)
+    )
+
+# Get the versions of the songs of a page in the given order (keyset pagination), or of all of them
+# without a limit, and the cursor of the next page. The versions make the ETag of the page and the
+# keys of the JSON of its songs (see crud.song_fragments).
+async def get_songs_page_versions(db: AsyncSession, sort: str = "id", ascending: bool = True,
+                                  limit: Optional[int] = PAGE_SIZE,
+                                  cursor: Optional[str] = None) -> tuple[list[tuple], Optional[str]]:
+    columns, scope, criteria, order_by = _page_query(sort, ascending, cursor)
+    query = _select_song_versions(*criteria, order_by=order_by).add_columns(*columns)
+
+    # One song more than the page tells whether there is a next page
+    if limit is not None:
+        query = query.limit(limit + 1)
+    rows = (await db.execute(query)).all()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(scope, list(rows[-1][3:]))
+    return [tuple(row[:3]) for row in rows], next_cursor
+
+# Get the versions of a song and of its artist, for its ETag (None if it does not exist)
+async def get_song_versions(db: AsyncSession, song_id: int) -> Optional[tuple]:
+    row = (await db.execute(_select_song_versions(Song.song_id == song_id))).first()
+    return tuple(row) if row is not None else None
+
+# Stream all the songs (by id) in batches, through a server-side cursor: only a batch is in memory
+async def stream_songs(db: AsyncSession, batch_size: int) -> AsyncIterator[list[SongOutput]]:
+    result = await db.stream(select_songs(order_by=[Song.song_id]).execution_options(yield_per=batch_size))
+    async for partition in result.scalars().partitions():
+        yield [song_to_output(song) for song in partition]
+
+# Get song by ID
+async def get_song_by_id(db: AsyncSession, song_id: int) -> SongOutput:
+    return song_to_output(await _get_song_or_error(db, song_id))
+
+# Get all songs
+async def get_all_songs(db: AsyncSession) -> list[SongOutput]:
+    return await _get_songs(db)
+
+# Sort songs alphabetically
+async def sort_songs_alphabetically(db: AsyncSession, ascending: bool = True) -> list[SongOutput]:
+    return await _get_songs(db, Song.title.asc() if ascending else Song.title.desc())
+
+# Sort songs by release date
+async def sort_songs_by_release_date(db: AsyncSession, ascending: bool = True) -> list[SongOutput]:
+    return await _get_songs(db, Song.release_date.asc() if ascending else Song.release_date.desc())
+
+# Create a song (the writes run the sync implementation on the connection of the session)
+async def create_song(db: AsyncSession, song_data: SongInput) -> SongOutput:
+    return await db.run_sync(create_song_sync, song_data)
+
+# Update a song
+async def update_song(db: AsyncSession, song_id: int, song_data: SongInput) -> SongOutput:
+    return await db.run_sync(update_song_sync, song_id, song_data)
+
+# Delete a song
+async def delete_song(db: AsyncSession, song_id: int) -> SongOutput:
+    return await db.run_sync(delete_song_sync, song_id)
+
+# Check if the artist of a user is the owner of a song
+async def is_user_owner_song(db: AsyncSession, user_id: int, song_id: int):
+    song = await _get_song_or_error(db, song_id)
+    if song.artist.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not the owner of this song")
+
+# Check if a user is an artist
+async def is_user_artist(db: AsyncSession, user_id: int):
+    role = (await db.execute(select(User.role).where(User.id == user_id))).scalar_one_or_none()
+    if role != RoleEnum.artist:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not an artist")
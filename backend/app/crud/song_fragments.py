@@ -0,0 +1,117 @@
+""" Pre-serialized JSON of the songs, so the listings are sent without building and validating their models.
+
+The fragments are stored by song id with the version of the song and the version of its artist's
+user (see get_songs_page_versions): a change of the song, of its sources or of the artist username
+bumps one of them, so a changed song is never served from an old fragment. The fragments of the
+changed and deleted songs are also dropped once the change is committed (the ids of deleted songs
+may be reused).
+"""
+from typing import Sequence
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+from core.cache import create_cache_backend
+from crud.song import select_songs, song_to_output
+from models.song import Song, SongSource
+from models.user import User
+import os
+import threading
+
+# Backend of the fragments (see core.cache). Being versioned, they do not need to be shared.
+SONG_FRAGMENT_CACHE_URL = os.getenv("SONG_FRAGMENT_CACHE_URL", "memory://")
+
+# Maximum cached fragments (enough for the whole catalog keeps the full listings out of the database)
+SONG_FRAGMENT_CACHE_SIZE = int(os.getenv("SONG_FRAGMENT_CACHE_SIZE", "50000"))
+
+_fragments = create_cache_backend(SONG_FRAGMENT_CACHE_URL, SONG_FRAGMENT_CACHE_SIZE)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _fragment_key(song_id: int) -> str:
+    return f"song_json:{song_id}"
+
+
+def render_songs(fragments: Sequence[str]) -> str:
+    """ JSON array of the given song fragments. """
+    return "[" + ",".join(fragments) + "]"
+
+
+async def get_song_fragments(db: AsyncSession, versions: Sequence[tuple]) -> list[str]:
+    """
+    Get the JSON of the songs from the fragment cache, serializing (and caching) the missing ones.
+
+    Args:
+        db (AsyncSession): The database session.
+        versions (Sequence[tuple]): (song id, song version, user version) of the songs, in order.
+
+    Returns:
+        list[str]: The JSON of the songs, in the same order. Songs deleted since their versions
+        were read are skipped.
+    """
+    cached = _fragments.get_many(_fragment_key(row[0]) for row in versions)
+    by_id = {}
+    for song_id, song_version, user_version in versions:
+        entry = cached.get(_fragment_key(song_id))
+        if entry is not None and entry[0] == song_version and entry[1] == user_version:
+            by_id[song_id] = entry[2]
+    with _lock:
+        _stats["hits"] += len(by_id)
+        _stats["misses"] += len(versions) - len(by_id)
+
+    # The missing songs are loaded in one go. One changed since its versions were read is sent as
+    # it is now (and cached with its new versions).
+    missing = [row[0] for row in versions if row[0] not in by_id]
+    if missing:
+        songs = (await db.execute(select_songs(Song.song_id.in_(missing)))).scalars().all()
+        for song in songs:
+            fragment = song_to_output(song).model_dump_json()
+            _fragments.set(_fragment_key(song.song_id), [song.version, song.artist.user.version, fragment])
+            by_id[song.song_id] = fragment
+    return [by_id[row[0]] for row in versions if row[0] in by_id]
+
+
+def invalidate_song_fragments(song_ids: Sequence[int]):
+    for song_id in song_ids:
+        _fragments.delete(_fragment_key(song_id))
+
+
+def song_fragments_stats() -> dict:
+    with _lock:
+        return {"backend": _fragments.stats(), **_stats}
+
+
+# The changed songs are collected while flushing and their fragments dropped once committed. Deleting
+# a user drops them all, as its songs may be deleted by the database (without ORM events).
+def _track_song_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("song_fragments_changed", set()).add(target.song_id)
+
+
+def _track_user_delete(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["song_fragments_cleared"] = True
+
+
+for event_name in ("after_update", "after_delete"):
+    event.listen(Song, event_name, _track_song_change)
+for event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(SongSource, event_name, _track_song_change)
+event.listen(User, "after_delete", _track_user_delete)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    song_ids = session.info.pop("song_fragments_changed", ())
+    if session.info.pop("song_fragments_cleared", False):
+        _fragments.clear()
+    else:
+        invalidate_song_fragments(song_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("song_fragments_changed", None)
+    session.info.pop("song_fragments_cleared", None)
@@ -1,28 +1,40 @@
 """ User related CRUD methods """
+from datetime import datetime
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from models.user import User, UserInput, UserLogin, UserUpdate, RoleEnum
-from core.security import get_password_hash, verify_password, create_access_token
+from core.security import get_password_hash, verify_password, create_access_token, decode_access_token, EXPIRE_DELTA
+from core.sessions import STATELESS_SESSIONS, new_session_id, revoke_session, revoke_user_sessions
 from fastapi import HTTPException, status
-from crud.listener import create_listener
-from crud.artist import create_artist
-
-# User creation
-def create_user(db: Session, user_input: UserInput) -> User:
+from crud.listener import get_listener_by_user_id, get_followed_artists
+from crud.artist_stats import rebuild_artist_stats
+from models.question import Question
+from models.artist import Artist, ArtistStats
+from models.listener import Listener
+from models.playlist import playlist_songs
+from models.song import Song
+from crud.playlist import bump_playlists_with_songs
+
+# Check that the username and the email are not taken by another user
+def check_user_available(db: Session, username: str, email: str, user_id: int = None):
     # Check if username already exists
-    existing_user_by_username = db.query(User).filter(User.username == user_input.username).first()
-    if existing_user_by_username:
+    existing_user_by_username = db.query(User).filter(User.username == username).first()
+    if existing_user_by_username and existing_user_by_username.id != user_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists.")
 
     # Check if email already exists
-    existing_user_by_email = db.query(User).filter(User.email == user_input.email).first()
-    if existing_user_by_email:
+    existing_user_by_email = db.query(User).filter(User.email == email).first()
+    if existing_user_by_email and existing_user_by_email.id != user_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists.")
 
-    # If validation passes, create the user
+# Save a new user (already checked) with the hash of its password, and its role object in the same
+# transaction. The async routes hash the password in the hashing pool first (see crud.user_async).
+def add_user(db: Session, user_input: UserInput, hashed_password: str) -> User:
     user = User(
         username=user_input.username,
         email=user_input.email,
-        hashed_password=get_password_hash(user_input.password),
+        hashed_password=hashed_password,
         description=user_input.description,
         genre=user_input.genre,
         visibility=user_input.visibility,
@@ -30,17 +42,24 @@ def create_user(db: Session, user_input: UserInput) -> User:
         image_url=str(user_input.image_url) if user_input.image_url else None
     )
     db.add(user)
-    db.commit()
 
     # Create role object
     if user_input.role == RoleEnum.listener:
-        create_listener(db, user)
+        db.add(Listener(user=user))
     elif user_input.role == RoleEnum.artist:
-        create_artist(db, user)
+        db.add(Artist(user=user, name=user.username, genre=user.genre, stats=ArtistStats()))
 
+    db.commit()
     db.refresh(user)
     return user
 
+# User creation
+def create_user(db: Session, user_input: UserInput) -> User:
+    check_user_available(db, user_input.username, user_input.email)
+
+    # If validation passes, create the user
+    return add_user(db, user_input, get_password_hash(user_input.password))
+
 # Get user by username
 def get_user_by_username(db: Session, username: str) -> User:
     user = db.query(User).filter(User.username == username).first()
@@ -56,31 +75,27 @@ def get_user_by_email(db: Session, email: str) -> User:
 def get_user_by_id(db: Session, user_id: int) -> User:
     return db.query(User).filter(User.id == user_id).first()
 
-# Update user by username
-def update_user(db: Session, user: User, user_update: UserUpdate) -> User:
-    
-    # Check if username already exists
-    existing_user_by_username = db.query(User).filter(User.username == user_update.username).first()
-    if existing_user_by_username and user.id != existing_user_by_username.id:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists.")
-
-    # Check if email already exists
-    existing_user_by_email = db.query(User).filter(User.email == user_update.email).first()
-    if existing_user_by_email and user.id != existing_user_by_email.id:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists.")
-
-    # If validation passes, update the user
+# Save the update of a user (already checked), with the hash of its new password if it changes
+def save_user_update(db: Session, user: User, user_update: UserUpdate, hashed_password: str = None) -> User:
     update_data = user_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(user, key, value)
 
-    if user_update.password:
-        user.hashed_password = get_password_hash(user_update.password)
+    if hashed_password:
+        user.hashed_password = hashed_password
 
     db.commit()
     db.refresh(user)
     return user
 
+# Update user by username
+def update_user(db: Session, user: User, user_update: UserUpdate) -> User:
+    check_user_available(db, user_update.username, user_update.email, user.id)
+
+    # If validation passes, update the user
+    hashed_password = get_password_hash(user_update.password) if user_update.password else None
+    return save_user_update(db, user, user_update, hashed_password)
+
 # Authenticate user, returning a valid access token, if possible
 def authenticate(db: Session, user_login: UserLogin) -> str:
     user = get_user_by_email(db, user_login.email)
@@ -89,6 +104,11 @@ def authenticate(db: Session, user_login: UserLogin) -> str:
     if not verify_password(user_login.password, user.hashed_password):
         raise ValueError('Incorrect password.')
     
+    # Stateless sessions: a new session, nothing is written (the token is only set in the object)
+    if STATELESS_SESSIONS:
+        set_committed_value(user, "token", create_access_token(user.id, session_id=new_session_id()))
+        return user
+
     # Create token
     token = create_access_token(user.id)
 
@@ -98,9 +118,13 @@ def authenticate(db: Session, user_login: UserLogin) -> str:
     
     return user
 
-# Deauthenticate user, invalidating its current access token
-def deauthenticate(db: Session, user: User):
-    user.token = None
+# Deauthenticate user, invalidating its current access token (its session, if it is stateless)
+def deauthenticate(db: Session, user: User, token: str = None):
+    token_data = decode_access_token(token) if STATELESS_SESSIONS and token else None
+    if token_data and token_data.sid:
+        revoke_session(db, token_data)
+    else:
+        user.token = None
     db.commit()
 
 # Function to delete a user's account
@@ -110,9 +134,28 @@ def delete_user_account(db: Session, user: User):
     if not user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Account not found.")
 
-    # Delete the user account
+    # Artists whose counters include the follows and questions of the user
+    artist_ids = set()
+    listener = get_listener_by_user_id(db, user.id)
+    if listener:
+        artist_ids.update(get_followed_artists(db, listener.listener_id))
+        artist_ids.update(artist_id for artist_id, in db.query(Question.artist_id).filter(
+            Question.listener_id == listener.listener_id).distinct())
+
+    # Delete the user account, revoking all its sessions
+    if STATELESS_SESSIONS:
+        revoke_user_sessions(db, user.id, datetime.utcnow() + EXPIRE_DELTA)
     deauthenticate(db, user)
+    # The songs of an artist are deleted in cascade, and leave their playlists
+    db.execute(bump_playlists_with_songs(playlist_songs.c.song_id.in_(
+        select(Song.song_id).join(Artist, Artist.artist_id == Song.artist_id).where(Artist.user_id == user.id))))
     db.delete(user)
+    db.flush()
+
+    # The follows and questions were deleted in cascade, resync the counters of their artists
+    # in the same transaction
+    if artist_ids:
+        rebuild_artist_stats(db, list(artist_ids), commit=False)
     db.commit()
     return {"detail": "Account deleted successfully"}
 
@@ -0,0 +1,42 @@
+""" User related CRUD methods (async) """
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from models.user import User, UserInput, UserUpdate
+from core.security import get_password_hash_async
+from crud.user import check_user_available, add_user, save_user_update
+
+# Get the user with the given value of a column
+async def _get_user_by(db: AsyncSession, column, value) -> User:
+    return (await db.execute(select(User).where(column == value))).scalar_one_or_none()
+
+# User creation (the writes run the sync implementation on the connection of the session)
+async def create_user(db: AsyncSession, user_input: UserInput) -> User:
+    await db.run_sync(check_user_available, user_input.username, user_input.email)
+
+    # If validation passes, create the user (hashing the password in the hashing pool)
+    return await db.run_sync(add_user, user_input, await get_password_hash_async(user_input.password))
+
+# Get user by username
+async def get_user_by_username(db: AsyncSession, username: str) -> User:
+    user = await _get_user_by(db, User.username, username)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
+    return user
+
+# Get the version of a user, for its ETag (None if it does not exist)
+async def get_user_version(db: AsyncSession, username: str):
+    return (await db.execute(select(User.version).where(User.username == username))).scalar_one_or_none()
+
+# Get user by id
+async def get_user_by_id(db: AsyncSession, user_id: int) -> User:
+    return await db.get(User, user_id)
+
+# Update user by id
+async def update_user(db: AsyncSession, user_id: int, user_update: UserUpdate) -> User:
+    user = await get_user_by_id(db, user_id)
+    await db.run_sync(check_user_available, user_update.username, user_update.email, user.id)
+
+    # If validation passes, update the user
+    hashed_password = await get_password_hash_async(user_update.password) if user_update.password else None
+    return await db.run_sync(save_user_update, user, user_update, hashed_password)
@@ -1,12 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from core.lifespan import lifespan
+from core.sql_metrics import SQLMetricsMiddleware
 from core.config import engine
 from core.config import Base
-from routes import user, test, login, question, listener, artist, song, playlist, metrics
+from core.schema import create_schema
+from routes import user, test, login, question, listener, artist, song, playlist, metrics, internal
 # Importing them ensures SQLAlchemy creates their tables.
 from models.user import User, ListenerArtistLink  # noqa: F401
-from models.artist import Artist  # noqa: F401
+from models.artist import Artist, ArtistStats  # noqa: F401
 from models.listener import Listener # noqa: F401
 from models.question import Question # noqa: F401
 from models.song import Song, SongSource # noqa: F401
@@ -24,11 +26,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["Server-Timing", "X-Next-Cursor", "Link", "ETag"],
 )
 
+# Count the SQL statements of every request (Server-Timing header, budgets per route)
+app.add_middleware(SQLMetricsMiddleware)
 
-# Create the database tables on startup
-Base.metadata.create_all(bind=engine)
+
+# Create the database tables on startup, and the columns and indexes added to the existing ones
+create_schema(engine, Base.metadata)
 
 # Include routers
 app.include_router(user.router, prefix="/users", tags=["Users"])
@@ -40,3 +46,4 @@ app.include_router(artist.router, prefix="/artists", tags=["Artists"])
 app.include_router(song.router, prefix="/songs", tags=["Songs"])
 app.include_router(playlist.router, prefix="/playlist", tags=["Playlist"])
 app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
+app.include_router(internal.router, prefix="/internal", tags=["Internal"], include_in_schema=False)
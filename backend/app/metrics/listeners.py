@@ -3,8 +3,9 @@ from models.playlist import Playlist
 from models.question import Question, ResponseEnum
 from models.artist import Artist
 from pytest import Session
-from crud.listener import check_follow, get_all_listeners, get_sorted_artists, get_listener_by_user_id
+from crud.listener import check_follow, get_sorted_artists, get_listener_by_user_id
 from crud.artist import get_artist_by_username
+from metrics.loyalty import loyalty_leaderboard
 
 
 def loyalty_points(artist: Artist, listener: Listener, db: Session) -> int:
@@ -43,13 +44,8 @@ def loyalty_points(artist: Artist, listener: Listener, db: Session) -> int:
 
 
 def loyalty_sorted_listeners(artist: Artist, db: Session) -> list:
-    # Get all listeners and their loyalty points
-    listeners = [[listener.user.username, loyalty_points(artist, listener, db)] for listener in get_all_listeners(db)]
-
-    # Sort in descending order of loyalty points
-    sorted_listeners = sorted(listeners, key=lambda x: x[1], reverse=True)
-
-    return sorted_listeners
+    # Get all listeners and their loyalty points, sorted in descending order (batch computation)
+    return loyalty_leaderboard(artist, db)
 
 
 def get_listener_loyalty_data(artist: Artist, listener: Listener, db: Session):
@@ -72,7 +68,7 @@ def get_listener_loyalty_data(artist: Artist, listener: Listener, db: Session):
 def get_preferences(db: Session, user_id: int):
     from models.artist import ArtistOutput
     from models.user import User
-    from metrics.artists import rank_data
+    from metrics.ranking import get_ranking_snapshot
     from crud.question import can_question
 
     sorted_artist = get_sorted_artists(db, user_id)
@@ -82,7 +78,8 @@ def get_preferences(db: Session, user_id: int):
 
     listener = get_listener_by_user_id(db, user_id) if user_id else None
 
-
+    # Rank all artists at once instead of once per artist (from the ranking snapshot)
+    ranking_table = get_ranking_snapshot(db, [artist.user.username for artist in sorted_artist])
 
     return [
         ArtistOutput(
@@ -93,7 +90,7 @@ def get_preferences(db: Session, user_id: int):
             visibility=artist.user.visibility,
             role=artist.user.role,
             image_url=artist.user.image_url,
-            rank_data=rank_data(artist.user.username, db),
+            rank_data=ranking_table.get(artist.user.username, {}).get("rank_data"),
             can_ask=can_question(db, listener, get_artist_by_username(db, artist.user.username))if listener else False,
             is_following=check_follow(db, listener, artist.user.username) if listener else False
         )
@@ -0,0 +1,412 @@
+import numpy as np
+from sqlalchemy import case, event, func, inspect
+from sqlalchemy.orm import Session, object_session
+from core.cache import CacheBackend, cache
+from core.config import LOYALTY_CACHE_TTL
+from models.artist import Artist
+from models.listener import Listener
+from models.playlist import Playlist, playlist_songs
+from models.question import Question, ResponseEnum
+from models.song import Song
+from models.user import User, ListenerArtistLink
+import math
+import threading
+import time
+
+
+def _filter_listeners(query, column, listener_ids):
+    return query.filter(column.in_(listener_ids)) if listener_ids is not None else query
+
+
+def loyalty_scores(artist: Artist, db: Session, listener_ids: list = None):
+    """
+    Compute the loyalty points (see metrics.listeners.loyalty_points) of many listeners to an artist
+    with one grouped query per component, combining the components as NumPy arrays.
+
+    Args:
+        artist (Artist): The artist.
+        db (Session): The database session.
+        listener_ids (list): The listeners to score. All the listeners if None.
+
+    Returns:
+        dict: The "listener_id", "user_id", "username" and "points" arrays, ordered by listener id.
+    """
+    # Listeners with their username and favorite genre
+    listeners = _filter_listeners(
+        db.query(Listener.listener_id, Listener.user_id, User.username, User.genre)
+        .join(User, User.id == Listener.user_id),
+        Listener.listener_id, listener_ids
+    ).order_by(Listener.listener_id).all()
+
+    n = len(listeners)
+    ids = np.array([listener.listener_id for listener in listeners], dtype=np.int64)
+    user_ids = np.array([listener.user_id for listener in listeners], dtype=np.int64)
+    usernames = np.array([listener.username for listener in listeners], dtype=object)
+    genres = np.array([listener.genre for listener in listeners], dtype=object)
+    index = {listener.listener_id: i for i, listener in enumerate(listeners)}
+    user_index = {listener.user_id: i for i, listener in enumerate(listeners)}
+
+    # Follows of the artist
+    follows = np.zeros(n, dtype=np.int64)
+    followers = _filter_listeners(
+        db.query(ListenerArtistLink.listener_id).filter(ListenerArtistLink.artist_id == artist.artist_id),
+        ListenerArtistLink.listener_id, listener_ids
+    ).all()
+    for listener_id, in followers:
+        follows[index[listener_id]] = 1
+
+    # Questions to the artist: total, answered and rejected
+    questions = np.zeros(n, dtype=np.int64)
+    answered = np.zeros(n, dtype=np.int64)
+    rejected = np.zeros(n, dtype=np.int64)
+    question_counts = _filter_listeners(
+        db.query(
+            Question.listener_id,
+            func.count(Question.question_id),
+            func.sum(case((Question.response_status == ResponseEnum.answered, 1), else_=0)),
+            func.sum(case((Question.response_status == ResponseEnum.rejected, 1), else_=0))
+        ).filter(Question.artist_id == artist.artist_id),
+        Question.listener_id, listener_ids
+    ).group_by(Question.listener_id).all()
+    for listener_id, total, answered_count, rejected_count in question_counts:
+        i = index[listener_id]
+        questions[i], answered[i], rejected[i] = total, answered_count, rejected_count
+
+    # Share of the artist's songs in every non-empty playlist of the listeners
+    playlist_counts = db.query(
+        Playlist.user_id,
+        func.count(playlist_songs.c.song_id),
+        func.sum(case((Song.artist_id == artist.artist_id, 1), else_=0))
+    ).join(playlist_songs, playlist_songs.c.playlist_id == Playlist.playlist_id) \
+     .join(Song, Song.song_id == playlist_songs.c.song_id) \
+     .group_by(Playlist.playlist_id, Playlist.user_id) \
+     .order_by(Playlist.playlist_id)
+    if listener_ids is not None:
+        playlist_counts = playlist_counts.filter(Playlist.user_id.in_(list(user_index)))
+    playlist_counts = [row for row in playlist_counts.all() if row[0] in user_index]
+
+    playlist_score = np.zeros(n, dtype=np.float64)
+    if playlist_counts:
+        owners = np.array([user_index[user_id] for user_id, _, _ in playlist_counts], dtype=np.int64)
+        songs = np.array([total for _, total, _ in playlist_counts], dtype=np.float64)
+        artist_songs = np.array([int(count) for _, _, count in playlist_counts], dtype=np.float64)
+        # Accumulated in playlist order, as loyalty_points does
+        np.add.at(playlist_score, owners, 50 * artist_songs / songs)
+
+    # Favorite genre matching the artist's genre
+    genre_match = (genres == artist.user.genre).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+
+    # Combine the scores (same order of operations as loyalty_points, so floats round the same)
+    loyalty_score = (5000 * follows + 20 * questions + 1000 * answered - 200 * rejected).astype(np.float64)
+    loyalty_score = loyalty_score + playlist_score + 100 * genre_match
+
+    # Scores as integers (minimum 1000)
+    points = 1000 + np.maximum(np.rint(loyalty_score).astype(np.int64), 0)
+
+    return {
+        "listener_id": ids,
+        "user_id": user_ids,
+        "username": usernames,
+        "points": points
+    }
+
+
+def loyalty_leaderboard(artist: Artist, db: Session) -> list:
+    """
+    Get all the listeners sorted by descending loyalty to an artist (ties keep the listener id order).
+
+    Returns:
+        list: [username, loyalty points] pairs.
+    """
+    scores = loyalty_scores(artist, db)
+    order = np.argsort(-scores["points"], kind="stable")
+    return [[scores["username"][i], int(scores["points"][i])] for i in order]
+
+
+# Share of the most loyal listeners of an artist that can ask it questions
+TOP_LOYAL_PERCENTAGE = 10
+
+
+def _top_count(listeners_count: int) -> int:
+    # Listeners whose position i (from 1) satisfies int((i-1) / N * 100) < TOP_LOYAL_PERCENTAGE
+    return math.ceil(listeners_count * TOP_LOYAL_PERCENTAGE / 100)
+
+
+def _compute_cutoff(index: dict):
+    """
+    Get the (points, listener id) of the last listener in the top of the leaderboard, which is sorted
+    by descending points and then by listener id (as loyalty_leaderboard).
+    """
+    top = _top_count(len(index["listener_id"]))
+    if top == 0:
+        return None
+    order = np.lexsort((index["listener_id"], -index["points"]))
+    last = order[top - 1]
+    return int(index["points"][last]), int(index["listener_id"][last])
+
+
+# Loyalty indexes of the artists, shared by all the requests of the process. Every index keeps the
+# loyalty points of all the listeners to an artist and the cutoff of its top listeners, so checking
+# a listener is a dictionary lookup. Committed changes mark listeners as dirty and only those are
+# scored again before the next check.
+_indexes = {}
+_pending = {}   # Changes collected for the indexes being built, by artist
+_version = 0    # Increased every time all the indexes are dropped
+_indexes_lock = threading.Lock()
+
+# The committed changes are shared with the other workers through the shared cache: the
+# "loyalty_version" counts them and "loyalty_changes:{n}" keeps the n-th one, so every worker applies
+# them to its own indexes before its next check. A missing version starts from the current time.
+_backend: CacheBackend = cache
+_seen_version = None    # Last shared version applied to the indexes of this process
+# Most shared changes applied one by one, beyond that all the indexes are dropped
+_MAX_SHARED_CHANGES = 1000
+
+
+def _build_index(artist: Artist, db: Session) -> dict:
+    index = loyalty_scores(artist, db)
+    index["position"] = {int(listener_id): i for i, listener_id in enumerate(index["listener_id"])}
+    index["by_user"] = {int(user_id): int(listener_id)
+                        for user_id, listener_id in zip(index["user_id"], index["listener_id"])}
+    index["cutoff"] = _compute_cutoff(index)
+    index["dirty"] = set()
+    index["dirty_users"] = set()
+    index["built_at"] = time.monotonic()
+    return index
+
+
+def _refresh_index(artist: Artist, db: Session, index: dict):
+    """
+    Score again the dirty listeners of an index (new, changed or deleted) and recompute its cutoff.
+    """
+    with _indexes_lock:
+        dirty = index["dirty"] | {index["by_user"].get(user_id, -1) for user_id in index["dirty_users"]}
+        index["dirty"], index["dirty_users"] = set(), set()
+    dirty.discard(-1)
+
+    scores = loyalty_scores(artist, db, list(dirty))
+    scored = {int(listener_id): i for i, listener_id in enumerate(scores["listener_id"])}
+
+    with _indexes_lock:
+        position = index["position"]
+        known = [i for listener_id, i in scored.items() if listener_id in position]
+        new = [i for listener_id, i in scored.items() if listener_id not in position]
+        removed = {listener_id for listener_id in dirty if listener_id in position and listener_id not in scored}
+
+        # Update the points of the listeners already in the index
+        if known:
+            rows = [position[int(scores["listener_id"][i])] for i in known]
+            index["points"][rows] = scores["points"][known]
+
+        # Add the new listeners and drop the deleted ones
+        if new or removed:
+            keep = np.array([int(listener_id) not in removed for listener_id in index["listener_id"]], dtype=bool)
+            for key in ("listener_id", "user_id", "username", "points"):
+                index[key] = np.concatenate((index[key][keep], scores[key][new]))
+            index["position"] = {int(listener_id): i for i, listener_id in enumerate(index["listener_id"])}
+            index["by_user"] = {int(user_id): int(listener_id)
+                                for user_id, listener_id in zip(index["user_id"], index["listener_id"])}
+
+        index["cutoff"] = _compute_cutoff(index)
+
+
+def _shared_version() -> int:
+    version = _backend.get("loyalty_version")
+    if version is None:
+        _backend.add("loyalty_version", time.time_ns())
+        version = _backend.get("loyalty_version")
+    return version
+
+
+def _publish_loyalty_changes(changes: set):
+    """
+    Share changes committed in this process with the other workers.
+    """
+    global _seen_version
+    _shared_version()
+    version = _backend.incr("loyalty_version")
+    if version is None:
+        return
+    _backend.set(f"loyalty_changes:{version}", [list(change) if isinstance(change, tuple) else change
+                                               for change in changes], LOYALTY_CACHE_TTL)
+
+    # Already applied here (unless another worker published a change in between)
+    with _indexes_lock:
+        if _seen_version == version - 1:
+            _seen_version = version
+
+
+def _sync_shared_changes():
+    """
+    Apply the changes committed by the other workers since the last check (a single cache read if
+    there are none). All the indexes are dropped if some of the changes is not in the cache anymore.
+    """
+    global _seen_version
+    version = _shared_version()
+    with _indexes_lock:
+        seen = _seen_version
+    if seen == version:
+        return
+
+    if seen is not None:
+        lost = not seen < version <= seen + _MAX_SHARED_CHANGES
+        if not lost:
+            keys = [f"loyalty_changes:{n}" for n in range(seen + 1, version + 1)]
+            shared = _backend.get_many(keys)
+            lost = len(shared) < len(keys)
+
+        if lost:
+            invalidate_loyalty_indexes()
+        else:
+            _apply_loyalty_changes({tuple(change) if isinstance(change, list) else change
+                                    for changes in shared.values() for change in changes})
+
+    with _indexes_lock:
+        if _seen_version == seen:
+            _seen_version = version
+
+
+def _get_index(artist: Artist, db: Session) -> dict:
+    _sync_shared_changes()
+    with _indexes_lock:
+        index = _indexes.get(artist.artist_id)
+        version = _version
+
+    if index is None or time.monotonic() - index["built_at"] >= LOYALTY_CACHE_TTL:
+        # Collect the changes committed while the index is built
+        pending = {"dirty": set(), "dirty_users": set()}
+        with _indexes_lock:
+            _pending.setdefault(artist.artist_id, []).append(pending)
+        try:
+            index = _build_index(artist, db)
+        finally:
+            with _indexes_lock:
+                _pending[artist.artist_id].remove(pending)
+                if not _pending[artist.artist_id]:
+                    del _pending[artist.artist_id]
+
+        with _indexes_lock:
+            index["dirty"] |= pending["dirty"]
+            index["dirty_users"] |= pending["dirty_users"]
+            # Do not keep it if all the indexes were dropped while building it
+            if version == _version:
+                _indexes[artist.artist_id] = index
+
+    if index["dirty"] or index["dirty_users"]:
+        _refresh_index(artist, db, index)
+
+    return index
+
+
+def invalidate_loyalty_indexes():
+    """
+    Drop the loyalty indexes of all the artists. They are rebuilt on their next check.
+    """
+    global _version
+    with _indexes_lock:
+        _indexes.clear()
+        _version += 1
+
+
+def is_top_loyal_listener(artist: Artist, listener: Listener, db: Session) -> bool:
+    """
+    Decide if a listener is in the top TOP_LOYAL_PERCENTAGE of the listeners of an artist by loyalty
+    points, i.e. if get_listener_loyalty_data(...)["percentage"] < TOP_LOYAL_PERCENTAGE, from the
+    loyalty index of the artist.
+    """
+    index = _get_index(artist, db)
+    with _indexes_lock:
+        row = index["position"].get(listener.listener_id)
+        if row is None or index["cutoff"] is None:
+            return False
+        points = int(index["points"][row])
+        cutoff_points, cutoff_listener_id = index["cutoff"]
+
+    return points > cutoff_points or (points == cutoff_points and listener.listener_id <= cutoff_listener_id)
+
+
+def mark_loyalty_changed(db: Session, user_id: int):
+    """
+    Mark the loyalty of a user's listener to every artist as changed (e.g. a song added to one of its
+    playlists). It is applied to the loyalty indexes once the session commits.
+    """
+    db.info.setdefault("loyalty_changes", set()).add(("user", user_id, None))
+
+
+def _apply_loyalty_changes(changes: set):
+    if "all" in changes:
+        invalidate_loyalty_indexes()
+        return
+
+    with _indexes_lock:
+        targets = list(_indexes.items())
+        targets += [(artist_id, pending) for artist_id, pendings in _pending.items() for pending in pendings]
+        for artist_id, target in targets:
+            for kind, key, change_artist_id in changes:
+                if change_artist_id is not None and change_artist_id != artist_id:
+                    continue
+                target["dirty" if kind == "listener" else "dirty_users"].add(key)
+
+
+# Changes to these tables change the loyalty points. They are tracked per session and applied
+# to the loyalty indexes once the change is committed.
+def _track_change(target, change):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("loyalty_changes", set()).add(change)
+
+
+def _track_listener_artist(mapper, connection, target):
+    # Follows and questions change the loyalty of a listener to a single artist
+    _track_change(target, ("listener", target.listener_id, target.artist_id))
+
+
+def _track_listener(mapper, connection, target):
+    # New (or deleted) listeners change the leaderboard of every artist
+    _track_change(target, ("listener", target.listener_id, None))
+
+
+def _track_playlist(mapper, connection, target):
+    _track_change(target, ("user", target.user_id, None))
+
+
+def _track_user(mapper, connection, target):
+    # The favorite genre of listeners and artists is part of the loyalty points
+    if inspect(target).attrs.genre.history.has_changes():
+        _track_change(target, "all")
+
+
+def _track_all(mapper, connection, target):
+    _track_change(target, "all")
+
+
+def _track_song(mapper, connection, target):
+    # Songs in playlists moved to another artist
+    if inspect(target).attrs.artist_id.history.has_changes():
+        _track_change(target, "all")
+
+
+for model in (Question, ListenerArtistLink):
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(model, event_name, _track_listener_artist)
+for event_name in ("after_insert", "after_delete"):
+    event.listen(Listener, event_name, _track_listener)
+event.listen(Playlist, "after_delete", _track_playlist)
+event.listen(User, "after_update", _track_user)
+event.listen(User, "after_delete", _track_all)
+event.listen(Artist, "after_delete", _track_all)
+event.listen(Song, "after_update", _track_song)
+event.listen(Song, "after_delete", _track_all)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    changes = session.info.pop("loyalty_changes", None)
+    if changes:
+        _apply_loyalty_changes(changes)
+        _publish_loyalty_changes(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("loyalty_changes", None)
@@ -0,0 +1,215 @@
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+from core.config import SessionLocal, RANKING_CACHE_TTL
+from core.single_flight import single_flight, shared_flight
+from crud.artist_stats import empty_artist_stats, engagement_score, get_artist_stats, reply_rate
+from models.artist import Artist, ArtistStats
+from models.question import Question
+from models.user import User, RoleEnum, ListenerArtistLink
+import threading
+import time
+
+
+# Ranking tiers: (first rank, last rank) of every tier. The last tier is open-ended.
+TIERS = {
+    0: (1, 9),
+    1: (10, 50),
+    2: (51, 99),
+    3: (100, 999),
+    4: (1000, None)
+}
+
+
+def _stats_to_metrics(stats: ArtistStats) -> dict:
+    return {
+        "artist_id": stats.artist_id,
+        "answered": stats.answered,
+        "rejected": stats.rejected,
+        "waiting": stats.waiting,
+        "total_questions": stats.total_questions,
+        "followers": stats.followers,
+        "reply_rate": reply_rate(stats.answered, stats.rejected, stats.waiting),
+        "engagement_score": stats.engagement_score
+    }
+
+
+def get_artist_metrics(db: Session, artist: Artist) -> dict:
+    """
+    Get the engagement metrics of a single artist: answered, rejected, waiting and total questions,
+    followers, reply rate and engagement score.
+    """
+    return _stats_to_metrics(get_artist_stats(db, artist))
+
+
+def tier_data(ranking: int, artists_count: int) -> dict:
+    """
+    Get the tier of a ranking and the percentage position of the ranking within the tier.
+    """
+    for tier, (start, end) in TIERS.items():
+        # Tier 4 includes all artists beyond rank 1000
+        if end is None:
+            end = artists_count if artists_count >= 1000 else float("inf")
+
+        if start <= ranking <= end:
+            # Calculate percentage position within the tier
+            range_size = end - start + 1
+            percentage = ((ranking - start) / range_size) * 100
+            return {
+                "ranking": ranking,
+                "tier": tier,
+                "percentage": int(percentage)
+            }
+
+    # This should not be reached if tiers are correctly defined
+    raise ValueError("Could not determine the tier for the ranking.")
+
+
+def get_ranking_table(db: Session) -> dict:
+    """
+    Rank all the artists by engagement score in a single query over the artist_stats table.
+
+    Artists with the same score share the same ranking (SQL RANK window function). An artist
+    without an artist_stats row yet is ranked with empty counters (it is not written here).
+
+    Returns:
+        dict: The metrics of every artist, along with its rank_data, indexed by username.
+    """
+    score = func.coalesce(ArtistStats.engagement_score, engagement_score(0, 0, 0, 0, 0))
+    rows = db.query(
+        Artist.artist_id,
+        ArtistStats,
+        User.username,
+        func.rank().over(order_by=score.desc()).label("ranking"),
+        func.count().over().label("artists_count")
+    ).select_from(Artist) \
+     .join(User, User.id == Artist.user_id) \
+     .outerjoin(ArtistStats, ArtistStats.artist_id == Artist.artist_id) \
+     .filter(User.role == RoleEnum.artist).all()
+
+    table = {}
+    for artist_id, stats, username, ranking, artists_count in rows:
+        data = _stats_to_metrics(stats if stats is not None else empty_artist_stats(artist_id))
+        data["username"] = username
+        data["ranking"] = ranking
+        data["rank_data"] = tier_data(ranking, artists_count)
+        table[username] = data
+
+    return table
+
+
+# Ranking snapshot shared by all the requests of the process
+_snapshot = {
+    "table": None,          # Last ranking table built
+    "built_at": 0.0,        # When the last table was built
+    "built_version": -1,    # Version of the data the last table was built from
+    "version": 0,           # Current version of the data, increased on every committed change
+    "refreshing": False     # Whether a background rebuild is running
+}
+_snapshot_lock = threading.Lock()
+
+
+def invalidate_ranking_snapshot():
+    """
+    Mark the ranking snapshot as stale. It keeps being served until it is rebuilt.
+    """
+    with _snapshot_lock:
+        _snapshot["version"] += 1
+
+
+def is_ranking_snapshot_fresh() -> bool:
+    with _snapshot_lock:
+        return _is_fresh()
+
+
+def _is_fresh() -> bool:
+    return (
+        _snapshot["table"] is not None
+        and _snapshot["built_version"] == _snapshot["version"]
+        and time.monotonic() - _snapshot["built_at"] < RANKING_CACHE_TTL
+    )
+
+
+def _rebuild_snapshot(db: Session) -> dict:
+    with _snapshot_lock:
+        version = _snapshot["version"]
+
+    table = shared_flight("ranking_table", lambda: get_ranking_table(db))
+
+    with _snapshot_lock:
+        # Do not replace a snapshot built from newer data
+        if version >= _snapshot["built_version"]:
+            _snapshot["table"] = table
+            _snapshot["built_at"] = time.monotonic()
+            _snapshot["built_version"] = version
+    return table
+
+
+def refresh_ranking_snapshot(db: Session) -> dict:
+    """
+    Rebuild the ranking snapshot and return it.
+
+    Concurrent rebuilds share a single one: the requests which find the snapshot cold wait for
+    the rebuild in flight in the worker (and, with SINGLE_FLIGHT_SHARED, for the one of another
+    worker) instead of ranking the artists again.
+    """
+    return single_flight("ranking_snapshot", lambda: _rebuild_snapshot(db))
+
+
+def _refresh_in_background():
+    db = SessionLocal()
+    try:
+        refresh_ranking_snapshot(db)
+    finally:
+        db.close()
+        with _snapshot_lock:
+            _snapshot["refreshing"] = False
+
+
+def get_ranking_snapshot(db: Session, usernames: list = None) -> dict:
+    """
+    Get the ranking table of all the artists (see get_ranking_table) from the in-process snapshot.
+
+    A stale snapshot (older than RANKING_CACHE_TTL or invalidated by a change in the follows or
+    questions) is still returned while it is rebuilt in the background, so readers never wait
+    for a rebuild. The table is only built in the request if there is no snapshot yet or if it
+    lacks some of the given usernames (e.g. a new artist).
+    """
+    with _snapshot_lock:
+        table = _snapshot["table"]
+
+    if table is None or any(username not in table for username in usernames or []):
+        return refresh_ranking_snapshot(db)
+
+    with _snapshot_lock:
+        start_refresh = not _is_fresh() and not _snapshot["refreshing"]
+        if start_refresh:
+            _snapshot["refreshing"] = True
+
+    if start_refresh:
+        threading.Thread(target=_refresh_in_background, daemon=True).start()
+
+    return table
+
+
+# Changes to these tables change the ranking. They are tracked per session and the snapshot
+# is invalidated once the change is committed, so the rebuild can see it.
+def _track_ranking_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["ranking_changed"] = True
+
+
+for model in (Question, ListenerArtistLink, Artist, ArtistStats):
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(model, event_name, _track_ranking_change)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("ranking_changed", False):
+        invalidate_ranking_snapshot()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("ranking_changed", None)
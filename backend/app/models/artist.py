@@ -22,6 +22,22 @@ class Artist(Base):
     # Relationship with Songs
     songs = relationship("Song", back_populates="artist", cascade="all, delete-orphan")
 
+    # Relationship with the ArtistStats table
+    stats = relationship("ArtistStats", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+
+# Denormalized follow and question counters of an artist (kept in sync by the CRUD methods)
+class ArtistStats(Base):
+    __tablename__ = "artist_stats"
+
+    artist_id = Column(Integer, ForeignKey('artists.artist_id', ondelete="CASCADE"), primary_key=True)
+    followers = Column(Integer, default=0, nullable=False)
+    answered = Column(Integer, default=0, nullable=False)
+    rejected = Column(Integer, default=0, nullable=False)
+    waiting = Column(Integer, default=0, nullable=False)
+    total_questions = Column(Integer, default=0, nullable=False)
+    engagement_score = Column(Integer, default=1000, nullable=False, index=True)
+
 
 # Pydantic model for the response
 class ArtistOutput(UserOutput):
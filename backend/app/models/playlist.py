@@ -4,6 +4,7 @@ from sqlalchemy.orm import relationship
 from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
 from core.config import Base
+from core.versioning import track_versions
 import enum
 
 # Enum for playlist visibility
@@ -29,6 +30,7 @@ class Playlist(Base):
     description = Column(String, nullable=True)
     visibility = Column(Enum(VisibilityEnum), default=VisibilityEnum.public)
     user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationship with User
     user = relationship("User", back_populates="playlists")
@@ -36,6 +38,10 @@ class Playlist(Base):
     # Relationship with Song
     songs = relationship("Song", secondary=playlist_songs, back_populates="playlists", order_by=playlist_songs.c.order)
 
+# The version of a playlist changes with its fields and songs. The songs are usually changed with
+# statements on playlist_songs, which bump the version themselves (core.versioning.bump_version).
+track_versions(Playlist)
+
 # Pydantic model for playlist input
 class PlaylistInput(BaseModel):
     name: str
@@ -1,7 +1,8 @@
 """ Models """
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from core.config import Base
+from core.versioning import track_versions
 from pydantic import BaseModel, ConfigDict, HttpUrl
 from typing import Optional, List
 
@@ -15,6 +16,7 @@ class Song(Base):
     genre = Column(String, nullable=True)
     release_date = Column(String, nullable=False)
     artist_id = Column(Integer, ForeignKey('artists.artist_id', ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationship with Artist
     artist = relationship("Artist", back_populates="songs")
@@ -28,18 +30,28 @@ class Song(Base):
                            passive_deletes=True  # Lets the database handle deletions
     )
 
+    # Indexes of the keyset pagination of the sorted listings (sort key, then the song id)
+    __table_args__ = (
+        Index("ix_songs_title_song_id", "title", "song_id"),
+        Index("ix_songs_release_date_song_id", "release_date", "song_id"),
+    )
+
     @property
     def source_urls(self):
         """Return a list of source URLs."""
         return [source.source_url for source in self.sources]
 
 
+# The version of a song changes with its fields and sources (not with the playlists it is in)
+track_versions(Song, ignore=("playlists",))
+
+
 # SongSource table
 class SongSource(Base):
     __tablename__ = "song_sources"
 
     id = Column(Integer, primary_key=True, index=True)
-    song_id = Column(Integer, ForeignKey('songs.song_id', ondelete="CASCADE"), nullable=False)
+    song_id = Column(Integer, ForeignKey('songs.song_id', ondelete="CASCADE"), nullable=False, index=True)
     source_url = Column(String, nullable=False)
 
     # Relationship with Song
@@ -4,6 +4,7 @@ from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from core.config import Base
+from core.versioning import track_versions
 from pydantic import BaseModel, field_validator, HttpUrl
 import re
 import enum
@@ -40,10 +41,25 @@ class User(Base):
     visibility = Column(Enum(VisibilityEnum), default=VisibilityEnum.public)
     role = Column(Enum(RoleEnum), default=None, nullable=True)
     image_url = Column(String, default=None, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationship with Playlist
     playlists = relationship("Playlist", back_populates="user", cascade="all, delete-orphan")
 
+# The version of a user changes with its profile (not with its logins or password)
+track_versions(User, ignore=("token", "hashed_password", "playlists"))
+
+# Sessions revoked in the stateless session mode: a single session (session_id), or every session
+# of a user issued until revoked_at (session_id NULL). Kept until the tokens they revoke expire.
+class RevokedSession(Base):
+    __tablename__ = "revoked_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, nullable=True, unique=True)
+    user_id = Column(Integer, index=True, nullable=False)
+    revoked_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
+
 # Validation mixin class
 class UserValidationMixin(BaseModel):
     # Validator for email field
@@ -86,6 +102,9 @@ class Token(BaseModel):
 # Contents of JWT token
 class TokenPayload(BaseModel):
     sub: int = None
+    sid: Optional[str] = None    # Session id (stateless session mode)
+    iat: Optional[int] = None
+    exp: Optional[int] = None
 
 # Input user for register
 class UserInput(UserLogin):
@@ -2,10 +2,9 @@ from fastapi import APIRouter, Depends
 from pytest import Session
 from core.config import get_db
 from core.security import OptionalCurrentUser
-from crud.artist import get_followers
 from models.artist import ArtistOutput
 from typing import List
-from metrics.artists import engage_artist_score, get_all_artists_with_rank_data
+from metrics.artists import get_all_artists_with_rank_data
 
 
 router = APIRouter()
@@ -25,7 +24,7 @@ def get_artists_engagement(current_user : OptionalCurrentUser , db: Session = De
     Retrieve all the artists from the database by engagement
     """
     artists_list = get_all_artists_with_rank_data(db, current_user.id if current_user else None)
-    artists_list.sort(key=lambda x: engage_artist_score(x.username, db), reverse=True)
+    artists_list.sort(key=lambda x: x.rank_data["ranking"])
     return artists_list
 
 
@@ -34,6 +33,4 @@ def get_artists_followers(current_user : OptionalCurrentUser , db: Session = Dep
     """
     Retrieve all the artists from the database.
     """
-    artists_list = get_all_artists_with_rank_data(db, current_user.id if current_user else None)
-    artists_list.sort(key=lambda x: get_followers(db, x.username), reverse=True)
-    return artists_list
\ No newline at end of file
+    return get_all_artists_with_rank_data(db, current_user.id if current_user else None, sort_by_metric="followers")
\ No newline at end of file
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from core.config import engine, async_engine, replica_engine, async_replica_engine, INTERNAL_STATS_TOKEN
+from core.pool import pool_stats
+from core.hashing import hashing_stats
+from core.user_cache import user_cache_stats
+from core.response_cache import response_cache_stats
+from core.sessions import session_stats
+from core.sql_metrics import sql_stats
+from core.single_flight import single_flight_stats
+from crud.song_fragments import song_fragments_stats
+import os
+import secrets
+
+
+def check_internal_token(x_internal_token: str = Header(None)):
+    # Hidden unless INTERNAL_STATS_TOKEN is set, and only served to the callers sending it
+    if not INTERNAL_STATS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_internal_token is None or not secrets.compare_digest(x_internal_token, INTERNAL_STATS_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal token.")
+
+
+router = APIRouter(dependencies=[Depends(check_internal_token)])
+
+
+@router.get("/stats", response_model=dict)
+def get_internal_stats() -> dict:
+    """
+    Retrieve the internal metrics of this worker process: the state of the database connection pools
+    (and the read replica ones, if any) and their checkout latency, overflow events and timeouts, the
+    password hashing pool, the authenticated user cache, the response cache (its backend, hits, misses
+    and invalidations), the cached JSON of the songs, the coalesced computations (single-flight), the
+    revoked stateless sessions and the SQL statements and database time of every route (with the
+    requests over their budget).
+
+    Every uvicorn worker has its own pools, so the metrics are per worker (see "pid"). The endpoint
+    is disabled unless INTERNAL_STATS_TOKEN is set, and requires it in the X-Internal-Token header.
+
+    Returns:
+        dict: The process id, the metrics of the database pools, of the password hashing pool, of
+        the user, response and song JSON caches, of the single-flight computations, of the session
+        revocation list (None without stateless sessions) and the SQL metrics per route.
+    """
+    pools = {
+        "sync": pool_stats(engine),
+        "async": pool_stats(async_engine.sync_engine)
+    }
+    if replica_engine is not engine:
+        pools["sync_replica"] = pool_stats(replica_engine)
+    if async_replica_engine is not async_engine:
+        pools["async_replica"] = pool_stats(async_replica_engine.sync_engine)
+
+    return {
+        "pid": os.getpid(),
+        "pools": pools,
+        "password_hashing": hashing_stats(),
+        "user_cache": user_cache_stats(),
+        "response_cache": response_cache_stats(),
+        "song_fragments": song_fragments_stats(),
+        "single_flight": single_flight_stats(),
+        "sessions": session_stats(),
+        "sql": sql_stats()
+    }
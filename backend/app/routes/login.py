@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pytest import Session
 from core.config import get_db
-from core.security import CurrentUser
+from fastapi.security import HTTPAuthorizationCredentials
+from core.security import CurrentUser, security
 from models.user import UserLogin, Token
 from crud.user import authenticate, deauthenticate
 
@@ -26,8 +27,9 @@ def login_check_token(user: CurrentUser):
     pass
 
 @router.post("/logout")
-def login_logout(user: CurrentUser, db: Session = Depends(get_db)):
+def login_logout(user: CurrentUser, credentials: HTTPAuthorizationCredentials = Depends(security),
+                 db: Session = Depends(get_db)):
     """
-    User logout, delete access token
+    User logout, delete access token (or revoke its session, with stateless sessions)
     """
-    deauthenticate(db, user)
\ No newline at end of file
+    deauthenticate(db, user, credentials.credentials)
\ No newline at end of file
@@ -6,9 +6,14 @@ from crud.artist import get_followers, get_artist_by_username
 from pytest import Session
 from core.config import get_db
 from core.security import CurrentUser
+from core.response_cache import cached_response
+import os
 
 router = APIRouter()
 
+# Seconds the followers of an artist are served from the response cache (a follow in this worker invalidates them)
+FOLLOWERS_CACHE_TTL = float(os.getenv("FOLLOWERS_CACHE_TTL", "10"))
+
 @router.get("/response_rate", response_model=float)
 def get_artist_reply_rate(artist_name: str, db: Session = Depends(get_db)) -> float:
     """
@@ -42,6 +47,7 @@ def get_artist_engagement_rate(artist_name: str, db: Session = Depends(get_db))
 
 
 @router.get("/followers", response_model=int)
+@cached_response(FOLLOWERS_CACHE_TTL, key=("artist_name",), key_tags=lambda artist_name: [f"followers:{artist_name}"])
 def get_artist_followers(artist_name: str, db: Session = Depends(get_db)) -> int:
     """
     Retrieve and return the total number of followers for an artist.
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
 from pydantic import BaseModel
-from pytest import Session
-from core.config import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import get_async_db
 from core.security import CurrentUser, OptionalCurrentUser
+from core.etag import PRIVATE, PUBLIC, make_etag, not_modified, set_etag
 from typing import List
-from models.playlist import Playlist, PlaylistInput, PlaylistOutput, PlaylistUpdate
-from crud.playlist import (
+from models.playlist import Playlist, PlaylistInput, PlaylistOutput, PlaylistUpdate, VisibilityEnum
+from crud.playlist_async import (
     get_playlist_by_id as get_playlist_by_id_crud,
+    get_playlist_versions as get_playlist_versions_crud,
     get_playlists_by_username as get_playlists_by_username_crud,
     create_playlist as create_playlist_crud,
     update_playlist as update_playlist_crud,
@@ -29,104 +31,121 @@ def transform_playlist_to_output(playlist: Playlist) -> PlaylistOutput:
     )
 
 @router.get("/{playlist_id}", response_model=PlaylistOutput)
-def get_playlist_by_id(
+async def get_playlist_by_id(
     playlist_id: int,
+    request: Request,
+    response: Response,
     current_user: OptionalCurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Retrieve a playlist by ID.
-    """
-    playlist = get_playlist_by_id_crud(db, playlist_id, current_user.id if current_user else None)
+    Retrieve a playlist by ID. Supports If-None-Match (public playlists can be cached by shared caches,
+    private ones only by their owner).
+    """
+    etag, cache_control = None, PRIVATE
+    versions = await get_playlist_versions_crud(db, playlist_id)
+    if versions is not None:
+        version, owner_version, owner_id, visibility = versions
+        public = visibility == VisibilityEnum.public
+        if public or (current_user and current_user.id == owner_id):
+            etag = make_etag("playlist", playlist_id, version, owner_version)
+            cache_control = PUBLIC if public else PRIVATE
+    cached = not_modified(request, etag, cache_control)
+    if cached is not None:
+        return cached
+
+    playlist = await get_playlist_by_id_crud(db, playlist_id, current_user.id if current_user else None)
+    if etag is not None:
+        set_etag(response, etag, cache_control)
     return transform_playlist_to_output(playlist)
 
 @router.get("/user/{username}", response_model=List[PlaylistOutput])
-def get_playlists_by_username(
+async def get_playlists_by_username(
     username: str,
     current_user: OptionalCurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Retrieve a list of playlists by username.
     """
-    playlists = get_playlists_by_username_crud(db, username, current_user.id if current_user else None)
+    playlists = await get_playlists_by_username_crud(db, username, current_user.id if current_user else None)
     return [transform_playlist_to_output(playlist) for playlist in playlists]
 
 @router.post("/", response_model=PlaylistOutput)
-def create_playlist(
+async def create_playlist(
     playlist_data: PlaylistInput,
     current_user: CurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new playlist.
     """
-    playlist = create_playlist_crud(db, playlist_data, current_user.id)
+    playlist = await create_playlist_crud(db, playlist_data, current_user.id)
     return transform_playlist_to_output(playlist)
 
 @router.put("/{playlist_id}", response_model=PlaylistOutput)
-def update_playlist(
+async def update_playlist(
     playlist_id: int,
     update_data: PlaylistUpdate,
     current_user: CurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update an existing playlist.
     """
-    playlist = update_playlist_crud(db, playlist_id, update_data, current_user.id)
+    playlist = await update_playlist_crud(db, playlist_id, update_data, current_user.id)
     return transform_playlist_to_output(playlist)
 
 @router.delete("/{playlist_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_playlist(
+async def delete_playlist(
     playlist_id: int,
     current_user: CurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a playlist by ID.
     """
-    delete_playlist_crud(db, playlist_id, current_user.id)
+    await delete_playlist_crud(db, playlist_id, current_user.id)
     return None
 
 @router.post("/{playlist_id}/song/{song_id}", response_model=PlaylistOutput)
-def add_song_to_playlist(
+async def add_song_to_playlist(
     playlist_id: int,
     song_id: int,
     current_user: CurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Add a song to a playlist.
     """
-    playlist = add_song_to_playlist_crud(db, playlist_id, song_id, current_user.id)
+    playlist = await add_song_to_playlist_crud(db, playlist_id, song_id, current_user.id)
     return transform_playlist_to_output(playlist)
 
 @router.delete("/{playlist_id}/song/{song_id}", response_model=PlaylistOutput)
-def remove_song_from_playlist(
+async def remove_song_from_playlist(
     playlist_id: int,
     song_id: int,
     current_user: CurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Remove a song from a playlist.
     """
-    playlist = remove_song_from_playlist_crud(db, playlist_id, song_id, current_user.id)
+    playlist = await remove_song_from_playlist_crud(db, playlist_id, song_id, current_user.id)
     return transform_playlist_to_output(playlist)
 
 class ReorderSongsRequest(BaseModel):
     song_ids: List[int]  # Ensure this is a list of integers
 
 @router.put("/{playlist_id}/reorder", response_model=PlaylistOutput)
-def reorder_songs_in_playlist(
+async def reorder_songs_in_playlist(
     playlist_id: int,
     reorder_request: ReorderSongsRequest,
     current_user: CurrentUser,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Reorder songs in a playlist.
     """
-    playlist = reorder_songs_in_playlist_crud(db, playlist_id, reorder_request.song_ids, current_user.id)
+    playlist = await reorder_songs_in_playlist_crud(db, playlist_id, reorder_request.song_ids, current_user.id)
     return transform_playlist_to_output(playlist)
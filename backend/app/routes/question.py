@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from pytest import Session
 from core.config import get_db
 from core.security import CurrentUser
-from typing import List
+from typing import List, Optional
 from models.question import ResponseEnum, QuestionModel, QuestionInput, QuestionResponse
+from models.user import RoleEnum
 from crud.question import (
     get_questions_by_listener,
-    get_waiting_questions_by_artist,
+    get_waiting_questions_page,
+    decode_question_cursor,
+    encode_question_cursor,
     submit_question,
     response_question,
     archive_question,
@@ -17,25 +20,45 @@ from crud.artist import get_artist_by_username
 
 router = APIRouter()
     
-@router.get("/", response_model=List[QuestionModel])
-def get_questions(user: CurrentUser, db: Session = Depends(get_db)):
+def _sorted_questions(user: CurrentUser, db: Session, limit: Optional[int] = None, after: Optional[tuple] = None):
     """
-    Retrieve sorted questions for a listener or artist (the user is derived from the Authorization token).
+    Get the sorted questions of a listener or the page of waiting questions of an artist,
+    along with the sort key of the last question if the artist has more.
     """
     try:
         # If the user is a listener, return questions
-        return get_questions_by_listener(db, user.username)
+        return get_questions_by_listener(db, user.username, limit), None
         
     except Exception:
         # If not, try to get questions for an artist
         try:
-            return get_waiting_questions_by_artist(db, user.username)
+            return get_waiting_questions_page(db, user.username, limit, after)
         
         except Exception:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="The user is neither a listener nor an artist."
             )
+
+
+@router.get("/", response_model=List[QuestionModel])
+def get_questions(user: CurrentUser, response: Response, db: Session = Depends(get_db),
+                  limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None):
+    """
+    Retrieve sorted questions for a listener or artist (the user is derived from the Authorization token).
+
+    The waiting questions of an artist can be paginated with `limit` and `cursor`: the cursor of the
+    next page is returned in the X-Next-Cursor header, when there are more questions. A listener only
+    gets the first `limit` questions, without cursors.
+    """
+    if cursor and user.role == RoleEnum.listener:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Only the questions of an artist can be paginated with a cursor.")
+    after = decode_question_cursor(cursor) if cursor else None
+    questions, last = _sorted_questions(user, db, limit, after)
+    if last is not None:
+        response.headers["X-Next-Cursor"] = encode_question_cursor(last)
+    return questions
         
         
 @router.get("/top", response_model=List[QuestionModel])
@@ -43,7 +66,7 @@ def get_top_questions(user: CurrentUser, db: Session = Depends(get_db)):
     """
     Retrieve the first 3 sorted questions for a listener or artist (the user is derived from the Authorization token).
     """
-    return get_questions(user, db)[:3]
+    return _sorted_questions(user, db, limit=3)[0]
 
 
 @router.post("/", response_model=QuestionModel)
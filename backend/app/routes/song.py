@@ -1,26 +1,65 @@
-from fastapi import APIRouter, status, Depends
+from fastapi import APIRouter, status, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from core.config import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import get_db, get_async_db, AsyncSessionLocal, REPLICA_STICKY_SECONDS
+from core.routing import route_session
 from core.security import get_current_user, CurrentUser
-from crud.song import get_song_by_id as get_song_by_id_crud, \
-    get_all_songs as get_all_songs_crud, \
+from core.pagination import PAGE_SIZE, MAX_PAGE_SIZE, set_next_cursor
+from core.etag import make_etag, not_modified, set_etag
+from core.response_cache import cached_response
+from crud.song_async import get_song_by_id as get_song_by_id_crud, \
+    get_songs_page_versions as get_songs_page_versions_crud, \
+    get_song_versions as get_song_versions_crud, \
+    stream_songs as stream_songs_crud, \
     create_song as create_song_crud, \
     update_song as update_song_crud, \
     delete_song as delete_song_crud, \
-    is_artist_owner_song as is_artist_owner_song_crud, \
-    is_user_artist as is_user_artist_crud, \
+    is_user_owner_song as is_user_owner_song_crud, \
+    is_user_artist as is_user_artist_crud
+from crud.song_fragments import get_song_fragments as get_song_fragments_crud, render_songs
+from crud.song import song_to_output, \
     get_recommendations as get_recommendations_crud, \
-    sort_songs_alphabetically as sort_songs_alphabetically_crud, \
-    sort_songs_by_release_date as sort_songs_by_release_date_crud, \
     get_songs_by_artist_engagement_score as get_songs_by_artist_engagement_score_crud, \
     get_songs_by_artist_priority as get_songs_by_artist_priority_crud
-from crud.artist import get_artist_by_user_id
 import models.song as song_model
 import models.user as user_model
-from typing import List
+from typing import List, Literal, Optional
+import csv
+import io
+import os
 
 router = APIRouter()
 
+# Songs fetched (and sent) at a time by the catalog export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Columns of the CSV export (the sources are separated by spaces)
+EXPORT_CSV_FIELDS = ["song_id", "title", "album", "genre", "release_date", "artist_name", "sources"]
+
+# Seconds a song is served from the response cache (its changes in this worker invalidate it before)
+SONG_CACHE_TTL = float(os.getenv("SONG_CACHE_TTL", "60"))
+
+# Get a page of songs in the given order, sending the cursor of the next one in the headers (or all
+# the songs, if unpaginated). The ETag comes from the versions of the songs: a request with the
+# current one gets a 304 before the songs are loaded. The body is assembled from the cached JSON of
+# the songs, without building their models.
+async def _list_songs(request: Request, db: AsyncSession, sort: str, limit: int, cursor: Optional[str],
+                      unpaginated: bool) -> Response:
+    if unpaginated:
+        limit, cursor = None, None
+    versions, next_cursor = await get_songs_page_versions_crud(db, sort, limit=limit, cursor=cursor)
+    etag = make_etag("songs", sort, limit, cursor, versions, next_cursor)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    fragments = await get_song_fragments_crud(db, versions)
+    response = Response(content=render_songs(fragments), media_type="application/json")
+    set_etag(response, etag)
+    set_next_cursor(request, response, next_cursor)
+    return response
+
 # GET /songs/recommendations -> Get song recommendations
 @router.get("/recommendations", response_model=List[song_model.SongOutput])
 def get_recommendations(
@@ -31,47 +70,117 @@ def get_recommendations(
     Recommend 10 songs for the authenticated listener.
     """
     recommendations = get_recommendations_crud(db, current_user)
-    return [transform_song_to_output(song) for song in recommendations]
+    return [song_to_output(song) for song in recommendations]
+
+# Format a batch of exported songs as NDJSON (one JSON object per line) or CSV rows
+def _format_export_batch(songs: list[song_model.SongOutput], export_format: str) -> str:
+    if export_format == "ndjson":
+        return "".join(song.model_dump_json() + "\n" for song in songs)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([song.song_id, song.title, song.album, song.genre, song.release_date, song.artist_name,
+                      " ".join(song.sources)] for song in songs)
+    return buffer.getvalue()
+
+# Export the catalog batch by batch. The generator runs after the route returns, so it opens its own session.
+async def _export_songs(request: Request, export_format: str):
+    if export_format == "csv":
+        yield ",".join(EXPORT_CSV_FIELDS) + "\r\n"
+    async with AsyncSessionLocal() as db:
+        route_session(db, request, REPLICA_STICKY_SECONDS)
+        async for songs in stream_songs_crud(db, EXPORT_BATCH_SIZE):
+            yield _format_export_batch(songs, export_format)
+
+# GET /songs/export -> Stream the whole catalog
+@router.get("/export", response_class=StreamingResponse)
+async def export_songs(
+    request: Request,
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format")
+):
+    """
+    Export every song (by id) as NDJSON or CSV. The catalog is streamed from a server-side cursor,
+    a batch at a time, so the memory used does not grow with its size.
+    """
+    media_type = "application/x-ndjson" if export_format == "ndjson" else "text/csv"
+    headers = {"Content-Disposition": f'attachment; filename="songs.{export_format}"'}
+    return StreamingResponse(_export_songs(request, export_format), media_type=media_type, headers=headers)
 
 # GET /songs -> Retrieve all songs
 @router.get("/", response_model=list[song_model.SongOutput])
 async def retrieve_all_songs(
-    db: Session = Depends(get_db)
+    request: Request,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    unpaginated: bool = Query(False, alias="all"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return get_all_songs_crud(db)
+    """
+    Retrieve the songs by id, a page at a time: the cursor of the next page (if any) is sent in the
+    X-Next-Cursor header. With all=true every song is returned at once. Supports If-None-Match.
+    """
+    return await _list_songs(request, db, "id", limit, cursor, unpaginated)
 
 # GET /songs/{song_id} -> Retrieve song by ID
 @router.get("/{song_id}", response_model=song_model.SongOutput)
+@cached_response(SONG_CACHE_TTL, key=("song_id",), key_tags=lambda song_id: [f"song:{song_id}"],
+                 tags=lambda song, song_id: [f"user:{song['artist_name']}"])
 async def retrieve_song_by_id(
     song_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return get_song_by_id_crud(db, song_id)
+    versions = await get_song_versions_crud(db, song_id)
+    etag = make_etag("song", song_id, versions) if versions is not None else None
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    song = await get_song_by_id_crud(db, song_id)
+    set_etag(response, etag)
+    return song
 
 # GET /songs/sorted/alphabetically
 @router.get("/sorted/alphabetically", response_model=list[song_model.SongOutput])
 async def sort_songs_alphabetically(
-    db: Session = Depends(get_db)
+    request: Request,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    unpaginated: bool = Query(False, alias="all"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return sort_songs_alphabetically_crud(db)
+    """
+    Retrieve the songs sorted by title, a page at a time: the cursor of the next page (if any) is sent in the
+    X-Next-Cursor header. With all=true every song is returned at once. Supports If-None-Match.
+    """
+    return await _list_songs(request, db, "title", limit, cursor, unpaginated)
 
 # GET /songs/sorted/release_date
 @router.get("/sorted/release_date", response_model=list[song_model.SongOutput])
 async def sort_songs_by_release_date(
-    db: Session = Depends(get_db)
+    request: Request,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    unpaginated: bool = Query(False, alias="all"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return sort_songs_by_release_date_crud(db)
+    """
+    Retrieve the songs sorted by release date, a page at a time: the cursor of the next page (if any) is sent in the
+    X-Next-Cursor header. With all=true every song is returned at once. Supports If-None-Match.
+    """
+    return await _list_songs(request, db, "release_date", limit, cursor, unpaginated)
 
 # GET /songs/sorted/engagement_score
 @router.get("/sorted/engagement_score", response_model=list[song_model.SongOutput])
-async def get_songs_by_artist_engagement_score(
+def get_songs_by_artist_engagement_score(
     db: Session = Depends(get_db)
 ):
     return get_songs_by_artist_engagement_score_crud(db)
 
 # GET /songs/sorted/priority
 @router.get("/sorted/priority", response_model=list[song_model.SongOutput])
-async def get_songs_by_artist_priority(
+def get_songs_by_artist_priority(
     db: Session = Depends(get_db),
     current_user: user_model.User = Depends(get_current_user)
 ):
@@ -81,49 +190,35 @@ async def get_songs_by_artist_priority(
 @router.post("/", response_model=song_model.SongOutput)
 async def add_song(
     song_input: song_model.SongInput,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: user_model.User = Depends(get_current_user)
 ):
-    is_user_artist_crud(db, current_user.id)
+    await is_user_artist_crud(db, current_user.id)
 
-    return create_song_crud(db, song_input)
+    return await create_song_crud(db, song_input)
 
 # PUT /songs/{song_id} -> Update a song
 @router.put("/{song_id}", response_model=song_model.SongOutput)
 async def update_song(
     song_id: int,
     song_update: song_model.SongInput,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: user_model.User = Depends(get_current_user)
 ):
-    is_user_artist_crud(db, current_user.id)
-    artist = get_artist_by_user_id(db, current_user.id)
-    is_artist_owner_song_crud(db, artist.artist_id, song_id)
+    await is_user_artist_crud(db, current_user.id)
+    await is_user_owner_song_crud(db, current_user.id, song_id)
 
-    return update_song_crud(db, song_id, song_update)
+    return await update_song_crud(db, song_id, song_update)
 
 # DELETE /songs/{song_id} -> Delete a song
 @router.delete("/{song_id}", status_code=status.HTTP_200_OK)
 async def delete_song(
     song_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: user_model.User = Depends(get_current_user)
 ):
-    is_user_artist_crud(db, current_user.id)
-    artist = get_artist_by_user_id(db, current_user.id)
-    is_artist_owner_song_crud(db, artist.artist_id, song_id)
+    await is_user_artist_crud(db, current_user.id)
+    await is_user_owner_song_crud(db, current_user.id, song_id)
     
-    delete_song_crud(db, song_id)
+    await delete_song_crud(db, song_id)
     return {"message": "Song deleted successfully"}
-
-def transform_song_to_output(song: song_model.Song):
-    return song_model.SongOutput(
-        song_id=song.song_id,
-        title=song.title,
-        album=song.album,
-        genre=song.genre,
-        release_date=song.release_date,
-        artist_name=song.artist.name,
-        sources=song.source_urls
-    )
-
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, status, Depends
+from fastapi import APIRouter, status, Depends, Request, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.security import get_current_user
-from core.config import get_db
+from core.config import get_db, get_async_db
+from core.etag import PRIVATE, make_etag, not_modified, set_etag
 from core.security import CurrentUser
-from crud.user import create_user as create_user_crud, \
+from crud.user_async import create_user as create_user_crud, \
     get_user_by_username as get_user_by_username_crud, \
-    update_user as update_user_crud, \
-    delete_user_account as delete_user_account_crud, \
+    get_user_version as get_user_version_crud, \
+    update_user as update_user_crud
+from crud.user import delete_user_account as delete_user_account_crud, \
     get_role
 import models.user as user_model
 
@@ -15,30 +18,42 @@ router = APIRouter()
 @router.post("/user", response_model=user_model.UserOutput)
 async def add_user(
     user_input: user_model.UserInput,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = create_user_crud(db, user_input)
+    user = await create_user_crud(db, user_input)
     return user_model.UserOutput.model_validate(user)
 
 @router.get("/{username}", response_model=user_model.UserOutput)
 async def get_user_by_username(
     username: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = get_user_by_username_crud(db, username)
+    # The ETag comes from the version of the user: the current one gets a 304 without loading it.
+    # The profile has the email of the user: it is private, neither cached by shared caches nor
+    # stored in the response cache.
+    version = await get_user_version_crud(db, username)
+    etag = make_etag("user", username, version) if version is not None else None
+    cached = not_modified(request, etag, PRIVATE)
+    if cached is not None:
+        return cached
+
+    user = await get_user_by_username_crud(db, username)
+    set_etag(response, etag, PRIVATE)
     return user_model.UserOutput.model_validate(user)
 
 @router.put("/user", response_model=user_model.UserOutput)
 async def update_user(
     user_update: user_model.UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: user_model.User = Depends(get_current_user)
 ):
-    user = update_user_crud(db, current_user, user_update)
+    user = await update_user_crud(db, current_user.id, user_update)
     return user_model.UserOutput.model_validate(user)
 
 @router.delete("/user", status_code=status.HTTP_200_OK)
-async def delete_user(
+def delete_user(
     db: Session = Depends(get_db),
     current_user: user_model.User = Depends(get_current_user)
 ):
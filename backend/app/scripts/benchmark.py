@@ -0,0 +1,198 @@
+""" Benchmark the main endpoints: latency percentiles and SQL statements per request.
+
+The app is driven in-process with httpx over a deterministic synthetic dataset (generated with
+scripts.generate_dataset on the first run). Run it against a dedicated database.
+
+Usage (from the app directory):
+    python -m scripts.benchmark --output report.json
+    python -m scripts.benchmark --baseline baseline.json --threshold 0.2   # exits with 1 on regressions
+"""
+from datetime import datetime
+from typing import List
+from sqlalchemy import select
+from core.config import SessionLocal, engine, async_engine, async_replica_engine
+from core.hashing import shutdown_hashing_pool
+from core.sql_metrics import track_sql
+from models.artist import Artist
+from models.song import Song
+from models.user import User
+from scripts.generate_dataset import generate_dataset
+from main import app
+import argparse
+import asyncio
+import json
+import sys
+import time
+import httpx
+import numpy as np
+
+# Size of the benchmark dataset
+DATASET = {
+    "artists": 500,
+    "songs_per_artist": 8,
+    "listeners": 5000,
+    "follows": 50000,
+    "playlists": 1000,
+    "questions": 10000,
+    "seed": 42
+}
+
+# Endpoints: name -> (path, user authenticated as). The paths are formatted with the dataset names.
+ENDPOINTS = {
+    "songs": ("/songs/", None),
+    "song": ("/songs/{song_id}", None),
+    "songs_alphabetically": ("/songs/sorted/alphabetically", None),
+    "songs_release_date": ("/songs/sorted/release_date", None),
+    "songs_engagement_score": ("/songs/sorted/engagement_score", None),
+    "songs_priority": ("/songs/sorted/priority", "listener"),
+    "songs_recommendations": ("/songs/recommendations", "listener"),
+    "artists": ("/artists/", "listener"),
+    "artists_engagement": ("/artists/engagement", "listener"),
+    "artists_followers": ("/artists/followers", "listener"),
+    "listener_preferences": ("/listeners/preferences", "listener"),
+    "metrics_ranking": ("/metrics/ranking?artist_name={artist}", None),
+    "questions_inbox": ("/questions/", "artist"),
+    "user": ("/users/{listener}", None),
+    "user_playlists": ("/playlist/user/{listener}", None)
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(latencies: List[float], statements: List[int], status_code: int) -> dict:
+    """
+    Summarize the measures of an endpoint: latency percentiles and mean (milliseconds) and the
+    SQL statements of its requests (the maximum, they should not vary).
+    """
+    latencies_ms = np.array(latencies) * 1000
+    summary = {f"p{percentile}_ms": round(float(np.percentile(latencies_ms, percentile)), 3)
+               for percentile in PERCENTILES}
+    summary["mean_ms"] = round(float(latencies_ms.mean()), 3)
+    summary["statements"] = max(statements)
+    summary["status"] = status_code
+    return summary
+
+
+def compare_reports(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Compare a report with a baseline one.
+
+    Returns:
+        List[str]: The regressions: endpoints whose p95 latency grew more than the threshold (a
+        fraction of the baseline), or that run more SQL statements.
+    """
+    regressions = []
+    for name, current in report["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if base is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current["statements"] > base["statements"]:
+            regressions.append(f"{name}: {base['statements']} -> {current['statements']} SQL statements")
+    return regressions
+
+
+def prepare_dataset(prefix: str) -> dict:
+    """
+    Generate the dataset if it is not in the database yet, and get the names the paths use.
+    """
+    db = SessionLocal()
+    try:
+        artist_name, listener_name = f"{prefix}a{0:07d}", f"{prefix}l{0:07d}"
+        if db.execute(select(User.id).where(User.username == artist_name)).first() is None:
+            print(json.dumps(generate_dataset(db, prefix=prefix, **DATASET), indent=2), file=sys.stderr)
+
+        song_id = db.execute(select(Song.song_id).join(Artist, Artist.artist_id == Song.artist_id)
+                             .where(Artist.name == artist_name).order_by(Song.song_id)).scalars().first()
+        return {"artist": artist_name, "listener": listener_name, "song_id": song_id}
+    finally:
+        db.close()
+
+
+async def _login(client: httpx.AsyncClient, username: str) -> dict:
+    response = await client.post("/login/", json={"email": f"{username}@synthetic.test", "password": "password"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_benchmark(names: dict, endpoints: List[str], iterations: int, warmup: int) -> dict:
+    """
+    Request every endpoint warmup + iterations times, one request at a time, measuring the
+    latency and the SQL statements of the measured ones.
+    """
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        headers = {
+            "listener": await _login(client, names["listener"]),
+            "artist": await _login(client, names["artist"])
+        }
+        for name in endpoints:
+            path, user = ENDPOINTS[name]
+            path = path.format(**names)
+            latencies, statements = [], []
+            for i in range(warmup + iterations):
+                with track_sql() as stats:
+                    start = time.perf_counter()
+                    response = await client.get(path, headers=headers.get(user, {}))
+                    elapsed = time.perf_counter() - start
+                if i >= warmup:
+                    latencies.append(elapsed)
+                    statements.append(stats.statements)
+            results[name] = {"path": path, **summarize(latencies, statements, response.status_code)}
+            print(f"{name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms, "
+                  f"{results[name]['statements']} statements", file=sys.stderr)
+
+    # The async connections belong to this event loop
+    await async_engine.dispose()
+    await async_replica_engine.dispose()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the main endpoints.")
+    parser.add_argument("--iterations", type=int, default=20, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=2, help="requests per endpoint before measuring")
+    parser.add_argument("--endpoints", help="comma-separated endpoints (all by default): " + ", ".join(ENDPOINTS))
+    parser.add_argument("--prefix", default="bench", help="prefix of the dataset usernames")
+    parser.add_argument("--output", help="file to write the JSON report to")
+    parser.add_argument("--baseline", help="report to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 latency growth (fraction)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    endpoints = args.endpoints.split(",") if args.endpoints else list(ENDPOINTS)
+    unknown = set(endpoints) - ENDPOINTS.keys()
+    if unknown:
+        sys.exit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    names = prepare_dataset(args.prefix)
+    try:
+        report = {
+            "meta": {
+                "created": datetime.utcnow().isoformat(),
+                "database": engine.dialect.name,
+                "dataset": {"prefix": args.prefix, **DATASET},
+                "iterations": args.iterations,
+                "warmup": args.warmup
+            },
+            "endpoints": asyncio.run(run_benchmark(names, endpoints, args.iterations, args.warmup))
+        }
+    finally:
+        shutdown_hashing_pool()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_reports(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
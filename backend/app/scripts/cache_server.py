@@ -0,0 +1,85 @@
+""" Local stand-in of a memcached server, to share the caches between workers without one.
+
+It speaks the subset of the memcached text protocol used by core.cache.MemcachedBackend (get, set,
+add, incr, delete and flush_all) and keeps the entries in an LRU of CACHE_SIZE entries.
+
+Usage (from the app directory):
+    python -m scripts.cache_server --port 11211
+    CACHE_URL=memcached://127.0.0.1:11211 uvicorn main:app --workers 4
+"""
+from core.cache import MemoryBackend
+import argparse
+import asyncio
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, backend: MemoryBackend):
+    # Every command is answered before reading the next one, so a command runs without interleaving
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command, *args = line.split()
+            if command in (b"set", b"add"):
+                key, _, exptime, length = args[:4]
+                data = (await reader.readexactly(int(length) + 2))[:-2]
+                ttl = int(exptime) or None
+                if command == b"add":
+                    stored = backend.add(key, data, ttl)
+                else:
+                    backend.set(key, data, ttl)
+                    stored = True
+                writer.write(b"STORED\r\n" if stored else b"NOT_STORED\r\n")
+            elif command == b"get":
+                for key, data in backend.get_many(args).items():
+                    writer.write(b"VALUE %s 0 %d\r\n%s\r\n" % (key, len(data), data))
+                writer.write(b"END\r\n")
+            elif command == b"incr":
+                data = backend.get(args[0])
+                if data is None:
+                    writer.write(b"NOT_FOUND\r\n")
+                else:
+                    data = b"%d" % (int(data) + int(args[1]))
+                    backend.set(args[0], data)
+                    writer.write(data + b"\r\n")
+            elif command == b"delete":
+                found = backend.get(args[0]) is not None
+                backend.delete(args[0])
+                writer.write(b"DELETED\r\n" if found else b"NOT_FOUND\r\n")
+            elif command == b"flush_all":
+                backend.clear()
+                writer.write(b"OK\r\n")
+            else:
+                writer.write(b"ERROR\r\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_cache_server(host: str = "127.0.0.1", port: int = 11211,
+                             backend: MemoryBackend = None) -> asyncio.AbstractServer:
+    """
+    Start serving a cache (a new LRU by default) on the given address (port 0 picks a free one).
+
+    Returns:
+        asyncio.AbstractServer: The running server.
+    """
+    backend = backend or MemoryBackend()
+    return await asyncio.start_server(lambda reader, writer: _handle(reader, writer, backend), host, port)
+
+
+async def _main(host: str, port: int):
+    server = await start_cache_server(host, port)
+    print(f"Serving the cache on {host}:{port}.")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of a memcached server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11211)
+    args = parser.parse_args()
+    asyncio.run(_main(args.host, args.port))
@@ -0,0 +1,313 @@
+""" Generate a large synthetic dataset for load testing: artists, songs, sources, listeners, follows
+(with a power-law fan-in), playlists and questions. The same seed always generates the same data.
+
+The rows are written with COPY on PostgreSQL (bulk inserts on other databases), with explicit ids
+after the existing ones. Every user has the password "password".
+
+Usage (from the app directory):
+    python -m scripts.generate_dataset --artists 10000 --listeners 200000 --follows 1000000
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.orm import Session
+from core.config import SessionLocal
+from core.security import get_password_hash
+from crud.artist_stats import engagement_score
+from models.user import User, ListenerArtistLink
+from models.artist import Artist, ArtistStats
+from models.listener import Listener
+from models.question import Question
+from models.song import Song, SongSource
+from models.playlist import Playlist, playlist_songs
+import argparse
+import csv
+import io
+import json
+import re
+import time
+import numpy as np
+import main  # noqa: F401 (registers every model and creates the missing tables)
+
+GENRES = ["pop", "rock", "hip hop", "reggaeton", "latin pop", "indie", "electronic", "jazz", "r&b", "country"]
+
+QUESTIONS = [
+    "What inspires you the most when writing a song?",
+    "Who are your biggest musical influences?",
+    "What's your dream collaboration?",
+    "How do you handle criticism of your music?",
+    "Do you prefer performing live or recording in a studio?",
+    "What's the story behind your latest album?",
+    "Where do you see your music career in 10 years?",
+    "What's the hardest part about being a singer?"
+]
+
+# Share of the questions that were answered, rejected and are still waiting
+RESPONSE_SHARES = {"answered": 0.5, "rejected": 0.15, "waiting": 0.35}
+
+# Dates are spread over the two years before a fixed date (so they do not depend on the day either)
+REFERENCE_DATE = datetime(2025, 1, 1)
+DATE_RANGE_SECONDS = 2 * 365 * 24 * 3600
+
+# Rows per COPY / bulk insert
+CHUNK_SIZE = 50000
+
+
+def _write(db: Session, table: Table, columns: list, rows) -> int:
+    """
+    Write rows (tuples with the given columns) with COPY on PostgreSQL (psycopg2), or with
+    bulk inserts otherwise, in chunks.
+    """
+    connection = db.connection()
+    cursor = connection.connection.cursor() if connection.dialect.name == "postgresql" else None
+    use_copy = cursor is not None and hasattr(cursor, "copy_expert")
+    names = ", ".join(f'"{column}"' for column in columns)
+
+    count = 0
+    rows = iter(rows)
+    while True:
+        chunk = [row for _, row in zip(range(CHUNK_SIZE), rows)]
+        if not chunk:
+            break
+        if use_copy:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table.name} ({names}) FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            db.execute(table.insert(), [dict(zip(columns, row)) for row in chunk])
+        count += len(chunk)
+    return count
+
+
+def _fix_sequences(db: Session):
+    # The ids were written explicitly: move the PostgreSQL sequences past them
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table, column in (("users", "id"), ("artists", "artist_id"), ("listeners", "listener_id"),
+                          ("songs", "song_id"), ("song_sources", "id"), ("playlists", "playlist_id"),
+                          ("questions", "question_id")):
+        db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                        f"(SELECT COALESCE(MAX({column}), 1) FROM {table}))"))
+
+
+def _next_id(db: Session, column) -> int:
+    return (db.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def _dates(rng: np.random.Generator, now: datetime, size: int) -> list:
+    offsets = rng.integers(0, DATE_RANGE_SECONDS, size=size).tolist()
+    return [now - timedelta(seconds=offset) for offset in offsets]
+
+
+def popularity(rng: np.random.Generator, count: int, exponent: float) -> np.ndarray:
+    """
+    Power-law (Zipf-like) popularity of count items in a random order: the item of rank r gets a
+    weight proportional to 1 / r^exponent.
+    """
+    ranks = rng.permutation(count) + 1
+    weights = 1.0 / ranks.astype(float) ** exponent
+    return weights / weights.sum()
+
+
+def sample_pairs(rng: np.random.Generator, sources: int, targets: int, count: int,
+                 weights: np.ndarray) -> np.ndarray:
+    """
+    Sample count distinct (source, target) pairs: the sources uniformly, the targets by weight.
+    They are returned as sorted keys source * targets + target.
+    """
+    count = min(count, sources * targets)
+    keys = np.empty(0, dtype=np.int64)
+    while len(keys) < count:
+        needed = count - len(keys)
+        new_keys = rng.integers(0, sources, size=needed, dtype=np.int64) * targets \
+            + rng.choice(targets, size=needed, p=weights)
+        keys = np.unique(np.concatenate([keys, new_keys]))
+    if len(keys) > count:
+        keys = np.sort(rng.choice(keys, size=count, replace=False))
+    return keys
+
+
+def generate_dataset(db: Session, artists: int = 1000, songs_per_artist: float = 10,
+                     sources_per_song: float = 1.5, listeners: int = 20000, follows: int = 100000,
+                     follow_exponent: float = 1.1, playlists: int = 5000, songs_per_playlist: float = 15,
+                     questions: int = 20000, seed: int = 42, prefix: str = "syn") -> dict:
+    """
+    Generate and write a synthetic dataset.
+
+    Args:
+        db (Session): The database session.
+        artists (int): Number of artists.
+        songs_per_artist (float): Mean songs of an artist (Poisson, at least 1).
+        sources_per_song (float): Mean sources of a song (Poisson).
+        listeners (int): Number of listeners.
+        follows (int): Number of follows, distributed by a power law of the artists' popularity.
+        follow_exponent (float): Exponent of the power law (higher, more concentrated).
+        playlists (int): Number of playlists, of random listeners.
+        songs_per_playlist (float): Mean songs of a playlist (Poisson), picked by popularity.
+        questions (int): Number of questions, asked along random follows (at most one per follow).
+        seed (int): Seed of the random generator.
+        prefix (str): Prefix of the usernames (1-8 letters, digits or underscores), to generate
+            several datasets in the same database.
+
+    Returns:
+        dict: The rows written per table, the elapsed seconds and the rows per second.
+    """
+    if not re.match(r'^[a-zA-Z_0-9]{1,8}$', prefix):
+        raise ValueError("The prefix must be 1-8 letters, digits or underscores.")
+    if artists < 1 or listeners < 1:
+        raise ValueError("At least one artist and one listener are needed.")
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    now = REFERENCE_DATE
+    report = {}
+
+    # Ids after the existing rows
+    first_user = _next_id(db, User.id)
+    first_artist = _next_id(db, Artist.artist_id)
+    first_listener = _next_id(db, Listener.listener_id)
+    first_song = _next_id(db, Song.song_id)
+    first_source = _next_id(db, SongSource.id)
+    first_playlist = _next_id(db, Playlist.playlist_id)
+    first_question = _next_id(db, Question.question_id)
+
+    # Users: the artists first, then the listeners (a single hash for everybody)
+    hashed_password = get_password_hash("password")
+    artist_names = [f"{prefix}a{i:07d}" for i in range(artists)]
+    listener_names = [f"{prefix}l{i:07d}" for i in range(listeners)]
+    artist_genres = [GENRES[genre] for genre in rng.integers(0, len(GENRES), size=artists).tolist()]
+    report["users"] = _write(db, User.__table__, ["id", "username", "email", "hashed_password", "genre",
+                                                  "visibility", "role"], (
+        (first_user + i, username, f"{username}@synthetic.test", hashed_password,
+         artist_genres[i] if i < artists else None, "public", "artist" if i < artists else "listener")
+        for i, username in enumerate(artist_names + listener_names)
+    ))
+
+    report["artists"] = _write(db, Artist.__table__, ["artist_id", "user_id", "name", "genre"], (
+        (first_artist + i, first_user + i, artist_names[i], artist_genres[i]) for i in range(artists)
+    ))
+    report["listeners"] = _write(db, Listener.__table__, ["listener_id", "user_id"], (
+        (first_listener + i, first_user + artists + i) for i in range(listeners)
+    ))
+    db.commit()
+
+    # Songs of every artist and their sources
+    song_counts = np.maximum(rng.poisson(songs_per_artist, size=artists), 1)
+    song_artists = np.repeat(np.arange(artists), song_counts)
+    song_offsets = np.concatenate([[0], np.cumsum(song_counts)[:-1]])
+    song_dates = _dates(rng, now, len(song_artists))
+    report["songs"] = _write(db, Song.__table__, ["song_id", "title", "album", "genre", "release_date", "artist_id"], (
+        (first_song + i, f"Song {i - song_offsets[artist]}", f"Album {(i - song_offsets[artist]) // 10}",
+         artist_genres[artist], song_dates[i].date().isoformat(), first_artist + artist)
+        for i, artist in enumerate(song_artists.tolist())
+    ))
+    source_counts = rng.poisson(sources_per_song, size=len(song_artists))
+    source_songs = np.repeat(np.arange(len(song_artists)), source_counts)
+    report["sources"] = _write(db, SongSource.__table__, ["id", "song_id", "source_url"], (
+        (first_source + i, first_song + song, f"https://example.com/songs/{first_song + song}/{i}")
+        for i, song in enumerate(source_songs.tolist())
+    ))
+    db.commit()
+
+    # Follows: uniform listeners, artists by popularity (a few artists get most of the followers)
+    weights = popularity(rng, artists, follow_exponent)
+    follow_keys = sample_pairs(rng, listeners, artists, follows, weights)
+    follow_listeners, follow_artists = follow_keys // artists, follow_keys % artists
+    follow_dates = _dates(rng, now, len(follow_keys))
+    report["follows"] = _write(db, ListenerArtistLink.__table__, ["listener_id", "artist_id", "follow_date"], (
+        (first_listener + listener, first_artist + artist, follow_dates[i])
+        for i, (listener, artist) in enumerate(zip(follow_listeners.tolist(), follow_artists.tolist()))
+    ))
+    db.commit()
+
+    # Questions along random follows, with a random response status
+    asked = np.sort(rng.choice(len(follow_keys), size=min(questions, len(follow_keys)), replace=False))
+    statuses = rng.choice(list(RESPONSE_SHARES), size=len(asked), p=list(RESPONSE_SHARES.values())).tolist()
+    texts = rng.integers(0, len(QUESTIONS), size=len(asked)).tolist()
+    question_dates = _dates(rng, now, len(asked))
+    response_delays = rng.integers(60, 7 * 24 * 3600, size=len(asked)).tolist()
+    question_rows = []
+    for i, follow in enumerate(asked.tolist()):
+        listener, artist, response_status = int(follow_listeners[follow]), int(follow_artists[follow]), statuses[i]
+        responded = response_status != "waiting"
+        question_rows.append((
+            first_question + i, first_listener + listener, first_artist + artist, artist_names[artist],
+            listener_names[listener], QUESTIONS[texts[i]], "Thanks for asking!" if response_status == "answered" else None,
+            question_dates[i], question_dates[i] + timedelta(seconds=response_delays[i]) if responded else None,
+            response_status, False
+        ))
+    report["questions"] = _write(db, Question.__table__, [
+        "question_id", "listener_id", "artist_id", "artist_username", "listener_username", "question_text",
+        "response_text", "question_date", "response_date", "response_status", "archived"
+    ], question_rows)
+    db.commit()
+
+    # Playlists of random listeners, with songs of popular artists
+    owners = rng.integers(0, listeners, size=playlists).tolist()
+    private = (rng.random(size=playlists) < 0.2).tolist()
+    report["playlists"] = _write(db, Playlist.__table__, ["playlist_id", "name", "visibility", "user_id"], (
+        (first_playlist + i, f"Playlist {i}", "private" if private[i] else "public", first_user + artists + owner)
+        for i, owner in enumerate(owners)
+    ))
+    playlist_sizes = rng.poisson(songs_per_playlist, size=playlists)
+    entry_playlists = np.repeat(np.arange(playlists), playlist_sizes)
+    entry_artists = rng.choice(artists, size=len(entry_playlists), p=weights)
+    entry_songs = song_offsets[entry_artists] + rng.integers(0, song_counts[entry_artists])
+    entry_keys = np.unique(entry_playlists.astype(np.int64) * len(song_artists) + entry_songs)
+    entry_playlists, entry_songs = entry_keys // len(song_artists), entry_keys % len(song_artists)
+    group_starts = np.searchsorted(entry_playlists, entry_playlists)
+    entry_orders = np.arange(len(entry_keys)) - group_starts
+    report["playlist_songs"] = _write(db, playlist_songs, ["playlist_id", "song_id", "order"], (
+        (first_playlist + playlist, first_song + song, order)
+        for playlist, song, order in zip(entry_playlists.tolist(), entry_songs.tolist(), entry_orders.tolist())
+    ))
+    db.commit()
+
+    # Denormalized counters of the artists
+    followers = np.bincount(follow_artists, minlength=artists).tolist()
+    counts = {status: [0] * artists for status in RESPONSE_SHARES}
+    for artist, response_status in zip(follow_artists[asked].tolist(), statuses):
+        counts[response_status][artist] += 1
+    report["artist_stats"] = _write(db, ArtistStats.__table__, [
+        "artist_id", "followers", "answered", "rejected", "waiting", "total_questions", "engagement_score"
+    ], (
+        (first_artist + i, followers[i], counts["answered"][i], counts["rejected"][i], counts["waiting"][i],
+         counts["answered"][i] + counts["rejected"][i] + counts["waiting"][i],
+         engagement_score(counts["answered"][i], counts["rejected"][i], counts["waiting"][i], followers[i],
+                          counts["answered"][i] + counts["rejected"][i] + counts["waiting"][i]))
+        for i in range(artists)
+    ))
+
+    _fix_sequences(db)
+    db.commit()
+
+    seconds = time.perf_counter() - start
+    rows = sum(report.values())
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round(rows / seconds, 1) if seconds else 0.0
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset for load testing.")
+    parser.add_argument("--artists", type=int, default=1000)
+    parser.add_argument("--songs-per-artist", type=float, default=10)
+    parser.add_argument("--sources-per-song", type=float, default=1.5)
+    parser.add_argument("--listeners", type=int, default=20000)
+    parser.add_argument("--follows", type=int, default=100000)
+    parser.add_argument("--follow-exponent", type=float, default=1.1, help="power law exponent of the follows")
+    parser.add_argument("--playlists", type=int, default=5000)
+    parser.add_argument("--songs-per-playlist", type=float, default=15)
+    parser.add_argument("--questions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="syn", help="prefix of the usernames")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        print(json.dumps(generate_dataset(db, **vars(args)), indent=2))
+    finally:
+        db.close()
@@ -0,0 +1,16 @@
+""" Resynchronize the artist_stats table with the follows and questions tables (building the missing rows).
+
+Usage (from the app directory): python -m scripts.rebuild_artist_stats
+"""
+from core.config import SessionLocal
+from crud.artist_stats import rebuild_artist_stats
+import main  # noqa: F401 (registers every model and creates the missing tables)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        count = rebuild_artist_stats(db)
+        print(f"Rebuilt the stats of {count} artists.")
+    finally:
+        db.close()
@@ -0,0 +1,34 @@
+""" Bulk load artists and listeners from JSON / NDJSON files.
+
+Usage (from the app directory):
+    python -m scripts.seed --artists data/top_artists.json --users data/user.json
+    python -m scripts.seed --artists artists.ndjson --users users.ndjson --hash-mode shared --batch-size 5000
+"""
+import argparse
+import json
+from core.config import SessionLocal
+from crud.seed import HASH_MODES, SEED_BATCH_SIZE, seed_database
+from core.hashing import shutdown_hashing_pool
+import main  # noqa: F401 (registers every model and creates the missing tables)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk load artists and listeners.")
+    parser.add_argument("--artists", help="artists file (data/top_artists.json format, or one artist per line)")
+    parser.add_argument("--users", help="listeners file (data/user.json format, or one listener per line)")
+    parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE, help="records per batch")
+    parser.add_argument("--hash-mode", choices=HASH_MODES, default="each", help="how the passwords are hashed")
+    parser.add_argument("--max-songs", type=int, default=None, help="songs loaded per artist (all by default)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        report = seed_database(db, artists_path=args.artists, users_path=args.users, batch_size=args.batch_size,
+                               hash_mode=args.hash_mode, max_songs=args.max_songs)
+        print(json.dumps(report, indent=2))
+    finally:
+        db.close()
+        shutdown_hashing_pool()
@@ -0,0 +1,5 @@
+import os
+
+# Every TestClient runs the app on its own event loop, and the pooled async connections are bound
+# to the loop that opened them: the async engines open a connection per checkout (core.config)
+os.environ.setdefault("DB_ASYNC_POOL", "null")
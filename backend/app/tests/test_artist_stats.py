@@ -0,0 +1,123 @@
+import pytest
+from crud.artist_stats import get_artist_stats, rebuild_artist_stats
+from crud.listener import follow_artist, unfollow_artist
+from crud.question import response_question
+from crud.user import delete_user_account
+from models.artist import ArtistStats
+from models.question import QuestionResponse, ResponseEnum
+from tests.utils import create_random_artist, create_random_listener, get_session, ask_question
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """
+    Provides a clean database session for each test.
+    Automatically rolls back transactions after each test.
+    """
+    db = get_session()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+
+def _counters(stats: ArtistStats):
+    return (stats.followers, stats.answered, stats.rejected, stats.waiting,
+            stats.total_questions, stats.engagement_score)
+
+
+def test_stats_follow_events(db_session):
+    artist = create_random_artist(db_session)
+    listener = create_random_listener(db_session)
+
+    # New artists start with empty counters
+    assert _counters(get_artist_stats(db_session, artist)) == (0, 0, 0, 0, 0, 1000)
+
+    follow_artist(db_session, listener, artist.user.username)
+    assert get_artist_stats(db_session, artist).followers == 1
+
+    unfollow_artist(db_session, listener, artist.user.username)
+    assert get_artist_stats(db_session, artist).followers == 0
+
+    # Delete data created
+    db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.commit()
+
+
+def test_stats_question_events(db_session):
+    artist = create_random_artist(db_session)
+    listener1 = create_random_listener(db_session)
+    listener2 = create_random_listener(db_session)
+    follow_artist(db_session, listener1, artist.user.username)
+    follow_artist(db_session, listener2, artist.user.username)
+
+    question1 = ask_question(db_session, listener1, artist, "First?")
+    question2 = ask_question(db_session, listener2, artist, "Second?")
+    assert _counters(get_artist_stats(db_session, artist)) == (2, 0, 0, 2, 2, 1013)
+
+    response_question(db_session, artist, QuestionResponse(
+        question_id=question1.question_id, response_text="Yes"), ResponseEnum.answered)
+    response_question(db_session, artist, QuestionResponse(
+        question_id=question2.question_id, response_text="No"), ResponseEnum.rejected)
+
+    # Reply rate of 50%: 1000 + 50 * 50 + 2 * 1.5 + 2 * 5
+    assert _counters(get_artist_stats(db_session, artist)) == (2, 1, 1, 0, 2, 3513)
+
+    # Delete data created
+    db_session.delete(listener1.user)
+    db_session.delete(listener2.user)
+    db_session.delete(artist.user)
+    db_session.commit()
+
+
+def test_stats_increments_in_the_database(db_session):
+    artist = create_random_artist(db_session)
+    listeners = [create_random_listener(db_session) for _ in range(2)]
+
+    # A follow counted by another session while this one holds the counters
+    assert get_artist_stats(db_session, artist).followers == 0
+    other = get_session()
+    follow_artist(other, other.merge(listeners[0]), artist.user.username)
+    other.close()
+    follow_artist(db_session, listeners[1], artist.user.username)
+    assert get_artist_stats(db_session, artist).followers == 2
+
+    # A missing row is inserted from the base tables
+    db_session.delete(get_artist_stats(db_session, artist))
+    db_session.commit()
+    unfollow_artist(db_session, listeners[1], artist.user.username)
+    assert _counters(get_artist_stats(db_session, artist)) == (1, 0, 0, 0, 0, 1002)
+
+    # Delete data created
+    for listener in listeners:
+        db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.commit()
+
+
+def test_rebuild_artist_stats(db_session):
+    artist = create_random_artist(db_session)
+    listener = create_random_listener(db_session)
+    follow_artist(db_session, listener, artist.user.username)
+    ask_question(db_session, listener, artist, "Question?")
+
+    # Corrupt the counters and rebuild them from the base tables
+    stats = get_artist_stats(db_session, artist)
+    stats.followers = 100
+    stats.waiting = 0
+    db_session.commit()
+
+    assert rebuild_artist_stats(db_session, [artist.artist_id]) == 1
+    db_session.refresh(stats)
+    assert _counters(stats) == (1, 0, 0, 1, 1, 1006)
+
+    # Deleting the listener account resyncs the counters of the artists it followed
+    delete_user_account(db_session, listener.user)
+    db_session.refresh(stats)
+    assert _counters(stats) == (0, 0, 0, 0, 0, 1000)
+
+    # Delete data created
+    db_session.delete(artist.user)
+    db_session.commit()
@@ -0,0 +1,113 @@
+from tests.utils import get_session, get_client, create_random_auth_artist, create_random_auth_user, random_lower_string
+from crud.listener import get_listener_by_username
+from models.song import Song
+from models.user import User
+
+
+def test_song_lifecycle_async():
+    db = get_session()
+    client = get_client()
+
+    artist = create_random_auth_artist(db)
+    headers = {"Authorization": f"Bearer {artist.token}"}
+    song_data = {
+        "title": random_lower_string(),
+        "release_date": "2024-11-26",
+        "artist_name": artist.username,
+        "sources": ["https://example.com/song"]
+    }
+
+    # The sources are stored with the song
+    song = client.post("/songs/", json=song_data, headers=headers).json()
+    assert song["sources"] == ["https://example.com/song"]
+    assert client.get(f"/songs/{song['song_id']}").json() == song
+    assert song in client.get("/songs/?all=true").json()
+
+    # Update it
+    song_data["title"] = random_lower_string()
+    song_data["sources"] = []
+    response = client.put(f"/songs/{song['song_id']}", json=song_data, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["title"] == song_data["title"]
+    assert response.json()["sources"] == []
+
+    # Only its artist can delete it
+    other = create_random_auth_artist(db)
+    response = client.delete(f"/songs/{song['song_id']}", headers={"Authorization": f"Bearer {other.token}"})
+    assert response.status_code == 403
+    assert client.delete(f"/songs/{song['song_id']}", headers=headers).status_code == 200
+    assert client.get(f"/songs/{song['song_id']}").status_code == 404
+    assert db.query(Song).filter(Song.song_id == song["song_id"]).first() is None
+
+    # Clean up
+    db.delete(artist)
+    db.delete(other)
+    db.commit()
+
+
+def test_user_async():
+    db = get_session()
+    client = get_client()
+
+    # Create a listener
+    username = random_lower_string()[:16]
+    user_data = {"username": username, "email": f"{username}@{username}.com", "password": "password"}
+    response = client.post("/users/user", json=user_data)
+    assert response.status_code == 200
+    assert response.json()["role"] == "listener"
+    assert get_listener_by_username(db, username) is not None
+
+    # Duplicated username
+    assert client.post("/users/user", json=user_data).status_code == 400
+
+    # Get and update it
+    assert client.get(f"/users/{username}").json()["email"] == user_data["email"]
+    token = client.post("/login/", json={"email": user_data["email"], "password": "password"}).json()["access_token"]
+    response = client.put("/users/user", json={"description": "Updated"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["description"] == "Updated"
+
+    # Clean up
+    db.delete(db.query(User).filter(User.username == username).first())
+    db.commit()
+
+
+def test_playlist_async():
+    db = get_session()
+    client = get_client()
+
+    user = create_random_auth_user(db)
+    artist = create_random_auth_artist(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+    songs = [
+        client.post("/songs/", json={"title": random_lower_string(), "release_date": "2024-11-26",
+                                     "artist_name": artist.username},
+                    headers={"Authorization": f"Bearer {artist.token}"}).json()["song_id"]
+        for _ in range(3)
+    ]
+
+    playlist = client.post("/playlist/", json={"name": "Playlist"}, headers=headers).json()
+    assert playlist["username"] == user.username
+    assert playlist["songs"] == []
+
+    # Add, reorder and remove songs
+    for song_id in songs:
+        playlist = client.post(f"/playlist/{playlist['playlist_id']}/song/{song_id}", headers=headers).json()
+    assert [song["song_id"] for song in playlist["songs"]] == songs
+
+    playlist = client.put(f"/playlist/{playlist['playlist_id']}/reorder",
+                          json={"song_ids": songs[::-1]}, headers=headers).json()
+    assert [song["song_id"] for song in playlist["songs"]] == songs[::-1]
+
+    playlist = client.delete(f"/playlist/{playlist['playlist_id']}/song/{songs[1]}", headers=headers).json()
+    assert [song["song_id"] for song in playlist["songs"]] == [songs[2], songs[0]]
+
+    assert client.get(f"/playlist/user/{user.username}").json() == [playlist]
+
+    response = client.delete(f"/playlist/{playlist['playlist_id']}", headers=headers)
+    assert response.status_code == 204
+
+    # Clean up
+    db.delete(user)
+    db.delete(artist)
+    db.commit()
@@ -0,0 +1,27 @@
+from scripts.benchmark import compare_reports, summarize
+
+
+def test_benchmark_summary():
+    summary = summarize([0.001 * i for i in range(1, 101)], [5] * 99 + [6], 200)
+    assert summary["p50_ms"] == 50.5
+    assert summary["p95_ms"] == 95.05
+    assert summary["p99_ms"] == 99.01
+    assert summary["statements"] == 6
+    assert summary["status"] == 200
+
+
+def test_benchmark_regressions():
+    baseline = {"endpoints": {
+        "songs": {"p95_ms": 100.0, "statements": 3},
+        "artists": {"p95_ms": 50.0, "statements": 10}
+    }}
+    report = {"endpoints": {
+        "songs": {"p95_ms": 115.0, "statements": 3},       # Within the threshold
+        "artists": {"p95_ms": 70.0, "statements": 12},     # Slower and more statements
+        "user": {"p95_ms": 5.0, "statements": 1}           # Not in the baseline
+    }}
+
+    regressions = compare_reports(report, baseline, threshold=0.2)
+    assert len(regressions) == 2
+    assert all(regression.startswith("artists") for regression in regressions)
+    assert compare_reports(report, baseline, threshold=0.5) == ["artists: 10 -> 12 SQL statements"]
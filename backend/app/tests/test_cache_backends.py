@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+import pytest
+from core.cache import MemoryBackend, SQLiteBackend, MemcachedBackend, create_cache_backend
+from scripts.cache_server import start_cache_server
+
+
+@pytest.fixture
+def cache_server():
+    # The stand-in server runs in its own event loop thread
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start_cache_server(port=0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server.sockets[0].getsockname()[1]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, server.wait_closed(), return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "memcached"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "cache.db"))
+    return MemcachedBackend("127.0.0.1", request.getfixturevalue("cache_server"))
+
+
+def test_backend(backend):
+    assert backend.get("song:1") is None
+    backend.set("song:1", {"title": "a", "sources": ["b"]})
+    backend.set("song:2", [1, 2], ttl=60)
+    assert backend.get("song:1") == {"title": "a", "sources": ["b"]}
+    assert backend.get_many(["song:1", "song:2", "song:3"]) == {"song:1": {"title": "a", "sources": ["b"]},
+                                                               "song:2": [1, 2]}
+
+    # Long keys, and keys with spaces
+    backend.set("response:" + "x" * 300, 1)
+    backend.set("response:a b", 2)
+    assert backend.get("response:" + "x" * 300) == 1
+    assert backend.get("response:a b") == 2
+
+    assert not backend.add("song:1", "other")
+    assert backend.add("lock", "owner", ttl=60)
+    assert backend.get("song:1") == {"title": "a", "sources": ["b"]}
+
+    assert backend.incr("counter") is None
+    backend.set("counter", 41)
+    assert backend.incr("counter") == 42
+    assert backend.get("counter") == 42
+
+    backend.delete("song:1")
+    assert backend.get("song:1") is None
+    backend.clear()
+    assert backend.get("song:2") is None
+    assert backend.stats()["backend"] in ("memory", "sqlite", "memcached")
+
+
+def test_backend_expiration(backend):
+    backend.set("expired", 1, ttl=0.01 if not isinstance(backend, MemcachedBackend) else 1)
+    time.sleep(0.05 if not isinstance(backend, MemcachedBackend) else 1.1)
+    assert backend.get("expired") is None
+    # An expired key can be added again
+    assert backend.add("expired", 2)
+
+
+def test_lru_eviction(tmp_path):
+    memory = MemoryBackend(max_size=2)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    memory.get("a")
+    memory.set("c", 3)
+    assert memory.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert memory.stats()["evictions"] == 1
+
+    # The SQLite backend evicts the least recently used entries every few writes
+    sqlite = SQLiteBackend(str(tmp_path / "cache.db"), max_size=10)
+    for i in range(64):
+        sqlite.set(f"key:{i}", i)
+    assert sqlite.stats()["size"] == 10
+    assert sqlite.get("key:63") == 63
+
+
+def test_sqlite_shared(tmp_path):
+    # Two workers (processes) with the same file share the entries
+    worker1 = SQLiteBackend(str(tmp_path / "cache.db"))
+    worker2 = create_cache_backend(f"sqlite:///{tmp_path}/cache.db")
+    worker1.set("song:1", "a")
+    assert worker2.get("song:1") == "a"
+    worker2.set("counter", 1)
+    assert worker1.incr("counter") == 2
+    assert worker2.incr("counter") == 3
+
+
+def test_create_cache_backend():
+    assert isinstance(create_cache_backend("memory://"), MemoryBackend)
+    backend = create_cache_backend("memcached://cache:11212")
+    assert (backend.host, backend.port) == ("cache", 11212)
+    with pytest.raises(ValueError):
+        create_cache_backend("redis://localhost")
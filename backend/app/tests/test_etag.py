@@ -0,0 +1,206 @@
+import pytest
+from tests.utils import get_session, get_client, create_random_auth_artist, create_random_auth_listener, \
+    random_lower_string, assert_max_queries
+from core.etag import PUBLIC, PRIVATE, make_etag
+from crud.user import deauthenticate
+from models.user import User
+
+
+def _conditional_get(client, path, etag, headers=None):
+    return client.get(path, headers={"If-None-Match": etag, **(headers or {})})
+
+
+def test_song_etag():
+    db = get_session()
+    client = get_client()
+    user = create_random_auth_artist(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+    song_data = {"title": random_lower_string(), "release_date": "2024-11-26", "artist_name": user.username,
+                 "sources": ["https://example.com/a"]}
+    song = client.post("/songs/", json=song_data, headers=headers).json()
+
+    response = client.get(f"/songs/{song['song_id']}")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == PUBLIC
+    etag = response.headers["ETag"]
+
+    # The current ETag gets a 304, without loading the song
+    with assert_max_queries(1):
+        response = _conditional_get(client, f"/songs/{song['song_id']}", etag)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+    assert _conditional_get(client, f"/songs/{song['song_id']}", f'W/{etag}, "other"').status_code == 304
+
+    # Changing the sources changes it
+    song_data["sources"] = ["https://example.com/b"]
+    assert client.put(f"/songs/{song['song_id']}", json=song_data, headers=headers).status_code == 200
+    response = _conditional_get(client, f"/songs/{song['song_id']}", etag)
+    assert response.status_code == 200
+    assert response.json()["sources"] == ["https://example.com/b"]
+    etag = response.headers["ETag"]
+
+    # And so does changing the username of the artist (the artist name of the song)
+    user_update = {"username": random_lower_string(), "email": user.email}
+    assert client.put("/users/user", json=user_update, headers=headers).status_code == 200
+    response = _conditional_get(client, f"/songs/{song['song_id']}", etag)
+    assert response.status_code == 200
+    assert response.json()["artist_name"] == user_update["username"]
+
+    # Clean up
+    db.delete(user)
+    db.commit()
+
+
+def test_songs_etag():
+    db = get_session()
+    client = get_client()
+    user = create_random_auth_artist(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+
+    for params in ({"all": True}, {"limit": 5}):
+        response = client.get("/songs/sorted/alphabetically", params=params)
+        etag = response.headers["ETag"]
+        assert client.get("/songs/sorted/alphabetically", params=params,
+                          headers={"If-None-Match": etag}).status_code == 304
+
+    # A new song first in the listing changes the ETag of the first page
+    client.post("/songs/", json={"title": "0" * 10, "release_date": "2024-11-26", "artist_name": user.username},
+                headers=headers)
+    response = client.get("/songs/sorted/alphabetically", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["title"] == "0" * 10
+
+    # Clean up
+    db.delete(user)
+    db.commit()
+
+
+def test_user_etag():
+    db = get_session()
+    client = get_client()
+    user = create_random_auth_listener(db)
+
+    response = client.get(f"/users/{user.username}")
+    etag = response.headers["ETag"]
+    assert _conditional_get(client, f"/users/{user.username}", etag).status_code == 304
+
+    # The profile has the email: no shared cache keeps it
+    assert response.headers["Cache-Control"] == PRIVATE
+    assert "email" in response.json()
+
+    # Updating the profile changes it, logging out (the token) does not
+    user_update = {"description": random_lower_string(), "email": user.email}
+    assert client.put("/users/user", json=user_update, headers={"Authorization": f"Bearer {user.token}"}).status_code == 200
+    response = _conditional_get(client, f"/users/{user.username}", etag)
+    assert response.status_code == 200
+    assert response.json()["description"] == user_update["description"]
+
+    etag = response.headers["ETag"]
+    deauthenticate(db, user)
+    assert _conditional_get(client, f"/users/{user.username}", etag).status_code == 304
+
+    # Clean up
+    db.delete(user)
+    db.commit()
+
+
+def test_playlist_etag():
+    db = get_session()
+    client = get_client()
+    user = create_random_auth_artist(db)
+    other = create_random_auth_listener(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+    song = client.post("/songs/", json={"title": random_lower_string(), "release_date": "2024-11-26",
+                                        "artist_name": user.username}, headers=headers).json()
+    playlist = client.post("/playlist", json={"name": "ETag", "visibility": "public"}, headers=headers).json()
+    path = f"/playlist/{playlist['playlist_id']}"
+
+    response = client.get(path)
+    assert response.headers["Cache-Control"] == PUBLIC
+    etag = response.headers["ETag"]
+    assert _conditional_get(client, path, etag).status_code == 304
+
+    # Adding a song (in playlist_songs) changes it
+    client.post(f"{path}/song/{song['song_id']}", headers=headers)
+    response = _conditional_get(client, path, etag)
+    assert response.status_code == 200
+    assert response.json()["songs"] == [{"song_id": song["song_id"]}]
+
+    # A private playlist is only cached by its owner, the others are refused before the ETag is checked
+    client.put(path, json={"visibility": "private"}, headers=headers)
+    response = client.get(path, headers=headers)
+    assert response.headers["Cache-Control"] == PRIVATE
+    etag = response.headers["ETag"]
+    assert _conditional_get(client, path, etag, headers).status_code == 304
+    with pytest.raises(ValueError, match="permission"):
+        _conditional_get(client, path, etag, {"Authorization": f"Bearer {other.token}"})
+
+    # Clean up
+    db.delete(user)
+    db.delete(other)
+    db.commit()
+
+
+def test_playlist_etag_deleted_songs():
+    db = get_session()
+    client = get_client()
+    artist = create_random_auth_artist(db)
+    listener = create_random_auth_listener(db)
+    artist_headers = {"Authorization": f"Bearer {artist.token}"}
+    headers = {"Authorization": f"Bearer {listener.token}"}
+    songs = [client.post("/songs/", json={"title": random_lower_string(), "release_date": "2024-11-26",
+                                          "artist_name": artist.username}, headers=artist_headers).json()
+             for _ in range(2)]
+    playlist = client.post("/playlist", json={"name": "Deleted songs", "visibility": "public"}, headers=headers).json()
+    path = f"/playlist/{playlist['playlist_id']}"
+    for song in songs:
+        client.post(f"{path}/song/{song['song_id']}", headers=headers)
+
+    # Deleting a song (its playlist_songs rows are deleted in cascade) changes the playlist
+    etag = client.get(path).headers["ETag"]
+    assert client.delete(f"/songs/{songs[0]['song_id']}", headers=artist_headers).status_code == 200
+    response = _conditional_get(client, path, etag)
+    assert response.status_code == 200
+    assert response.json()["songs"] == [{"song_id": songs[1]["song_id"]}]
+
+    # And so does deleting the account of its artist
+    etag = response.headers["ETag"]
+    assert client.delete("/users/user", headers=artist_headers).status_code == 200
+    response = _conditional_get(client, path, etag)
+    assert response.status_code == 200
+    assert response.json()["songs"] == []
+
+    # Clean up
+    db.expire_all()
+    db.delete(listener)
+    db.commit()
+
+
+def test_concurrent_updates_get_new_versions():
+    db = get_session()
+    other = get_session()
+    user = create_random_auth_artist(db)
+
+    # Both sessions loaded the same version, and both updates bump it
+    other_user = other.get(User, user.id)
+    assert other_user.version == user.version
+    version = user.version
+    user.description = "First"
+    db.commit()
+    other_user.genre = "Second"
+    other.commit()
+
+    db.refresh(user)
+    assert user.version == version + 2
+
+    # Clean up
+    other.close()
+    db.delete(user)
+    db.commit()
+
+
+def test_make_etag():
+    assert make_etag("song", 1, (1, 2)) == make_etag("song", 1, [1, 2])
+    assert make_etag("song", 1, (1, 2)) != make_etag("song", 1, (2, 2))
+    assert make_etag("song", 1).startswith('"')
@@ -0,0 +1,66 @@
+import numpy as np
+from tests.utils import get_session, random_lower_string
+from scripts.generate_dataset import generate_dataset, popularity, sample_pairs
+from crud.artist_stats import rebuild_artist_stats
+from models.artist import Artist, ArtistStats
+from models.user import User, ListenerArtistLink
+from models.playlist import Playlist, playlist_songs
+
+
+def test_power_law_follows():
+    # The same seed samples the same pairs, all distinct
+    samples = []
+    for _ in range(2):
+        rng = np.random.default_rng(1)
+        weights = popularity(rng, 50, 1.1)
+        samples.append(sample_pairs(rng, 200, 50, 2000, weights))
+    assert np.array_equal(samples[0], samples[1])
+    assert len(np.unique(samples[0])) == 2000
+
+    # The most popular artists get most of the followers
+    followers = np.sort(np.bincount(samples[0] % 50, minlength=50))[::-1]
+    assert followers[:5].sum() > followers[25:].sum()
+
+    # It never asks for more pairs than possible
+    assert len(sample_pairs(np.random.default_rng(1), 3, 2, 100, np.array([0.5, 0.5]))) == 6
+
+
+def test_generate_dataset():
+    db = get_session()
+    prefix = random_lower_string()[:6]
+
+    report = generate_dataset(db, artists=5, songs_per_artist=3, listeners=30, follows=60, playlists=4,
+                              songs_per_playlist=5, questions=10, seed=7, prefix=prefix)
+    assert report["users"] == 35
+    assert report["follows"] == 60
+    assert report["questions"] == 10
+    assert report["rows_per_second"] > 0
+
+    users = db.query(User).filter(User.username.like(f"{prefix}%")).all()
+    assert len(users) == 35
+    artist_ids = [artist_id for artist_id, in db.query(Artist.artist_id).filter(Artist.name.like(f"{prefix}%"))]
+    assert db.query(ListenerArtistLink).filter(ListenerArtistLink.artist_id.in_(artist_ids)).count() == 60
+
+    # The playlists are ordered from 0
+    playlist_ids = [playlist_id for playlist_id, in db.query(Playlist.playlist_id).filter(
+        Playlist.user_id.in_([user.id for user in users]))]
+    assert len(playlist_ids) == 4
+    orders = db.query(playlist_songs.c.playlist_id, playlist_songs.c.order) \
+        .filter(playlist_songs.c.playlist_id.in_(playlist_ids)).all()
+    for playlist_id in {playlist_id for playlist_id, _ in orders}:
+        assert sorted(order for p, order in orders if p == playlist_id) == \
+            list(range(sum(1 for p, _ in orders if p == playlist_id)))
+
+    # The counters match the ones rebuilt from the base tables
+    generated = {stats.artist_id: (stats.followers, stats.answered, stats.rejected, stats.waiting, stats.engagement_score)
+                 for stats in db.query(ArtistStats).filter(ArtistStats.artist_id.in_(artist_ids))}
+    rebuild_artist_stats(db, artist_ids)
+    db.expire_all()
+    rebuilt = {stats.artist_id: (stats.followers, stats.answered, stats.rejected, stats.waiting, stats.engagement_score)
+               for stats in db.query(ArtistStats).filter(ArtistStats.artist_id.in_(artist_ids))}
+    assert generated == rebuilt
+
+    # Clean up
+    for user in users:
+        db.delete(user)
+    db.commit()
@@ -0,0 +1,73 @@
+import pytest
+from crud.listener import follow_artist
+from crud.playlist import create_playlist, add_song_to_playlist
+from crud.question import response_question
+from metrics.listeners import loyalty_points, loyalty_sorted_listeners
+from metrics.loyalty import loyalty_scores
+from models.playlist import PlaylistInput
+from models.question import QuestionResponse, ResponseEnum
+from tests.utils import create_random_artist, create_random_listener, create_random_song, get_session, ask_question
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """
+    Provides a clean database session for each test.
+    Automatically rolls back transactions after each test.
+    """
+    db = get_session()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_loyalty_scores_match_loyalty_points(db_session):
+    artist = create_random_artist(db_session)
+    other_artist = create_random_artist(db_session)
+    listener1 = create_random_listener(db_session)
+    listener2 = create_random_listener(db_session)
+    listener3 = create_random_listener(db_session)
+
+    # listener1 follows the artist and got an answer
+    follow_artist(db_session, listener1, artist.user.username)
+    question = ask_question(db_session, listener1, artist, "Question?")
+    response_question(db_session, artist, QuestionResponse(
+        question_id=question.question_id, response_text="Answer"), ResponseEnum.answered)
+
+    # listener2 follows the artist and got rejected
+    follow_artist(db_session, listener2, artist.user.username)
+    question = ask_question(db_session, listener2, artist, "Question?")
+    response_question(db_session, artist, QuestionResponse(
+        question_id=question.question_id, response_text="No"), ResponseEnum.rejected)
+
+    # listener3 has a playlist with 1 of 3 songs from the artist
+    songs = [
+        create_random_song(db_session, artist.user.username),
+        create_random_song(db_session, other_artist.user.username),
+        create_random_song(db_session, other_artist.user.username)
+    ]
+    playlist = create_playlist(db_session, PlaylistInput(name="Playlist"), listener3.user_id)
+    for song in songs:
+        add_song_to_playlist(db_session, playlist.playlist_id, song.song_id, listener3.user_id)
+
+    listeners = [listener1, listener2, listener3]
+    scores = loyalty_scores(artist, db_session, [listener.listener_id for listener in listeners])
+    usernames = list(scores["username"])
+
+    assert list(scores["listener_id"]) == [listener.listener_id for listener in listeners]
+    assert usernames == [listener.user.username for listener in listeners]
+    assert [int(p) for p in scores["points"]] == [loyalty_points(artist, listener, db_session) for listener in listeners]
+
+    # The leaderboard is sorted by loyalty points
+    leaderboard = loyalty_sorted_listeners(artist, db_session)
+    ranked = [username for username, _ in leaderboard if username in usernames]
+    assert ranked == [listener1.user.username, listener2.user.username, listener3.user.username]
+
+    # Delete data created
+    for listener in listeners:
+        db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.delete(other_artist.user)
+    db_session.commit()
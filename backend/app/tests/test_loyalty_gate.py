@@ -0,0 +1,108 @@
+import pytest
+from core.cache import SQLiteBackend
+from crud.listener import follow_artist, unfollow_artist
+from crud.playlist import create_playlist, add_song_to_playlist
+from crud.question import can_question
+from metrics.listeners import get_listener_loyalty_data
+from metrics.loyalty import invalidate_loyalty_indexes, is_top_loyal_listener
+from models.playlist import PlaylistInput
+from tests.utils import create_random_artist, create_random_listener, create_random_song, get_session
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """
+    Provides a clean database session for each test.
+    Automatically rolls back transactions after each test.
+    """
+    db = get_session()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+
+def assert_matches_leaderboard(artist, listeners, db):
+    for listener in listeners:
+        expected = get_listener_loyalty_data(artist, listener, db)["percentage"] < 10
+        assert is_top_loyal_listener(artist, listener, db) == expected
+
+
+def test_gate_matches_leaderboard(db_session):
+    artist = create_random_artist(db_session)
+    listeners = [create_random_listener(db_session) for _ in range(3)]
+
+    invalidate_loyalty_indexes()
+    assert_matches_leaderboard(artist, listeners, db_session)
+
+    # Committed follows and playlist changes update the index incrementally
+    follow_artist(db_session, listeners[0], artist.user.username)
+    assert is_top_loyal_listener(artist, listeners[0], db_session)
+    assert_matches_leaderboard(artist, listeners, db_session)
+
+    song = create_random_song(db_session, artist.user.username)
+    playlist = create_playlist(db_session, PlaylistInput(name="Playlist"), listeners[1].user_id)
+    add_song_to_playlist(db_session, playlist.playlist_id, song.song_id, listeners[1].user_id)
+    follow_artist(db_session, listeners[2], artist.user.username)
+    assert_matches_leaderboard(artist, listeners, db_session)
+
+    unfollow_artist(db_session, listeners[0], artist.user.username)
+    assert_matches_leaderboard(artist, listeners, db_session)
+
+    # New listeners join the index
+    new_listener = create_random_listener(db_session)
+    listeners.append(new_listener)
+    assert_matches_leaderboard(artist, listeners, db_session)
+
+    # Delete data created
+    for listener in listeners:
+        db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.commit()
+
+
+def test_can_question_requires_top_loyalty(db_session):
+    artist = create_random_artist(db_session)
+    listener = create_random_listener(db_session)
+
+    # Not following the artist
+    assert not can_question(db_session, listener, artist)
+
+    # The only follower is the most loyal listener
+    follow_artist(db_session, listener, artist.user.username)
+    assert can_question(db_session, listener, artist)
+
+    # Delete data created
+    db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.commit()
+
+
+def test_gate_applies_changes_of_other_workers(db_session, monkeypatch, tmp_path):
+    # The cache shared by the workers
+    monkeypatch.setattr("metrics.loyalty._backend", SQLiteBackend(str(tmp_path / "cache.db")))
+    monkeypatch.setattr("metrics.loyalty._seen_version", None)
+
+    artist = create_random_artist(db_session)
+    others = [create_random_listener(db_session) for _ in range(10)]
+    listener = create_random_listener(db_session)
+
+    invalidate_loyalty_indexes()
+    assert not is_top_loyal_listener(artist, listener, db_session)
+
+    # Another worker commits a follow: it only reaches this worker through the shared cache
+    with monkeypatch.context() as worker:
+        worker.setattr("metrics.loyalty._apply_loyalty_changes", lambda changes: None)
+        worker.setattr("metrics.loyalty._seen_version", None)
+        follow_artist(db_session, listener, artist.user.username)
+
+    # The gate applies it to the index before the next check
+    assert can_question(db_session, listener, artist)
+
+    # Delete data created
+    for other in others:
+        db_session.delete(other.user)
+    db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.commit()
@@ -0,0 +1,36 @@
+import pytest
+from fastapi import HTTPException
+import core.hashing as hashing
+from core.security import get_password_hash, verify_password
+
+
+def test_hashing_pool_metrics():
+    before = hashing.hashing_stats()
+
+    hashed = get_password_hash("password")
+    assert verify_password("password", hashed)
+    assert not verify_password("wrong", hashed)
+
+    stats = hashing.hashing_stats()
+    assert stats["hash"]["count"] == before["hash"]["count"] + 1
+    assert stats["verify"]["count"] == before["verify"]["count"] + 2
+    assert stats["hash"]["ms_max"] > 0
+    assert stats["in_flight"] == 0
+
+
+def test_hashing_cost_is_configurable(monkeypatch):
+    monkeypatch.setattr(hashing, "BCRYPT_ROUNDS", 4)
+
+    hashed = get_password_hash("password")
+    assert hashed.startswith("$2b$04$")
+    assert verify_password("password", hashed)
+
+
+def test_hashing_queue_limit(monkeypatch):
+    monkeypatch.setattr(hashing, "HASH_QUEUE_LIMIT", 0)
+    rejected = hashing.hashing_stats()["rejected"]
+
+    with pytest.raises(HTTPException) as error:
+        get_password_hash("password")
+    assert error.value.status_code == 503
+    assert hashing.hashing_stats()["rejected"] == rejected + 1
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError
+from core.pool import MeteredQueuePool, pool_stats
+from tests.utils import get_client
+
+
+def test_pool_metrics(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db", poolclass=MeteredQueuePool,
+                           pool_size=1, max_overflow=1, pool_timeout=0.1)
+
+    # The first connection fits in the pool, the second one overflows it
+    first = engine.connect()
+    second = engine.connect()
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 2
+    assert stats["overflow"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["overflow_events"] == 1
+
+    # The third one waits for a connection until it times out
+    with pytest.raises(TimeoutError):
+        engine.connect()
+    assert pool_stats(engine)["timeouts"] == 1
+
+    first.close()
+    second.close()
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 0
+    # The overflow connection is closed, the other one goes back to the pool
+    assert stats["checked_in"] == 1
+    assert stats["overflow"] == 0
+    assert stats["checkouts"] == 2
+    engine.dispose()
+
+
+def test_internal_stats_endpoint(monkeypatch):
+    client = get_client()
+    client.get("/songs/")
+
+    # Disabled by default, and only served with the shared secret
+    assert client.get("/internal/stats").status_code == 404
+    monkeypatch.setattr("routes.internal.INTERNAL_STATS_TOKEN", "secret")
+    assert client.get("/internal/stats").status_code == 403
+    assert client.get("/internal/stats", headers={"X-Internal-Token": "other"}).status_code == 403
+
+    response = client.get("/internal/stats", headers={"X-Internal-Token": "secret"})
+    assert response.status_code == 200
+    stats = response.json()
+    assert set(stats["pools"]) == {"sync", "async"}
+    assert stats["pools"]["async"]["checkouts"] >= 1
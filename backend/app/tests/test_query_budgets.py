@@ -0,0 +1,118 @@
+import pytest
+from tests.utils import get_session, get_client, create_random_auth_artist, create_random_auth_listener, \
+    create_random_song, assert_max_queries
+from crud.artist import get_artist_by_user_id
+from models.song import Song, SongSource
+from models.user import User
+
+# Budgets of the endpoints, which must not grow with the number of rows they return
+SONG_BUDGET = 5
+SORTED_SONG_BUDGET = 12
+USER_BUDGET = 2
+PLAYLISTS_BUDGET = 3
+QUESTIONS_BUDGET = 7  # The user of the token is looked up on the first request
+RANKING_BUDGET = 5
+
+
+def _add_songs(db, artist_id, count):
+    songs = [Song(title=f"budget {i}", album="Budget", genre="pop", release_date="2024-11-26", artist_id=artist_id,
+                  sources=[SongSource(source_url=f"https://example.com/{i}/{j}") for j in range(2)])
+             for i in range(count)]
+    db.add_all(songs)
+    db.commit()
+    return songs
+
+
+def _delete_songs(db, artist_id):
+    song_ids = [song_id for song_id, in db.query(Song.song_id).filter(Song.artist_id == artist_id)]
+    db.query(SongSource).filter(SongSource.song_id.in_(song_ids)).delete()
+    db.query(Song).filter(Song.song_id.in_(song_ids)).delete()
+
+
+def test_assert_max_queries():
+    db = get_session()
+    with assert_max_queries(2) as stats:
+        db.query(User).first()
+        db.query(User).count()
+    assert stats.statements == 2
+
+    # Over the budget, the statements are listed
+    with pytest.raises(AssertionError, match=r"3 SQL statements \(budget 2\):\n  1\. SELECT"):
+        with assert_max_queries(2):
+            for _ in range(3):
+                db.query(User).first()
+
+
+def test_song_listing_budgets():
+    db = get_session()
+    client = get_client()
+    user = create_random_auth_artist(db)
+    artist = get_artist_by_user_id(db, user.id)
+    song = create_random_song(db, user.username)
+
+    # The same statements with 200 songs (and their sources) as with one
+    _add_songs(db, artist.artist_id, 200)
+    for path in ("/songs/", "/songs/sorted/alphabetically", "/songs/sorted/release_date"):
+        with assert_max_queries(SONG_BUDGET):
+            response = client.get(path, params={"all": True})
+        assert response.status_code == 200
+        assert len(response.json()) >= 201
+
+        with assert_max_queries(SONG_BUDGET):
+            response = client.get(path, params={"limit": 150})
+        assert len(response.json()) == 150
+
+    with assert_max_queries(SONG_BUDGET):
+        response = client.get(f"/songs/{song.song_id}")
+    assert response.status_code == 200
+
+    # Clean up
+    _delete_songs(db, artist.artist_id)
+    db.delete(user)
+    db.commit()
+
+
+def test_sorted_song_budgets():
+    db = get_session()
+    client = get_client()
+    artist_user = create_random_auth_artist(db)
+    listener_user = create_random_auth_listener(db)
+    headers = {"Authorization": f"Bearer {listener_user.token}"}
+    artist = get_artist_by_user_id(db, artist_user.id)
+    _add_songs(db, artist.artist_id, 200)
+
+    # The songs are sorted in memory, the statements do not depend on the number of songs or artists
+    client.get("/songs/sorted/engagement_score")
+    for path in ("/songs/sorted/engagement_score", "/songs/sorted/priority", "/songs/recommendations"):
+        with assert_max_queries(SORTED_SONG_BUDGET):
+            response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        assert all(song["artist_name"] and len(song["sources"]) in (0, 2) for song in response.json())
+
+    # Clean up
+    _delete_songs(db, artist.artist_id)
+    db.delete(artist_user)
+    db.delete(listener_user)
+    db.commit()
+
+
+def test_user_budgets():
+    db = get_session()
+    client = get_client()
+    artist_user = create_random_auth_artist(db)
+    listener_user = create_random_auth_listener(db)
+
+    with assert_max_queries(USER_BUDGET):
+        assert client.get(f"/users/{listener_user.username}").status_code == 200
+    with assert_max_queries(PLAYLISTS_BUDGET):
+        assert client.get(f"/playlist/user/{listener_user.username}").status_code == 200
+    with assert_max_queries(QUESTIONS_BUDGET):
+        response = client.get("/questions/", headers={"Authorization": f"Bearer {artist_user.token}"})
+    assert response.status_code == 200
+    with assert_max_queries(RANKING_BUDGET):
+        assert client.get(f"/metrics/ranking?artist_name={artist_user.username}").status_code == 200
+
+    # Clean up
+    db.delete(artist_user)
+    db.delete(listener_user)
+    db.commit()
@@ -0,0 +1,117 @@
+import pytest
+from datetime import datetime
+from crud.listener import follow_artist
+from crud.question import get_waiting_questions_by_artist, get_waiting_questions_page
+from metrics.listeners import loyalty_points
+from models.question import Question, ResponseEnum
+from tests.utils import create_random_auth_artist, create_random_auth_listener, create_random_listener, get_client, get_session
+from crud.artist import get_artist_by_username
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """
+    Provides a clean database session for each test.
+    Automatically rolls back transactions after each test.
+    """
+    db = get_session()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+
+def create_inbox(db):
+    artist_user = create_random_auth_artist(db)
+    artist = get_artist_by_username(db, artist_user.username)
+    listeners = [create_random_listener(db) for _ in range(3)]
+
+    # Only the second listener follows the artist, so it is the most loyal one
+    follow_artist(db, listeners[1], artist_user.username)
+
+    questions = [
+        Question(listener_id=listener.listener_id, artist_id=artist.artist_id, question_text=f"Question {i}",
+                 response_status=ResponseEnum.waiting, question_date=datetime(2023, 10, 1 + i))
+        for i, listener in enumerate(listeners + listeners)
+    ]
+    db.add_all(questions)
+    db.commit()
+    return artist_user, artist, listeners
+
+
+def delete_inbox(db, artist_user, listeners):
+    for listener in listeners:
+        db.delete(listener.user)
+    db.delete(artist_user)
+    db.commit()
+
+
+def test_inbox_sorted_by_loyalty(db_session):
+    artist_user, artist, listeners = create_inbox(db_session)
+
+    sorted_questions = get_waiting_questions_by_artist(db_session, artist_user.username)
+
+    # Same order as sorting with the loyalty points of every listener
+    points = {listener.listener_id: loyalty_points(artist, listener, db_session) for listener in listeners}
+    expected = sorted(sorted_questions, key=lambda x: (-points[x.listener_id], x.question_date))
+    assert [q.question_id for q in sorted_questions] == [q.question_id for q in expected]
+    assert sorted_questions[0].listener_id == listeners[1].listener_id
+
+    # The first page only
+    assert get_waiting_questions_by_artist(db_session, artist_user.username, 3) == sorted_questions[:3]
+
+    delete_inbox(db_session, artist_user, listeners)
+
+
+def test_inbox_pages(db_session):
+    artist_user, _, listeners = create_inbox(db_session)
+    sorted_questions = get_waiting_questions_by_artist(db_session, artist_user.username)
+
+    # Walk the inbox 4 questions at a time
+    pages = []
+    page, last = get_waiting_questions_page(db_session, artist_user.username, 4)
+    pages.append(page)
+    while last is not None:
+        page, last = get_waiting_questions_page(db_session, artist_user.username, 4, last)
+        pages.append(page)
+
+    assert [len(page) for page in pages] == [4, 2]
+    assert [q for page in pages for q in page] == sorted_questions
+
+    delete_inbox(db_session, artist_user, listeners)
+
+
+def test_inbox_endpoint_cursor(db_session):
+    client = get_client()
+    artist_user, _, listeners = create_inbox(db_session)
+    headers = {"Authorization": f"Bearer {artist_user.token}"}
+
+    all_questions = client.get("/questions/", headers=headers).json()
+    assert len(all_questions) == 6
+
+    response = client.get("/questions/?limit=5", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == all_questions[:5]
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(f"/questions/?limit=5&cursor={cursor}", headers=headers)
+    assert response.json() == all_questions[5:]
+    assert "X-Next-Cursor" not in response.headers
+
+    # The top questions are the first page
+    assert client.get("/questions/top", headers=headers).json() == all_questions[:3]
+
+    # Invalid cursor
+    response = client.get("/questions/?cursor=invalid", headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor."}
+
+    # The questions of a listener have no cursors
+    listener_user = create_random_auth_listener(db_session)
+    listener_headers = {"Authorization": f"Bearer {listener_user.token}"}
+    assert "X-Next-Cursor" not in client.get("/questions/?limit=1", headers=listener_headers).headers
+    assert client.get(f"/questions/?limit=1&cursor={cursor}", headers=listener_headers).status_code == 400
+
+    db_session.delete(listener_user)
+    delete_inbox(db_session, artist_user, listeners)
@@ -0,0 +1,84 @@
+import pytest
+from crud.listener import follow_artist
+from crud.question import response_question
+from metrics.artists import rank_data, engage_artist_score, reply_rate_score, get_my_ranking
+from metrics.ranking import get_ranking_table, tier_data
+from models.question import QuestionResponse, ResponseEnum
+from tests.utils import create_random_artist, create_random_listener, get_session, ask_question
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """
+    Provides a clean database session for each test.
+    Automatically rolls back transactions after each test.
+    """
+    db = get_session()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_tier_data():
+    assert tier_data(1, 5) == {"ranking": 1, "tier": 0, "percentage": 0}
+    assert tier_data(10, 100) == {"ranking": 10, "tier": 1, "percentage": 0}
+    assert tier_data(30, 100) == {"ranking": 30, "tier": 1, "percentage": 48}
+    assert tier_data(1000, 2000)["tier"] == 4
+
+
+def test_ranking_table_metrics(db_session):
+    artist1 = create_random_artist(db_session)
+    artist2 = create_random_artist(db_session)
+    listener1 = create_random_listener(db_session)
+    listener2 = create_random_listener(db_session)
+
+    # artist1: 2 followers, 1 answered question, 1 waiting question
+    follow_artist(db_session, listener1, artist1.user.username)
+    follow_artist(db_session, listener2, artist1.user.username)
+    question = ask_question(db_session, listener1, artist1, "First?")
+    response_question(db_session, artist1, QuestionResponse(
+        question_id=question.question_id, response_text="Yes"), ResponseEnum.answered)
+    ask_question(db_session, listener2, artist1, "Second?")
+
+    ranking_table = get_ranking_table(db_session)
+    row1 = ranking_table[artist1.user.username]
+    row2 = ranking_table[artist2.user.username]
+
+    assert row1["followers"] == 2
+    assert row1["answered"] == 1
+    assert row1["waiting"] == 1
+    assert row1["total_questions"] == 2
+    assert row1["reply_rate"] == 100.0
+    assert row1["engagement_score"] == 1000 + 100 * 50 + 3 + 10
+    assert row2["engagement_score"] == 1000
+
+    # Metrics endpoints and ranking share the same figures
+    assert reply_rate_score(artist1.user.username, db_session) == row1["reply_rate"]
+    assert engage_artist_score(artist1.user.username, db_session) == row1["engagement_score"]
+    assert row1["ranking"] < row2["ranking"]
+    assert get_my_ranking(artist1.user.username, db_session) == row1["ranking"]
+    assert rank_data(artist2.user.username, db_session) == row2["rank_data"]
+
+    # Delete data created
+    db_session.delete(listener1.user)
+    db_session.delete(listener2.user)
+    db_session.delete(artist1.user)
+    db_session.delete(artist2.user)
+    db_session.commit()
+
+
+def test_ranking_table_ties_share_ranking(db_session):
+    artist1 = create_random_artist(db_session)
+    artist2 = create_random_artist(db_session)
+
+    ranking_table = get_ranking_table(db_session)
+
+    # Both artists have no activity, so they share the same score and ranking
+    assert ranking_table[artist1.user.username]["ranking"] == ranking_table[artist2.user.username]["ranking"]
+
+    # Delete data created
+    db_session.delete(artist1.user)
+    db_session.delete(artist2.user)
+    db_session.commit()
@@ -0,0 +1,94 @@
+import pytest
+from crud.listener import follow_artist
+from metrics.listeners import get_preferences
+from metrics.ranking import (
+    get_ranking_snapshot,
+    invalidate_ranking_snapshot,
+    is_ranking_snapshot_fresh,
+    refresh_ranking_snapshot
+)
+from tests.utils import create_random_artist, create_random_listener, get_session
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """
+    Provides a clean database session for each test.
+    Automatically rolls back transactions after each test.
+    """
+    db = get_session()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_snapshot_is_reused(db_session):
+    artist = create_random_artist(db_session)
+
+    snapshot = refresh_ranking_snapshot(db_session)
+    assert is_ranking_snapshot_fresh()
+    assert get_ranking_snapshot(db_session) is snapshot
+    assert artist.user.username in snapshot
+
+    # Delete data created
+    db_session.delete(artist.user)
+    db_session.commit()
+
+
+def test_snapshot_invalidated_by_follow(db_session):
+    artist = create_random_artist(db_session)
+    listener = create_random_listener(db_session)
+
+    snapshot = refresh_ranking_snapshot(db_session)
+    assert snapshot[artist.user.username]["followers"] == 0
+
+    # The follow is committed, so the snapshot is stale
+    follow_artist(db_session, listener, artist.user.username)
+    assert not is_ranking_snapshot_fresh()
+
+    # Rebuilding it picks up the new follower
+    snapshot = refresh_ranking_snapshot(db_session)
+    assert snapshot[artist.user.username]["followers"] == 1
+
+    # Delete data created
+    db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.commit()
+
+
+def test_stale_snapshot_is_served(db_session):
+    artist = create_random_artist(db_session)
+
+    snapshot = refresh_ranking_snapshot(db_session)
+    invalidate_ranking_snapshot()
+
+    # Readers get the stale snapshot while it is rebuilt in the background
+    assert get_ranking_snapshot(db_session) is snapshot
+
+    # Unless it misses an artist asked for
+    new_artist = create_random_artist(db_session)
+    snapshot = get_ranking_snapshot(db_session, [artist.user.username, new_artist.user.username])
+    assert new_artist.user.username in snapshot
+
+    # Delete data created
+    db_session.delete(artist.user)
+    db_session.delete(new_artist.user)
+    db_session.commit()
+
+
+def test_preferences_of_new_artist(db_session):
+    listener = create_random_listener(db_session)
+    refresh_ranking_snapshot(db_session)
+
+    # An artist created after the snapshot is ranked too
+    artist = create_random_artist(db_session)
+    follow_artist(db_session, listener, artist.user.username)
+    preferences = {output.username: output for output in get_preferences(db_session, listener.user)}
+    assert preferences[artist.user.username].rank_data is not None
+
+    # Delete data created
+    db_session.delete(listener.user)
+    db_session.delete(artist.user)
+    db_session.commit()
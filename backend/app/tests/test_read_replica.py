@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import create_engine
+from starlette.requests import Request
+import core.routing as routing
+from core.cache import SQLiteBackend
+from core.config import Base
+from core.routing import RoutingSession, route_session, wrote_recently
+from core.security import create_access_token
+from models.user import User
+import main  # noqa: F401 (registers every model)
+
+
+@pytest.fixture(scope="function")
+def engines(tmp_path):
+    primary = create_engine(f"sqlite:///{tmp_path}/primary.db")
+    replica = create_engine(f"sqlite:///{tmp_path}/replica.db")
+    for engine in (primary, replica):
+        Base.metadata.create_all(bind=engine)
+
+    # A user only in the replica, so reads from it can be told apart
+    with replica.begin() as connection:
+        connection.execute(User.__table__.insert().values(username="replicated", email="replicated@replicated.com"))
+
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def make_request(method: str, user_id: int = None) -> Request:
+    headers = [(b"authorization", f"Bearer {create_access_token(user_id)}".encode())] if user_id else []
+    return Request({"type": "http", "method": method, "path": "/", "headers": headers})
+
+
+def test_reads_and_writes_are_routed(engines):
+    primary, replica = engines
+
+    # Sessions without a request use the primary
+    with RoutingSession(primary=primary, replica=replica) as db:
+        assert db.query(User).filter(User.username == "replicated").first() is None
+
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("GET"), 10)
+        assert db.query(User).filter(User.username == "replicated").first() is not None
+
+        # Writes go to the primary, and so do the reads after them
+        db.add(User(username="written", email="written@written.com"))
+        db.commit()
+        assert db.query(User).filter(User.username == "written").first() is not None
+        assert db.query(User).filter(User.username == "replicated").first() is None
+
+    # Other methods use the primary
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("POST"), 10)
+        assert db.query(User).filter(User.username == "replicated").first() is None
+
+
+def test_reads_stick_to_primary_after_write(engines):
+    primary, replica = engines
+
+    # The user writes
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("POST", 1000), 10)
+        db.add(User(username="sticky", email="sticky@sticky.com"))
+        db.commit()
+    assert wrote_recently("1000", 10)
+
+    # Its reads go to the primary for a while
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("GET", 1000), 10)
+        assert db.query(User).filter(User.username == "sticky").first() is not None
+
+    # Other users read from the replica
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("GET", 1001), 10)
+        assert db.query(User).filter(User.username == "sticky").first() is None
+
+    # Once the replica has caught up, the user reads from it again
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("GET", 1000), 0)
+        assert db.query(User).filter(User.username == "replicated").first() is not None
+
+
+def test_writes_are_shared_by_workers(engines, monkeypatch, tmp_path):
+    primary, replica = engines
+
+    # The user writes through a worker
+    monkeypatch.setattr(routing, "_backend", SQLiteBackend(str(tmp_path / "cache.db")))
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("POST", 1002), 10)
+        db.add(User(username="shared", email="shared@shared.com"))
+        db.commit()
+
+    # And reads through another one, sharing the cache file
+    monkeypatch.setattr(routing, "_backend", SQLiteBackend(str(tmp_path / "cache.db")))
+    with RoutingSession(primary=primary, replica=replica) as db:
+        route_session(db, make_request("GET", 1002), 10)
+        assert db.query(User).filter(User.username == "shared").first() is not None
@@ -0,0 +1,161 @@
+import time
+import core.response_cache as response_cache
+from tests.utils import get_session, get_client, create_random_auth_artist, create_random_auth_listener, \
+    random_lower_string, assert_max_queries
+from core.cache import MemoryBackend, SQLiteBackend
+from core.response_cache import cached_response, invalidate_tags, response_cache_stats
+
+
+def test_cached_song():
+    db = get_session()
+    client = get_client()
+    user = create_random_auth_artist(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+    song_data = {"title": random_lower_string(), "release_date": "2024-11-26", "artist_name": user.username,
+                 "sources": ["https://example.com/a"]}
+    song = client.post("/songs/", json=song_data, headers=headers).json()
+    path = f"/songs/{song['song_id']}"
+
+    # The first request learns the tags of the song (its artist), the next one caches it and the
+    # following ones are served from the cache, with the same body and headers
+    client.get(path)
+    response = client.get(path)
+    hits = response_cache_stats()["hits"]
+    with assert_max_queries(0):
+        cached = client.get(path)
+    assert cached.json() == response.json()
+    assert cached.headers["ETag"] == response.headers["ETag"]
+    assert response_cache_stats()["hits"] == hits + 1
+    with assert_max_queries(0):
+        assert client.get(path, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    # Updating the song invalidates it
+    song_data["sources"] = ["https://example.com/b"]
+    assert client.put(path, json=song_data, headers=headers).status_code == 200
+    assert client.get(path).json()["sources"] == ["https://example.com/b"]
+
+    # And so does renaming its artist
+    user_update = {"username": random_lower_string(), "email": user.email}
+    assert client.put("/users/user", json=user_update, headers=headers).status_code == 200
+    assert client.get(path).json()["artist_name"] == user_update["username"]
+    assert client.get(f"/users/{user_update['username']}").json()["username"] == user_update["username"]
+
+    # And deleting it
+    assert client.delete(path, headers=headers).status_code == 200
+    assert client.get(path).status_code == 404
+
+    # Clean up
+    db.delete(user)
+    db.commit()
+
+
+def test_cached_followers():
+    db = get_session()
+    client = get_client()
+    artist = create_random_auth_artist(db)
+    listener = create_random_auth_listener(db)
+    path = f"/metrics/followers?artist_name={artist.username}"
+
+    assert client.get(path).json() == 0
+    with assert_max_queries(0):
+        assert client.get(path).json() == 0
+
+    # Following (and unfollowing) the artist invalidates its followers
+    headers = {"Authorization": f"Bearer {listener.token}"}
+    assert client.post(f"/listeners/follow/{artist.username}", headers=headers).status_code == 200
+    assert client.get(path).json() == 1
+    assert client.post(f"/listeners/unfollow/{artist.username}", headers=headers).status_code == 200
+    assert client.get(path).json() == 0
+
+    # Clean up
+    db.delete(artist)
+    db.delete(listener)
+    db.commit()
+
+
+def test_lru_ttl_and_tags(monkeypatch):
+    calls = []
+
+    @cached_response(60, key=("item",), key_tags=lambda item: [f"item:{item}"])
+    def get_item(item):
+        calls.append(item)
+        return {"item": item}
+
+    @cached_response(0.01, key=("item",))
+    def get_volatile(item):
+        calls.append(item)
+        return item
+
+    # The least recently used response is evicted (with its tag versions)
+    monkeypatch.setattr(response_cache, "_backend", MemoryBackend(max_size=6))
+    get_item(item=1)
+    get_item(item=2)
+    assert get_item(item=1) == {"item": 1}
+    get_item(item=3)
+    assert calls == [1, 2, 3]
+    assert response_cache_stats()["backend"]["evictions"] == 0
+    get_item(item=4)
+    get_item(item=2)
+    assert calls == [1, 2, 3, 4, 2]
+
+    # Only the responses of the invalidated tags are computed again
+    invalidate_tags("item:1")
+    get_item(item=1)
+    get_item(item=4)
+    assert calls == [1, 2, 3, 4, 2, 1]
+
+    # An expired response is not served
+    get_volatile(item="a")
+    time.sleep(0.02)
+    get_volatile(item="a")
+    assert calls[-2:] == ["a", "a"]
+
+
+def test_shared_invalidation(monkeypatch, tmp_path):
+    calls = []
+
+    @cached_response(60, key=("item",), key_tags=lambda item: [f"item:{item}"])
+    def get_item(item):
+        calls.append(item)
+        return item
+
+    # A response cached by a worker is invalidated by another one sharing the SQLite file
+    monkeypatch.setattr(response_cache, "_backend", SQLiteBackend(str(tmp_path / "cache.db")))
+    get_item(item=1)
+    get_item(item=1)
+    monkeypatch.setattr(response_cache, "_backend", SQLiteBackend(str(tmp_path / "cache.db")))
+    get_item(item=1)
+    invalidate_tags("item:1")
+    get_item(item=1)
+    assert calls == [1, 1]
+
+
+def test_invalidation_while_computing(monkeypatch, tmp_path):
+    calls = []
+
+    @cached_response(60, key=("item",), key_tags=lambda item: [f"item:{item}"],
+                     tags=lambda data, item: [f"owner:{data['owner']}"])
+    def get_item(item, invalidate=()):
+        calls.append(item)
+        # Another worker invalidates the response while it is computed
+        if invalidate:
+            other_worker.incr(f"tag:{invalidate}")
+        return {"item": item, "owner": "a"}
+
+    monkeypatch.setattr(response_cache, "_backend", SQLiteBackend(str(tmp_path / "cache.db")))
+    other_worker = SQLiteBackend(str(tmp_path / "cache.db"))
+
+    # The tags of the result are only known after the first computation
+    get_item(item=1)
+    get_item(item=1)
+    get_item(item=1)
+    assert calls == [1, 1]
+
+    # A response whose tags were invalidated while computing it is not stored
+    for tag in ("item:1", "owner:a"):
+        calls.clear()
+        invalidate_tags("item:1")
+        get_item(item=1, invalidate=tag)
+        get_item(item=1)
+        get_item(item=1)
+        assert calls == [1, 1]
@@ -0,0 +1,22 @@
+from sqlalchemy import create_engine, inspect, text
+from core.config import Base
+from core.schema import create_schema
+import main  # noqa: F401 (registers every model)
+
+
+def test_create_schema_upgrades_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE songs (song_id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, album VARCHAR, "
+                                "genre VARCHAR, release_date VARCHAR NOT NULL, artist_id INTEGER NOT NULL)"))
+        connection.execute(text("INSERT INTO songs VALUES (1, 'title', NULL, NULL, '2024-11-26', 1)"))
+
+    # The missing columns (with their defaults) and indexes are added, and it can run again
+    create_schema(engine, Base.metadata)
+    create_schema(engine, Base.metadata)
+    inspector = inspect(engine)
+    assert "version" in {column["name"] for column in inspector.get_columns("songs")}
+    assert "ix_songs_title_song_id" in {index["name"] for index in inspector.get_indexes("songs")}
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT version FROM songs")).scalar() == 1
+    engine.dispose()
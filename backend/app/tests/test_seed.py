@@ -0,0 +1,109 @@
+import io
+import json
+import logging
+import core.lifespan as lifespan
+from tests.utils import get_session, random_lower_string
+from crud.seed import _iter_json_container, iter_json_records, seed_database
+from crud.listener import get_listener_by_username
+from crud.artist import get_artist_by_username
+from models.question import Question
+from models.song import Song
+from models.user import User
+
+
+def test_streaming_json_reader():
+    data = {"a": {"value": 1, "list": [1, 2, 3]}, "b": {"value": 22222}, "c": {"text": "x,]}"}}
+
+    # The values are the same whatever the chunks they are split into
+    for chunk_size in (1, 3, 7, 1 << 16):
+        values = list(_iter_json_container(io.StringIO(json.dumps(data, indent=4)), chunk_size))
+        assert values == list(data.values())
+    assert list(_iter_json_container(io.StringIO(" [ ] "), 2)) == []
+
+
+def _sample_files(tmp_path):
+    artists = [
+        {"name": random_lower_string()[:12], "email": f"{random_lower_string()[:10]}@seed.com", "password": "password",
+         "genres": "pop", "image_url": None, "description": None,
+         "songs": [{"name": f"song {i}", "release_date": "2024-11-15", "album": "Album", "genre": "pop",
+                    "sources": [f"https://example.com/{i}"]} for i in range(3)]}
+        for _ in range(2)
+    ]
+    users = {
+        username: {"username": username, "email": f"{username}@seed.com", "password": "password",
+                   "followers": [artist["name"] for artist in artists],
+                   "artist_questions": {artists[0]["name"]: "A question?"}}
+        for username in (random_lower_string()[:12] for _ in range(3))
+    }
+
+    # JSON files for the artists and NDJSON for the listeners
+    (tmp_path / "artists.json").write_text(json.dumps(artists))
+    (tmp_path / "users.ndjson").write_text("\n".join(json.dumps(user) for user in users.values()))
+    return artists, users
+
+
+def test_seed_database(tmp_path):
+    db = get_session()
+    artists, users = _sample_files(tmp_path)
+    assert len(list(iter_json_records(str(tmp_path / "users.ndjson")))) == 3
+
+    report = seed_database(db, artists_path=str(tmp_path / "artists.json"), users_path=str(tmp_path / "users.ndjson"),
+                           batch_size=2, hash_mode="shared", max_songs=2)
+    assert report["records"] == 5
+    assert report["users"] == 5
+    assert report["songs"] == 4
+    assert report["sources"] == 4
+    assert report["follows"] == 6
+    assert report["questions"] == 3
+    assert report["rows_per_second"] > 0
+
+    # The counters of the artists were rebuilt
+    artist = get_artist_by_username(db, artists[0]["name"])
+    assert artist.stats.followers == 3
+    assert artist.stats.waiting == 3
+    assert db.query(Song).filter(Song.artist_id == artist.artist_id).count() == 2
+    listener = get_listener_by_username(db, next(iter(users)))
+    assert db.query(Question).filter(Question.listener_id == listener.listener_id).count() == 1
+
+    # Loading it again inserts nothing
+    report = seed_database(db, artists_path=str(tmp_path / "artists.json"), users_path=str(tmp_path / "users.ndjson"),
+                           hash_mode="shared", max_songs=2)
+    assert report["users"] == report["songs"] == report["follows"] == report["questions"] == 0
+
+    # Clean up
+    usernames = [artist["name"] for artist in artists] + list(users)
+    for user in db.query(User).filter(User.username.in_(usernames)).all():
+        db.delete(user)
+    db.commit()
+
+
+def test_seed_precomputed_hashes(tmp_path):
+    db = get_session()
+    username = random_lower_string()[:12]
+    user = {"username": username, "email": f"{username}@seed.com", "hashed_password": "$2b$04$precomputed"}
+    other = random_lower_string()[:12]
+    (tmp_path / "users.json").write_text(json.dumps([user, {"username": other, "email": f"{other}@seed.com",
+                                                            "password": "password"}]))
+
+    # Only the records with a hash are loaded, as they are
+    report = seed_database(db, users_path=str(tmp_path / "users.json"), hash_mode="precomputed")
+    assert report["users"] == 1
+    assert report["skipped"] == 1
+    assert db.query(User).filter(User.username == username).one().hashed_password == user["hashed_password"]
+    assert db.query(User).filter(User.username == other).first() is None
+
+    # Clean up
+    db.delete(db.query(User).filter(User.username == username).one())
+    db.commit()
+
+
+def test_seed_on_startup_logs_errors(monkeypatch, caplog):
+    def failing_seed(db, **kwargs):
+        raise ValueError("Broken sample data")
+    monkeypatch.setattr(lifespan, "seed_database", failing_seed)
+
+    # The app still starts, with the error and its traceback in the log
+    with caplog.at_level(logging.INFO, logger="echolink.seed"):
+        lifespan.seed_sample_data()
+    assert [(record.levelno, record.exc_info[1].args) for record in caplog.records] == \
+        [(logging.ERROR, ("Broken sample data",))]
@@ -0,0 +1,110 @@
+import threading
+import time
+import pytest
+import core.single_flight as single_flight_module
+import metrics.ranking as ranking
+from concurrent.futures import ThreadPoolExecutor
+from core.cache import SQLiteBackend
+from core.single_flight import single_flight, shared_flight, single_flight_stats
+
+
+def test_single_flight():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return {"value": len(calls)}
+
+    # The concurrent calls wait for the one in flight and share its result
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        leader = executor.submit(single_flight, "test", compute)
+        started.wait()
+        coalesced = single_flight_stats()["coalesced"]
+        followers = [executor.submit(single_flight, "test", compute) for _ in range(7)]
+        while single_flight_stats()["coalesced"] < coalesced + 7:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+
+    # The next call computes it again
+    assert single_flight("test", compute) == {"value": 2}
+
+
+def test_single_flight_error():
+    release = threading.Event()
+
+    def compute():
+        release.wait()
+        raise ValueError("ranking failed")
+
+    # The error is raised to every call
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(single_flight, "error", compute)]
+        while single_flight_stats()["in_flight"] == 0:
+            time.sleep(0.01)
+        futures.append(executor.submit(single_flight, "error", compute))
+        time.sleep(0.05)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="ranking failed"):
+                future.result()
+    assert single_flight_stats()["in_flight"] == 0
+
+
+def test_shared_flight(monkeypatch, tmp_path):
+    monkeypatch.setattr(single_flight_module, "SINGLE_FLIGHT_SHARED", True)
+    monkeypatch.setattr(single_flight_module, "_backend", SQLiteBackend(str(tmp_path / "cache.db")))
+    assert shared_flight("table", lambda: {"a": 1}) == {"a": 1}
+
+    # Another worker holds the lock: its result is used once it is published, if it started computing
+    # it after the call
+    other_worker = SQLiteBackend(str(tmp_path / "cache.db"))
+
+    def publish(value, started=None):
+        time.sleep(0.1)
+        result = {"started": started or time.time(), "value": value}
+        other_worker.set("flight:table:result", result, 30)
+        other_worker.delete("flight:table:lock")
+
+    other_worker.add("flight:table:lock", "other", 30)
+    thread = threading.Thread(target=publish, args=({"a": 2},))
+    thread.start()
+    assert shared_flight("table", lambda: {"a": 3}) == {"a": 2}
+    thread.join()
+
+    # A result which started computing before the call may miss its changes: it is computed again
+    other_worker.add("flight:table:lock", "other", 30)
+    thread = threading.Thread(target=publish, args=({"a": 5}, time.time()))
+    thread.start()
+    assert shared_flight("table", lambda: {"a": 6}) == {"a": 6}
+    thread.join()
+
+    # A lock which is not released in time is not waited for
+    monkeypatch.setattr(single_flight_module, "SINGLE_FLIGHT_TIMEOUT", 0.1)
+    other_worker.add("flight:table:lock", "other", 30)
+    assert shared_flight("table", lambda: {"a": 4}) == {"a": 4}
+
+
+def test_ranking_snapshot_single_flight(monkeypatch):
+    calls = []
+
+    def get_ranking_table(db):
+        calls.append(db)
+        time.sleep(0.2)
+        return {"artist": {"followers": 1}}
+
+    # Cold snapshot: the concurrent requests rank the artists once
+    monkeypatch.setattr(ranking, "get_ranking_table", get_ranking_table)
+    monkeypatch.setitem(ranking._snapshot, "table", None)
+    monkeypatch.setitem(ranking._snapshot, "built_at", 0.0)
+    monkeypatch.setitem(ranking._snapshot, "built_version", -1)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tables = list(executor.map(lambda i: ranking.get_ranking_snapshot(i, ["artist"]), range(8)))
+    assert len(calls) == 1
+    assert all(table == {"artist": {"followers": 1}} for table in tables)
@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+import routes.song as song_routes
+from tests.utils import get_session, get_client, create_random_artist
+from models.song import Song, SongSource
+
+
+def test_export_songs(monkeypatch):
+    db = get_session()
+    client = get_client()
+    artist = create_random_artist(db)
+    db.add_all([Song(title=f"export, {i}", release_date="2024-11-26", artist_id=artist.artist_id,
+                     sources=[SongSource(source_url=f"https://example.com/{i}"),
+                              SongSource(source_url=f"https://example.com/{i}/b")])
+                for i in range(5)])
+    db.commit()
+    songs = client.get("/songs/", params={"all": True}).json()
+
+    # Small batches: the songs are streamed in several chunks
+    batches = []
+    format_batch = song_routes._format_export_batch
+    monkeypatch.setattr(song_routes, "EXPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(song_routes, "_format_export_batch",
+                        lambda songs, export_format: batches.append(len(songs)) or format_batch(songs, export_format))
+    response = client.get("/songs/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == sorted(songs, key=lambda song: song["song_id"])
+    assert max(batches) == 2
+    assert sum(batches) == len(songs)
+
+    response = client.get("/songs/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == len(songs)
+    exported = next(row for row in rows if row["title"] == "export, 3")
+    assert exported["artist_name"] == artist.user.username
+    assert exported["sources"].split(" ") == ["https://example.com/3", "https://example.com/3/b"]
+
+    assert client.get("/songs/export", params={"format": "xml"}).status_code == 422
+
+    # Clean up
+    db.delete(artist.user)
+    db.commit()
@@ -0,0 +1,46 @@
+import json
+from tests.utils import get_session, get_client, create_random_auth_artist, random_lower_string, \
+    assert_max_queries
+from crud.song_fragments import song_fragments_stats
+
+
+def test_song_fragments():
+    db = get_session()
+    client = get_client()
+    user = create_random_auth_artist(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+    songs = [client.post("/songs/", json={"title": f"fragment {i}", "release_date": "2024-11-26",
+                                          "artist_name": user.username, "sources": [f"https://example.com/{i}"]},
+                         headers=headers).json() for i in range(3)]
+
+    # The listings send the same JSON as the songs
+    response = client.get("/songs/", params={"all": True})
+    assert response.headers["content-type"] == "application/json"
+    listed = {song["song_id"]: song for song in response.json()}
+    for song in songs:
+        assert listed[song["song_id"]] == client.get(f"/songs/{song['song_id']}").json()
+
+    # Once cached, only the versions of the songs are read
+    hits = song_fragments_stats()["hits"]
+    with assert_max_queries(1):
+        cached = client.get("/songs/", params={"all": True})
+    assert cached.content == response.content
+    assert song_fragments_stats()["hits"] >= hits + 3
+
+    # Changing a song (its sources) or the username of its artist changes its JSON
+    song_update = {"title": "fragment 0", "release_date": "2024-11-26", "artist_name": user.username,
+                   "sources": ["https://example.com/new"]}
+    assert client.put(f"/songs/{songs[0]['song_id']}", json=song_update, headers=headers).status_code == 200
+    user_update = {"username": random_lower_string(), "email": user.email}
+    assert client.put("/users/user", json=user_update, headers=headers).status_code == 200
+    listed = {song["song_id"]: song for song in json.loads(client.get("/songs/", params={"all": True}).content)}
+    assert listed[songs[0]["song_id"]]["sources"] == ["https://example.com/new"]
+    assert all(listed[song["song_id"]]["artist_name"] == user_update["username"] for song in songs)
+
+    # A deleted song is not listed
+    assert client.delete(f"/songs/{songs[1]['song_id']}", headers=headers).status_code == 200
+    assert songs[1]["song_id"] not in [song["song_id"] for song in client.get("/songs/", params={"all": True}).json()]
+
+    # Clean up
+    db.delete(user)
+    db.commit()
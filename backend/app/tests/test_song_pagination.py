@@ -0,0 +1,52 @@
+from tests.utils import get_session, get_client, create_random_artist, create_random_song
+from core.pagination import encode_cursor, decode_cursor
+
+
+def _walk(client, path, limit):
+    songs, params = [], {"limit": limit}
+    while True:
+        response = client.get(path, params=params)
+        assert response.status_code == 200
+        assert len(response.json()) <= limit
+        songs.extend(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            return songs
+        assert response.headers["Link"].endswith('>; rel="next"')
+        params = {"limit": limit, "cursor": response.headers["X-Next-Cursor"]}
+
+
+def test_keyset_pagination():
+    db = get_session()
+    client = get_client()
+    artist = create_random_artist(db)
+    # Repeated titles and release dates: the song id breaks the ties
+    for i in range(12):
+        create_random_song(db, artist.user.username, title=f"page {i % 3}", release_date=f"2024-0{i % 4 + 1}-01")
+
+    for path, key in (("/songs/", lambda song: song["song_id"]),
+                      ("/songs/sorted/alphabetically", lambda song: (song["title"], song["song_id"])),
+                      ("/songs/sorted/release_date", lambda song: (song["release_date"], song["song_id"]))):
+        songs = client.get(path, params={"all": True}).json()
+        expected = sorted(songs, key=key)
+
+        # Every song once, in order, whatever the size of the pages
+        assert _walk(client, path, 5) == expected
+        assert _walk(client, path, len(songs)) == expected
+
+    # Clean up
+    db.delete(artist.user)
+    db.commit()
+
+
+def test_invalid_cursor():
+    client = get_client()
+    response = client.get("/songs/", params={"limit": 1})
+    assert response.status_code == 200
+
+    # A cursor is only valid for the listing it came from
+    cursor = encode_cursor("songs:id:asc", [1])
+    assert decode_cursor("songs:id:asc", cursor) == [1]
+    assert client.get("/songs/sorted/alphabetically", params={"cursor": cursor}).status_code == 400
+    assert client.get("/songs/", params={"cursor": "not a cursor"}).status_code == 400
+    assert client.get("/songs/", params={"cursor": encode_cursor("songs:id:asc", ["1"])}).status_code == 400
+    assert client.get("/songs/", params={"limit": 0}).status_code == 422
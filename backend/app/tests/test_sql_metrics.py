@@ -0,0 +1,60 @@
+import logging
+import re
+from tests.utils import get_session, get_client, create_random_user
+import core.sql_metrics as sql_metrics
+from core.sql_metrics import track_sql, sql_stats
+from models.user import User
+
+
+def test_track_sql():
+    db = get_session()
+
+    with track_sql() as outer:
+        db.query(User).first()
+        with track_sql() as inner:
+            db.query(User).count()
+            db.query(User).first()
+    assert inner.statements == 2
+    assert outer.statements == 3
+    assert outer.db_time >= inner.db_time > 0
+
+
+def test_server_timing_header():
+    db = get_session()
+    client = get_client()
+    user = create_random_user(db)
+
+    response = client.get(f"/users/{user.username}")
+    assert response.status_code == 200
+    timing = re.match(r'db;dur=([\d.]+);desc="(\d+) statements", total;dur=([\d.]+)', response.headers["Server-Timing"])
+    assert timing is not None
+    assert int(timing.group(2)) >= 1
+    assert float(timing.group(1)) <= float(timing.group(3))
+
+    # The requests are aggregated by route template
+    stats = sql_stats()["GET /users/{username}"]
+    assert stats["requests"] >= 1
+    assert stats["statements_max"] >= 1
+
+    # Clean up
+    db.delete(user)
+    db.commit()
+
+
+def test_route_budget(monkeypatch, caplog):
+    monkeypatch.setattr(sql_metrics, "SQL_ROUTE_BUDGETS", {"GET /budget": 2})
+    monkeypatch.setattr(sql_metrics, "SQL_STATEMENT_BUDGET", 0)
+    monkeypatch.setattr(sql_metrics, "_routes", {})
+    stats = sql_metrics.SQLStats()
+    stats.statements = 3
+
+    # Requests over the budget of their route are logged and counted
+    with caplog.at_level(logging.WARNING, logger="echolink.sql"):
+        sql_metrics.record_request("GET /budget", stats, 0.01)
+        sql_metrics.record_request("GET /unlimited", stats, 0.01)
+    assert sql_stats()["GET /budget"]["over_budget"] == 1
+    assert sql_stats()["GET /budget"]["budget"] == 2
+    assert [record.getMessage().split()[0:2] for record in caplog.records] == [["GET", "/budget"]]
+
+    # Routes without a budget are not checked
+    assert sql_stats()["GET /unlimited"]["over_budget"] == 0
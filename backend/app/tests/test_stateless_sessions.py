@@ -0,0 +1,77 @@
+import pytest
+from tests.utils import get_session, get_client, create_random_user_input
+import core.security
+import core.sessions as sessions
+import crud.user
+from crud.user import create_user
+from core.security import decode_access_token
+from models.user import RevokedSession
+
+
+@pytest.fixture
+def stateless(monkeypatch):
+    for module in (core.security, crud.user):
+        monkeypatch.setattr(module, "STATELESS_SESSIONS", True)
+
+
+def _login(client, user_input):
+    response = client.post("/login/", json={"email": user_input.email, "password": user_input.password})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_stateless_sessions(stateless):
+    db = get_session()
+    client = get_client()
+
+    user_input = create_random_user_input()
+    user = create_user(db, user_input)
+
+    # Every login is a new session and nothing is written in the user
+    first = _login(client, user_input)
+    second = _login(client, user_input)
+    assert first != second
+    db.refresh(user)
+    assert user.token is None
+    assert client.get("/login/check_token", headers=first).status_code == 200
+    assert client.get("/login/check_token", headers=second).status_code == 200
+
+    # Logging out revokes only that session
+    assert client.post("/login/logout", headers=first).status_code == 200
+    assert client.get("/login/check_token", headers=first).status_code == 401
+    assert client.get("/login/check_token", headers=second).status_code == 200
+
+    # The revocation is persisted, so it is reloaded by the other workers (or after a restart)
+    session_id = decode_access_token(first["Authorization"][len("Bearer "):]).sid
+    assert db.query(RevokedSession).filter(RevokedSession.session_id == session_id).count() == 1
+    sessions.clear_revocations()
+    assert client.get("/login/check_token", headers=first).status_code == 401
+
+    # Deleting the account revokes all its sessions
+    token = decode_access_token(second["Authorization"][len("Bearer "):])
+    assert client.delete("/users/user", headers=second).status_code == 200
+    assert sessions.is_session_revoked(db, token)
+    assert client.get("/login/check_token", headers=second).status_code == 401
+
+    # Clean up
+    db.query(RevokedSession).filter(RevokedSession.user_id == token.sub).delete()
+    db.commit()
+
+
+def test_stateful_tokens_by_default():
+    db = get_session()
+    client = get_client()
+
+    user_input = create_random_user_input()
+    user = create_user(db, user_input)
+
+    # Without stateless sessions the token is stored in the user and has no session id
+    headers = _login(client, user_input)
+    db.refresh(user)
+    assert headers["Authorization"] == f"Bearer {user.token}"
+    assert decode_access_token(user.token).sid is None
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+
+    # Clean up
+    db.delete(user)
+    db.commit()
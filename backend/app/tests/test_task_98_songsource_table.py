@@ -45,6 +45,12 @@ def test_create_song_with_sources(db_session):
     assert "https://example.com/source1" in retrieved_song.sources
     assert "https://example.com/source2" in retrieved_song.sources
 
+    # The sources are saved with the song (another session reads them)
+    other_session = get_session()
+    assert sorted(get_song_by_id(other_session, created_song.song_id).sources) == \
+        ["https://example.com/source1", "https://example.com/source2"]
+    other_session.close()
+
     # Clean up
     delete_song(db_session, retrieved_song.song_id)
     db_session.delete(artist.user)
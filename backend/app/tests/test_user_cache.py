@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from datetime import timedelta
+from tests.utils import get_session, get_client, create_random_auth_user
+import core.user_cache as user_cache
+from core.cache import MemoryBackend, SQLiteBackend
+from core.security import create_access_token
+
+
+def test_user_cache_hits(monkeypatch):
+    # Start from an empty cache and new user versions, whatever the previous tests cached or cleared
+    user_cache.clear_user_cache()
+    monkeypatch.setattr(user_cache, "_backend", MemoryBackend())
+    monkeypatch.setattr(user_cache, "USER_CACHE_SIZE", 1024)
+
+    db = get_session()
+    client = get_client()
+
+    user = create_random_auth_user(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+
+    # The first request looks the user up and caches it, the next ones skip the lookup
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+    before = user_cache.user_cache_stats()
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+    stats = user_cache.user_cache_stats()
+    assert stats["hits"] == before["hits"] + 2
+    assert stats["misses"] == before["misses"]
+
+    # The cached user can be modified by the route (the profile update is stored)
+    response = client.put("/users/user", json={"description": "Cached"}, headers=headers)
+    assert response.status_code == 200
+    assert client.get(f"/users/{user.username}").json()["description"] == "Cached"
+
+    # Clean up
+    db.delete(user)
+    db.commit()
+
+
+def test_user_cache_invalidation():
+    db = get_session()
+    client = get_client()
+
+    user = create_random_auth_user(db)
+    token = user.token
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+
+    # Logging out invalidates the cached token
+    assert client.post("/login/logout", headers=headers).status_code == 200
+    assert client.get("/login/check_token", headers=headers).status_code == 401
+
+    # So does a token changed from another session
+    db.refresh(user)
+    user.token = create_access_token(user.id)
+    db.commit()
+    headers = {"Authorization": f"Bearer {user.token}"}
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+    user.token = create_access_token(user.id, expires_delta=timedelta(days=2))
+    db.commit()
+    assert client.get("/login/check_token", headers=headers).status_code == 401
+
+    # And deleting the user
+    headers = {"Authorization": f"Bearer {user.token}"}
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+    db.delete(user)
+    db.commit()
+    assert client.get("/login/check_token", headers=headers).status_code == 401
+
+
+def test_user_cache_shared_invalidation(monkeypatch, tmp_path):
+    db = get_session()
+    client = get_client()
+
+    # Two workers, each with its own cached tokens and its own connection to the shared cache
+    workers = [(OrderedDict(), {}, SQLiteBackend(str(tmp_path / "cache.db"))) for _ in range(2)]
+
+    def use_worker(worker):
+        entries, tokens_by_user, backend = worker
+        monkeypatch.setattr(user_cache, "_entries", entries)
+        monkeypatch.setattr(user_cache, "_tokens_by_user", tokens_by_user)
+        monkeypatch.setattr(user_cache, "_backend", backend)
+
+    user = create_random_auth_user(db)
+    headers = {"Authorization": f"Bearer {user.token}"}
+    use_worker(workers[0])
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+    assert client.get("/login/check_token", headers=headers).status_code == 200
+
+    # Logging out through the other worker invalidates the token cached by the first one
+    use_worker(workers[1])
+    assert client.post("/login/logout", headers=headers).status_code == 200
+    use_worker(workers[0])
+    assert client.get("/login/check_token", headers=headers).status_code == 401
+
+    # Clean up
+    db.refresh(user)
+    db.delete(user)
+    db.commit()
+
+
+def test_user_cache_bounded(monkeypatch):
+    monkeypatch.setattr(user_cache, "USER_CACHE_SIZE", 2)
+    user_cache.clear_user_cache()
+    db = get_session()
+    client = get_client()
+
+    users = [create_random_auth_user(db) for _ in range(3)]
+    for user in users:
+        assert client.get("/login/check_token", headers={"Authorization": f"Bearer {user.token}"}).status_code == 200
+
+    # The least recently used token was evicted
+    assert user_cache.user_cache_stats()["size"] == 2
+    assert users[0].token not in user_cache._entries
+
+    # Clean up
+    for user in users:
+        db.delete(user)
+    db.commit()
@@ -1,6 +1,9 @@
 import random
 import string
+from contextlib import contextmanager
+from unittest.mock import patch
 from core.config import get_db
+from core.sql_metrics import track_sql
 from main import app
 from fastapi.testclient import TestClient
 from models.user import UserInput, UserLogin, RoleEnum
@@ -9,6 +12,8 @@ from crud.listener import get_listener_by_user_id
 from crud.artist import get_artist_by_user_id
 from models.song import SongInput
 from crud.song import create_song
+from crud.question import submit_question
+from models.question import QuestionInput
 
 def random_lower_string() -> str:
     return "".join(random.choices(string.ascii_lowercase, k=10))
@@ -66,6 +71,16 @@ def get_session():
 def get_client():
     return TestClient(app)
 
+# Fail if the block runs more SQL statements than the budget (listing them), to catch N+1 queries.
+# The requests made with the test client inside the block are counted too.
+@contextmanager
+def assert_max_queries(budget: int):
+    with track_sql(record=True) as stats:
+        yield stats
+    if stats.statements > budget:
+        statements = "\n".join(f"  {i + 1}. {' '.join(statement.split())}" for i, statement in enumerate(stats.log))
+        raise AssertionError(f"{stats.statements} SQL statements (budget {budget}):\n{statements}")
+
 def create_artist(db, name="artist"):
     user_input = UserInput(email=f"{name}@{name}.com", username=name, password=name, role=RoleEnum.artist)
     user = create_user(db, user_input)
@@ -104,4 +119,10 @@ def create_random_song(db, artist_name, genre=None, title=None, release_date=Non
         "release_date": release_date or "2024-11-26",
         "artist_name": artist_name
     }
-    return create_song(db, SongInput(**song_data))
\ No newline at end of file
+    return create_song(db, SongInput(**song_data))
+
+def ask_question(db, listener, artist, question_text="Question?"):
+    # Questions of test data, whatever the loyalty of the listener (the gate is tested in test_loyalty_gate)
+    with patch("crud.question.QUESTION_LOYALTY_GATE", False):
+        return submit_question(db, listener, QuestionInput(artist_username=artist.user.username,
+                                                           question_text=question_text))
@@ -3,10 +3,21 @@ import axios from './baseAxiosClient';
 import UserService from './user'
 
 class SongService {
+    // The song listings are paginated: follow the X-Next-Cursor header until the last page
+    async getAllPages(url) {
+        const songs = [];
+        let cursor = null;
+        do {
+            const config = UserService.getConfig();
+            const response = await axios.get(url, { ...config, params: cursor ? { cursor } : {} });
+            songs.push(...response.data);
+            cursor = response.headers['x-next-cursor'];
+        } while (cursor);
+        return songs;
+    }
     async getAll() {
         try {
-            const response = await axios.get('/songs/', UserService.getConfig());
-            return response.data;
+            return await this.getAllPages('/songs/');
         } catch (error) {
             throw error;
         }
@@ -21,16 +32,14 @@ class SongService {
     }
     async getSortedAlphabetically(){
         try {
-            const response = await axios.get('/songs/sorted/alphabetically', UserService.getConfig());
-            return response.data;
+            return await this.getAllPages('/songs/sorted/alphabetically');
         } catch (error) {
             throw error;
         }
     }
     async getSortedReleaseDate(){
         try {
-            const response = await axios.get('/songs/sorted/release_date', UserService.getConfig());
-            return response.data;
+            return await this.getAllPages('/songs/sorted/release_date');
         } catch (error) {
             throw error;
         }